@@ -0,0 +1,128 @@
+"""
+Hyetograph atlas: the same figures as rain.plot_hyeto_by_year() and rain.plot_hyeto_by_month(), for one or more rain
+gages, rendered in parallel.
+
+Storms are grouped by year and month once (see rain.group_storms()) and all storms in a figure are drawn as a single
+line collection. Figures are rendered by a pool of worker processes using matplotlib's Agg backend (no display
+needed), every worker loads the rain files (from the cache, see cache.py) and the design storm once. Figures are saved
+as <out>/<gage>/<year>.pdf and <out>/<gage>/<month>.pdf, where gage is the name of the rain file.
+"""
+import argparse
+import multiprocessing
+import os
+from calendar import month_name
+import numpy as np
+
+from cache import load_storms
+from rain import load_design_storm, group_storms, max_rain_rainfall
+
+_storms = None  # StormTable for each rain file for worker processes
+_design = None  # design storm x and y for worker processes
+_pyplot = None  # matplotlib.pyplot for worker processes
+
+
+def _init_worker(rainfiles, design_file):
+    global _storms, _design, _pyplot
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot
+    _pyplot = pyplot
+    _storms = [load_storms(rainfile) for rainfile in rainfiles]
+    _design = load_design_storm(design_file)
+
+
+def segments(storms, indexes):
+    """
+    :param storms: StormTable object
+    :param indexes: array of storm indexes
+    :return: list of (points, 2) arrays of cumulative time and rainfall, one for each storm, for a LineCollection
+    """
+    storms = storms.take(indexes)
+    points = np.column_stack((storms.times, storms.rains))
+    return np.split(points, storms.offsets[1:-1])
+
+
+def render(task):
+    """
+    Render one figure, runs in worker processes
+    :param task: (index of rain file, title, array of storm indexes, greatest storm rainfall, file name)
+    :return: file name
+    """
+    from matplotlib.collections import LineCollection
+
+    gage, title, indexes, max_rain, filename = task
+    figure = _pyplot.figure()
+    ax = figure.gca()
+    colors = _pyplot.rcParams['axes.prop_cycle'].by_key()['color']
+    ax.add_collection(LineCollection(segments(_storms[gage], indexes), colors=colors))
+
+    # add design storm
+    design_x, design_y = _design
+    ax.plot(design_x, design_y, color='red', linewidth=2)
+    ax.annotate('2-Yr Design\nStorm', xy=(design_x[-1], design_y[-1]+0.05))
+
+    # set axis
+    ax.autoscale_view()
+    x1, x2, _, _ = ax.axis()
+    ax.axis((x1, x2, 0, max_rain))
+
+    ax.set_title(title)
+    ax.set_xlabel('Time since start of storm (minutes)')
+    ax.set_ylabel('Cumulative rainfall (inches)')
+    figure.savefig(filename)
+    _pyplot.close(figure)
+    return filename
+
+
+def atlas_tasks(rainfiles, out, by_year=True, by_month=True, start_month=4, end_month=10):
+    """
+    :param rainfiles: list of csv files of storm events
+    :param out: folder to save figures in, a folder is made for each rain file
+    :return: list of tasks for render()
+    """
+    tasks = []
+    for gage, rainfile in enumerate(rainfiles):
+        storms = load_storms(rainfile)
+        max_rain = max_rain_rainfall(storms)
+        folder = os.path.join(out, os.path.splitext(os.path.basename(rainfile))[0])
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        groups = []
+        if by_year:
+            for year, indexes in group_storms(storms, storms.year):
+                groups.append((str(year), indexes))
+        if by_month:
+            for month, indexes in group_storms(storms, storms.month):
+                if start_month <= month <= end_month:
+                    groups.append((month_name[month], indexes))
+
+        for name, indexes in groups:
+            total_rain = sum(storms.total_rain[indexes].tolist())
+            title = '{}, # of Storms = {}, Cumulative Rainfall (in) = {}'.format(name, len(indexes), total_rain)
+            tasks.append((gage, title, indexes, max_rain, os.path.join(folder, name + '.pdf')))
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('rain', nargs='*', default=['csv/more_rain2.csv'],
+                        help='rain files, one for each gage (default: csv/more_rain2.csv)')
+    parser.add_argument('--design', default='csv/2-Year Design Storm.csv', help='design storm (default: %(default)s)')
+    parser.add_argument('--out', default='atlas', help='folder to save figures in (default: %(default)s)')
+    parser.add_argument('--by', choices=['year', 'month', 'both'], default='both', help='figures to make')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per cpu)')
+    args = parser.parse_args()
+
+    tasks = atlas_tasks(args.rain, args.out, args.by in ('year', 'both'), args.by in ('month', 'both'))
+    pool = multiprocessing.Pool(args.processes, _init_worker, (args.rain, args.design))
+    try:
+        for filename in pool.imap_unordered(render, tasks):
+            print filename
+    finally:
+        pool.close()
+        pool.join()
+    print len(tasks), 'figures'
+
+if __name__ == '__main__':
+    main()
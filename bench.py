@@ -0,0 +1,202 @@
+"""
+Benchmarks for the runoff pipeline on synthetic data.
+
+Synthetic rain files are written in the project format (same 16 columns as csv/more_rain2.csv) and subcatchment
+files in the layout of csv/hlc_sc_combined.csv. Every size (years of record x number of subcatchments) runs in its own
+process. Each stage is timed and the peak memory (max resident set size) after each stage is recorded. Results are
+printed and written as json so runs can be compared with --compare.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+from cache import load_storms
+from instrument import peak_memory
+from my_cuhp import RunOff, BatchRunOff, adjust_volume
+from rain import import_storms
+from stats import Stats
+from subcatch import import_params
+from writer import write_csv, write_binary
+
+RAIN_HEADER = 'Date,Time,inches,inches,Raw,Alarm,Date,Time,Date/Time,Storm,Storm Start,Inc. Time,Total Time,' \
+              'Time (Min.),Time(Min.),Precip.(In)'
+STORM_BREAK = ',,,,,,,,,,,,,,0.00,0'
+TIP = 0.04  # rain gage bucket size (inches)
+EXCEL_EPOCH = datetime(1899, 12, 30)
+DEFAULT_SIZES = ((18, 26), (18, 500), (50, 1000), (100, 5000))
+
+
+def write_rain(filename, years, storms_per_year=22, first_year=1998, seed=0):
+    """
+    Write synthetic storms in the project format, storms are spread over april - september of each year
+    :param filename: name of file to write
+    :param years: number of years of record
+    :param storms_per_year: storms in each year
+    :param first_year: first year of record
+    :param seed: random seed
+    :return: number of storms written
+    """
+    rng = np.random.RandomState(seed)
+    season = (datetime(2001, 10, 1) - datetime(2001, 4, 1)).days * 86400
+    gage = 0.0  # cumulative gage reading
+    raw = 0  # gage tip count
+    storms = 0
+    with open(filename, 'wt') as outfile:
+        outfile.write(RAIN_HEADER + '\n')
+        for year in range(first_year, first_year + years):
+            # storm starts, at least a day apart
+            starts = np.sort(rng.choice(season // 86400 - 2, storms_per_year, replace=False)) * 86400
+            starts += rng.randint(0, 86400 // 2, storms_per_year)
+            for start in starts.tolist():
+                tips = min(int(rng.geometric(0.12)), 55)
+                gaps = np.concatenate([[0.0], np.cumsum(rng.exponential(8.0*60, tips - 1))])  # secs since first tip
+                rain = TIP * rng.randint(1, 4, tips)
+                storm_start = datetime(year, 4, 1) + timedelta(seconds=start)
+
+                outfile.write(STORM_BREAK + '\n')
+                total = 0.0
+                for i in range(tips):
+                    tip_time = storm_start + timedelta(seconds=int(gaps[i]))
+                    serial = (tip_time - EXCEL_EPOCH).total_seconds() / 86400.0
+                    elapsed = (int(gaps[i]) - (int(gaps[i-1]) if i else 0)) / 86400.0
+                    total += rain[i]
+                    gage += rain[i]
+                    raw += 1
+                    minutes = int(gaps[i]) / 60.0
+                    fields = ['{}/{}/{}'.format(tip_time.month, tip_time.day, tip_time.year),
+                              '{}:{:02d}:{:02d}'.format(tip_time.hour, tip_time.minute, tip_time.second),
+                              str(round(gage, 2)), str(round(rain[i], 2)), str(raw), '',
+                              str(int(serial)), '%.6f' % (serial % 1), '%.3f' % serial, '%.5f' % serial,
+                              '1' if i == 0 else '', '%.9f' % elapsed if i else '0', '%.9f' % (int(gaps[i]) / 86400.0),
+                              '%.2f' % minutes, '%.2f' % (minutes + 5.0), str(round(total, 2))]
+                    outfile.write(','.join(fields) + '\n')
+                storms += 1
+    return storms
+
+
+def write_params(filename, catchments, seed=0):
+    """
+    Write synthetic subcatchment parameters in the layout of csv/hlc_sc_combined.csv
+    :param filename: name of file to write
+    :param catchments: number of subcatchments
+    :param seed: random seed
+    """
+    rng = np.random.RandomState(seed)
+    with open(filename, 'wt') as outfile:
+        for i in range(catchments):
+            name = 'SC' + str(i)
+            horton_init = rng.uniform(3.0, 4.5)
+            fields = [name, name, '', str(rng.uniform(0.02, 0.5)), '', '', '', str(rng.uniform(2.0, 90.0)), '0.35',
+                      '0.1', str(horton_init), '0.0018', str(horton_init * rng.uniform(0.13, 0.16))]
+            outfile.write(','.join(fields) + '\n')
+
+
+def run_size(years, catchments, max_csv_rows, max_legacy_pairs):
+    """
+    Generate data and time every stage for one size, runs in its own process
+    :return: dict of results
+    """
+    folder = tempfile.mkdtemp()
+    stages = []
+
+    def stage(name, function, rows):
+        start = time.time()
+        value = function()
+        stages.append({'stage': name, 'seconds': time.time() - start, 'rows': rows, 'peak_mb': peak_memory()})
+        return value
+
+    try:
+        rainfile = os.path.join(folder, 'rain.csv')
+        paramfile = os.path.join(folder, 'params.csv')
+        adjust_file = os.path.join(folder, 'adjust.csv')
+        n_storms = write_rain(rainfile, years)
+        write_params(paramfile, catchments)
+        with open(adjust_file, 'wt') as outfile:
+            for i in range(catchments):
+                outfile.write('SC{},0.5\n'.format(i))
+        pairs = n_storms * catchments
+
+        storms = stage('import_storms', lambda: import_storms(rainfile), n_storms)
+        stage('load_storms_cold', lambda: load_storms(rainfile), n_storms)
+        stage('load_storms_warm', lambda: load_storms(rainfile), n_storms)
+        subcatches = stage('import_params', lambda: import_params(paramfile), catchments)
+        if pairs <= max_legacy_pairs:
+            stage('runoff_objects', lambda: [RunOff(storm, sc) for sc in subcatches for storm in storms], pairs)
+        results = stage('batch_runoff', lambda: BatchRunOff(storms, subcatches), pairs)
+        stage('adjust_volume', lambda: adjust_volume(results, adjust_file), pairs)
+        stage('stats', lambda: Stats(results), pairs)
+        if pairs <= max_csv_rows:
+            with open(os.path.join(folder, 'out.csv'), 'wt') as outfile:
+                stage('write_csv', lambda: write_csv(results, outfile), pairs)
+        stage('write_binary', lambda: write_binary(results, os.path.join(folder, 'out.bin')), pairs)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return {'years': years, 'catchments': catchments, 'storms': n_storms, 'pairs': pairs, 'stages': stages}
+
+
+def compare(results, previous):
+    """
+    Print time of each stage relative to a previous run
+    :param results: list of results from run_size()
+    :param previous: list of results from a previous run
+    """
+    old = {}
+    for size in previous:
+        for stage in size['stages']:
+            old[(size['years'], size['catchments'], stage['stage'])] = stage['seconds']
+    print 'years,catchments,stage,seconds,previous_seconds,ratio'
+    for size in results:
+        for stage in size['stages']:
+            key = (size['years'], size['catchments'], stage['stage'])
+            if key in old:
+                ratio = stage['seconds'] / old[key] if old[key] else float('inf')
+                print '{},{},{},{:.4f},{:.4f},{:.2f}'.format(key[0], key[1], key[2], stage['seconds'], old[key], ratio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', help='comma separated YEARSxCATCHMENTS, e.g. 18x26,100x5000 (default: {})'.format(
+        ','.join('{}x{}'.format(*size) for size in DEFAULT_SIZES)))
+    parser.add_argument('--out', default='bench_results.json', help='json results file (default: %(default)s)')
+    parser.add_argument('--compare', help='json results of a previous run to compare with')
+    parser.add_argument('--max-csv-rows', type=int, default=2000000, help='skip csv output above this many rows')
+    parser.add_argument('--max-legacy-pairs', type=int, default=200000,
+                        help='skip the RunOff object loop above this many storm/subcatchment pairs')
+    args = parser.parse_args()
+
+    sizes = DEFAULT_SIZES
+    if args.sizes:
+        sizes = [tuple(int(value) for value in size.split('x')) for size in args.sizes.split(',')]
+
+    results = []
+    print 'years,catchments,storms,stage,seconds,rows,peak_mb'
+    for years, catchments in sizes:
+        # new process for every size so memory peaks don't carry over
+        pool = multiprocessing.Pool(1)
+        try:
+            result = pool.apply(run_size, (years, catchments, args.max_csv_rows, args.max_legacy_pairs))
+        finally:
+            pool.close()
+            pool.join()
+        results.append(result)
+        for stage in result['stages']:
+            print '{},{},{},{},{:.4f},{},{}'.format(years, catchments, result['storms'], stage['stage'],
+                                                    stage['seconds'], stage['rows'], stage['peak_mb'])
+
+    with open(args.out, 'wt') as outfile:
+        json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                   'time': datetime.now().isoformat(), 'results': results}, outfile, indent=1)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            compare(results, json.load(infile)['results'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Cache of parsed input files. Parsed arrays are saved in a binary file next to the csv (e.g. more_rain2.csv.cache) and
+are memory mapped on later runs instead of parsing the csv again. The cache is rebuilt if the csv's path, size or
+contents (sha1) change.
+
+Array file format: a magic line, a one line json header, then the raw arrays, each starting on a 64 byte boundary
+"""
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+from instrument import stage, count
+from rain import import_storms, StormTable
+from subcatch import load_param_table, Subcatchment
+
+MAGIC = 'CUHPARRAYS1\n'
+ALIGN = 64
+VERSION = 2  # changed when the arrays saved for a file change, older cache files are rebuilt
+STORM_ARRAYS = ('start', 'total_rain', 'length', 'offsets', 'times', 'rains', 'ids')
+PARAMS = ('area', 'imperv', 'depress_stor_perv', 'depress_stor_imperv', 'horton_init', 'horton_decay', 'horton_final')
+
+
+def save_arrays(filename, arrays, meta=None):
+    """
+    Save arrays to filename in a memory mappable format
+    :param filename: name of file to write
+    :param arrays: list of (name, numpy array) tuples
+    :param meta: dict of extra info to store in the header, must be json-able
+    """
+    layout = []
+    offset = 0
+    for name, array in arrays:
+        array = np.ascontiguousarray(array)
+        layout.append([name, array.dtype.str, list(array.shape), offset])
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    header = MAGIC + json.dumps({'meta': meta or {}, 'arrays': layout}) + '\n'
+    data_start = -(-len(header) // ALIGN) * ALIGN
+
+    # Write to a temp file first so a half written file is never read. The temp file is unique to the process and
+    # thread, writers of the same file at the same time (e.g. pool workers on a cold cache) each rename a whole file
+    temp_name = '{}.{}.{}.tmp'.format(filename, os.getpid(), threading.current_thread().ident)
+    with open(temp_name, 'wb') as outfile:
+        outfile.write(header)
+        for (name, array), (_, _, _, offset) in zip(arrays, layout):
+            outfile.seek(data_start + offset)
+            outfile.write(np.ascontiguousarray(array).tostring())
+    if os.name == 'nt' and os.path.exists(filename):
+        os.remove(filename)  # rename doesn't replace on windows, elsewhere it replaces in one step
+    os.rename(temp_name, filename)
+
+
+def load_arrays(filename, mode='r'):
+    """
+    Load arrays saved with save_arrays(). Arrays are memory mapped, not read
+    :param filename: name of file to read
+    :param mode: memory map mode, 'r' for read only, 'c' for copy on write
+    :return: meta dict, dict of numpy arrays
+    """
+    with open(filename, 'rb') as infile:
+        if infile.readline() != MAGIC:
+            raise ValueError(filename + ' is not an array file')
+        header_line = infile.readline()
+    header = json.loads(header_line)
+    data_start = -(-(len(MAGIC) + len(header_line)) // ALIGN) * ALIGN
+
+    arrays = {}
+    for name, dtype, shape, offset in header['arrays']:
+        if np.prod(shape) == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(filename, dtype=dtype, mode=mode, offset=data_start + offset, shape=tuple(shape))
+    return header['meta'], arrays
+
+
+def file_key(filename):
+    """
+    :return: dict identifying path, size and contents of filename
+    """
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), ''):
+            sha1.update(block)
+    return {'path': os.path.abspath(filename), 'size': os.path.getsize(filename), 'sha1': sha1.hexdigest()}
+
+
+def _cached(filename, parse):
+    """
+    Return arrays for filename from the cache, or parse and cache them if the cache is missing or out of date
+    :param filename: csv file
+    :param parse: function that parses filename and returns list of (name, array)
+    :return: dict of arrays
+    """
+    cache_name = filename + '.cache'
+    key = dict(file_key(filename), version=VERSION)
+    if os.path.exists(cache_name):
+        try:
+            meta, arrays = load_arrays(cache_name)
+            if meta == key:
+                count('cache_hits')
+                return arrays
+        except ValueError:
+            pass  # damaged cache file, rebuild
+
+    count('cache_misses')
+    arrays = parse(filename)
+    try:
+        save_arrays(cache_name, arrays, key)
+    except (IOError, OSError):
+        pass  # can't write next to the csv, run without the cache
+    return dict(arrays)
+
+
+def load_storms(filename):
+    """
+    Same as rain.import_storms() but uses the cache
+    :param filename: csv file of storm events
+    :return: StormTable object
+    """
+    def parse(filename):
+        storms = import_storms(filename)
+        return [(name, getattr(storms, name)) for name in STORM_ARRAYS]
+
+    with stage('load_storms') as s:
+        arrays = _cached(filename, parse)
+        storms = StormTable(*[arrays[name] for name in STORM_ARRAYS])
+        s.rows = len(storms)
+    return storms
+
+
+def load_params(filename):
+    """
+    Same as subcatch.import_params() but uses the cache
+    :param filename: csv file of subcatchment parameters
+    :return: list of Subcatchment objects
+    """
+    def parse(filename):
+        table = load_param_table(filename)
+        values = np.column_stack([table[param] for param in PARAMS]) if len(table) else np.zeros((0, len(PARAMS)))
+        return [('names', table.name), ('values', values)]
+
+    with stage('load_params') as s:
+        arrays = _cached(filename, parse)
+        subcatches = []
+        for name, values in zip(arrays['names'].tolist(), arrays['values'].tolist()):
+            subcatches.append(Subcatchment.from_values(name, *values))
+        s.rows = len(subcatches)
+    return subcatches
+
+
+def main():
+    for filename in ['csv/more_rain2.csv']:
+        storms = load_storms(filename)
+        print filename, len(storms), 'storms'
+    for filename in ['csv/hlc_sc_combined.csv', 'csv/hlc_subcatch.csv']:
+        subcatches = load_params(filename)
+        print filename, len(subcatches), 'subcatchments'
+
+if __name__ == '__main__':
+    main()
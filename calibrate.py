@@ -0,0 +1,185 @@
+"""
+Calibrate runoff correction factors (adjust.csv, see my_cuhp.adjust_volume()) against CUHP runoff volumes.
+
+The reference file is a csv of CUHP volumes in "sc_name,storm_id,volume" format (ac-ft), storm ids are the same as
+RainEvent.id, e.g. '4/21/1998-13:58:26'. A header is ignored if present. For each subcatchment the correction factor
+is the least squares fit of RunOff volumes to the CUHP volumes. Optionally hortons and depression storage parameters
+are fitted as well with a pattern search, every candidate parameter set is a full runoff calculation over the storm
+record so candidates are evaluated in a pool of processes.
+"""
+import argparse
+import copy
+import math
+import multiprocessing
+import numpy as np
+
+from cache import load_storms
+from my_cuhp import BatchRunOff, SteppedRunOff, import_factors
+from subcatch import import_params, export_params
+
+FIT_PARAMS = ('depress_stor_perv', 'depress_stor_imperv', 'horton_init', 'horton_decay', 'horton_final')
+
+_storms = None  # StormTable for worker processes
+_runoff_class = None  # BatchRunOff or SteppedRunOff for worker processes
+
+
+def import_reference(filename):
+    """
+    Import CUHP reference volumes
+    :param filename: csv file in "sc_name,storm_id,volume" format
+    :return: dict, keys are subcatchment names, values are lists of (storm_id, volume) tuples
+    """
+    reference = {}
+    with open(filename, 'rt') as infile:
+        for line in infile:
+            fields = line.strip().split(',')
+            try:
+                volume = float(fields[2])
+            except (IndexError, ValueError):
+                continue  # header or blank line
+            reference.setdefault(fields[0], []).append((fields[1], volume))
+    return reference
+
+
+def _init_worker(rainfile, mode):
+    global _storms, _runoff_class
+    _storms = load_storms(rainfile)
+    _runoff_class = SteppedRunOff if mode == 'stepped' else BatchRunOff
+
+
+def evaluate(task):
+    """
+    Objective function, runs in worker processes
+    :param task: (Subcatchment object, array of storm indexes, array of CUHP volumes)
+    :return: sum of squared errors after applying the best correction factor, correction factor
+    """
+    sc, storm_index, volumes = task
+    if sc.horton_init < sc.horton_final:
+        return float('inf'), 1.0
+    runoff = _runoff_class(_storms, [sc]).runoff[0, storm_index]
+    sum_squares = np.dot(runoff, runoff)
+    if sum_squares == 0.0:
+        return float(np.dot(volumes, volumes)), 1.0
+    factor = np.dot(runoff, volumes) / sum_squares
+    error = factor*runoff - volumes
+    return float(np.dot(error, error)), float(factor)
+
+
+def _moved(sc, param, multiplier):
+    """ :return: copy of Subcatchment sc with param multiplied by multiplier """
+    new_sc = copy.copy(sc)
+    setattr(new_sc, param, getattr(sc, param) * multiplier)
+    return new_sc
+
+
+def calibrate(pool, storms, subcatches, reference, fit_params=False, step=0.5, min_step=0.01, max_iter=50):
+    """
+    Fit correction factors, and optionally parameters, for all subcatchments in reference
+    :param pool: multiprocessing.Pool with workers set up by _init_worker()
+    :param storms: StormTable object
+    :param subcatches: list of Subcatchment objects
+    :param reference: CUHP volumes, see import_reference()
+    :param fit_params: fit FIT_PARAMS as well as correction factors
+    :param step: starting pattern search step, as a change in log(parameter)
+    :param min_step: pattern search stops when step is smaller than this
+    :param max_iter: max pattern search iterations
+    :return: dict of correction factors and dict of fitted Subcatchment objects, keys are subcatchment names
+    """
+    index = dict((storm.id, j) for j, storm in enumerate(storms))
+
+    # storms and volumes to fit for each subcatchment
+    targets = {}
+    for sc in subcatches:
+        if sc.name not in reference:
+            continue
+        missing = [storm_id for storm_id, _ in reference[sc.name] if storm_id not in index]
+        if missing:
+            raise ValueError('storms not in rain data for ' + sc.name + ': ' + ', '.join(missing))
+        storm_index = np.array([index[storm_id] for storm_id, _ in reference[sc.name]], dtype=int)
+        volumes = np.array([volume for _, volume in reference[sc.name]], dtype=float)
+        targets[sc.name] = (storm_index, volumes)
+
+    best = dict((sc.name, sc) for sc in subcatches if sc.name in targets)
+    names = sorted(best)
+    results = pool.map(evaluate, [(best[name],) + targets[name] for name in names])
+    scores = dict(zip(names, results))
+
+    if fit_params:
+        steps = dict((name, step) for name in names)
+        for _ in range(max_iter):
+            active = [name for name in names if steps[name] >= min_step]
+            if not active:
+                break
+
+            # try a step up and down for each parameter of every active subcatchment
+            candidates = []
+            for name in active:
+                for param in FIT_PARAMS:
+                    for direction in (1.0, -1.0):
+                        candidates.append((name, _moved(best[name], param, math.exp(direction*steps[name]))))
+            results = pool.map(evaluate, [(sc,) + targets[name] for name, sc in candidates])
+
+            improved = set()
+            for (name, sc), result in zip(candidates, results):
+                if result[0] < scores[name][0]:
+                    best[name], scores[name] = sc, result
+                    improved.add(name)
+            for name in active:
+                if name not in improved:
+                    steps[name] /= 2.0
+
+    factors = dict((name, scores[name][1]) for name in names)
+    return factors, best
+
+
+def export_factors(factors, filename):
+    """
+    Write correction factors in "sc_name,adjust_factor" format, see my_cuhp.adjust_volume()
+    :param factors: list of (sc_name, factor) tuples
+    :param filename: name of file to write
+    """
+    with open(filename, 'wt') as outfile:
+        for name, factor in factors:
+            outfile.write(name + ',' + str(factor) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('reference', help='csv of CUHP volumes, "sc_name,storm_id,volume"')
+    parser.add_argument('--rain', default='csv/more_rain2.csv', help='rain file (default: %(default)s)')
+    parser.add_argument('--params', default='csv/hlc_sc_combined.csv', help='subcatchment file (default: %(default)s)')
+    parser.add_argument('--adjust', default='csv/adjust.csv',
+                        help='current factors, kept for subcatchments not in reference (default: %(default)s)')
+    parser.add_argument('--out', default='csv/adjust_calibrated.csv', help='new factors file (default: %(default)s)')
+    parser.add_argument('--fit-params', action='store_true', help='fit hortons and depression storage parameters')
+    parser.add_argument('--params-out', default='csv/calibrated_params.csv',
+                        help='fitted subcatchment file for --fit-params (default: %(default)s)')
+    parser.add_argument('--mode', choices=['lumped', 'stepped'], default='lumped', help='see my_cuhp.py')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per cpu)')
+    args = parser.parse_args()
+
+    storms = load_storms(args.rain)
+    subcatches = import_params(args.params, keep_fields=True)
+    reference = import_reference(args.reference)
+    old_factors = import_factors(args.adjust)
+
+    pool = multiprocessing.Pool(args.processes, _init_worker, (args.rain, args.mode))
+    try:
+        factors, fitted = calibrate(pool, storms, subcatches, reference, args.fit_params)
+    finally:
+        pool.close()
+        pool.join()
+
+    print 'subcatch_id,old_factor,new_factor'
+    new_factors = []
+    for sc in subcatches:
+        factor = factors.get(sc.name, old_factors.get(sc.name, 1.0))
+        new_factors.append((sc.name, factor))
+        print sc.name + ',' + str(old_factors.get(sc.name)) + ',' + str(factor)
+    export_factors(new_factors, args.out)
+
+    if args.fit_params:
+        export_params([fitted.get(sc.name, sc) for sc in subcatches], args.params_out)
+
+if __name__ == '__main__':
+    main()
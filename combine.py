@@ -0,0 +1,136 @@
+"""
+Combine subcatchments into larger ones, the same way csv/hlc_sc_combined.csv was built from csv/hlc_subcatch.csv.
+
+The grouping spec is a csv in "group,member" format, header ignored if present. A member can be a subcatchment name or
+a range of names in parameter file order, e.g. every subcatchment from WQ117 to WQ124:
+
+    WQ117 - WQ124,WQ117 - WQ124
+    north,WQ110
+    north,WQ111
+
+Subcatchments not in any group are kept as they are. Combined area is the total area of the members, every other
+parameter (imperv, depression storage and hortons) is the area weighted average of the members. Groups are in order of
+their first member. All groups are combined at once with bincount over the parameter table.
+
+Runoff of each combined subcatchment can be compared with the total runoff of its members over the storm record
+(without correction factors).
+"""
+import argparse
+from collections import OrderedDict
+import numpy as np
+
+from cache import load_storms
+from subcatch import load_param_table, subcatchments, export_params, PARAM_COLUMNS
+from threshold import ThresholdRunOff, ThresholdIndex
+
+
+def import_spec(filename):
+    """
+    :param filename: csv file in "group,member" format
+    :return: OrderedDict, keys are group names, values are lists of members as written, see group_index()
+    """
+    spec = OrderedDict()
+    with open(filename, 'rt') as infile:
+        for line in infile:
+            fields = [field.strip() for field in line.split(',')]
+            if len(fields) < 2 or fields[0] in ('', 'group'):
+                continue  # header or blank line
+            group, member = fields[:2]
+            spec.setdefault(group, []).append(member)
+    return spec
+
+
+def group_index(names, spec):
+    """
+    :param names: list of subcatchment names in parameter table order
+    :param spec: grouping spec, see import_spec(). A member is a subcatchment name, or if there is no subcatchment
+        with that name a range "first - last" (names written by combine() can have " - " in them)
+    :return: list of group names, array with the index in group names of every subcatchment
+    """
+    position = dict((name, i) for i, name in enumerate(names))
+
+    def find(name):
+        if name not in position:
+            raise ValueError('unknown subcatchment ' + name)
+        return position[name]
+
+    group = np.full(len(names), -1, dtype=int)
+    for g, members in enumerate(spec.values()):
+        for member in members:
+            if member not in position and ' - ' in member:
+                first, last = [name.strip() for name in member.split(' - ', 1)]
+                rows = np.arange(find(first), find(last) + 1)
+            else:
+                rows = np.array([find(member)])
+            taken = rows[(group[rows] != -1) & (group[rows] != g)]
+            if len(taken):
+                raise ValueError('{} is in more than one group'.format(names[taken[0]]))
+            group[rows] = g
+
+    # subcatchments not in a group are their own group, groups are ordered by their first member
+    keys = np.where(group == -1, len(spec) + np.arange(len(names)), group)
+    _, first, index = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty(len(order), dtype=int)
+    rank[order] = np.arange(len(order))
+    spec_names = list(spec.keys())
+    group_names = []
+    for i in first[order].tolist():
+        group_names.append(spec_names[group[i]] if group[i] != -1 else names[i])
+    return group_names, rank[index]
+
+
+def combine(table, spec):
+    """
+    :param table: record array of subcatchment parameters, see subcatch.load_param_table()
+    :param spec: grouping spec, see import_spec()
+    :return: record array of combined subcatchment parameters, array with the row in it of every subcatchment in table
+    """
+    group_names, index = group_index(table.name.tolist(), spec)
+    n = len(group_names)
+    area = np.bincount(index, table.area, minlength=n)
+    arrays = [np.array(group_names, dtype='S{}'.format(max([len(name) for name in group_names] + [1]))), area]
+    for _, attr in PARAM_COLUMNS[1:]:
+        arrays.append(np.bincount(index, table.area * table[attr], minlength=n) / area)
+    return np.rec.fromarrays(arrays, names=table.dtype.names), index
+
+
+def compare(storms, table, combined, index):
+    """
+    Print total runoff (ac-ft) over the storm record of each combined subcatchment and the total of its members in
+    csv format with header
+    :param storms: StormTable object
+    :param table: record array of subcatchment parameters
+    :param combined: record array of combined subcatchment parameters from combine()
+    :param index: row in combined of every subcatchment in table, from combine()
+    """
+    storm_index = ThresholdIndex(storms)
+    member_runoff = ThresholdRunOff(storms, subcatchments(table), storm_index).runoff.sum(axis=1)
+    combined_runoff = ThresholdRunOff(storms, subcatchments(combined), storm_index).runoff.sum(axis=1)
+    members = np.bincount(index, minlength=len(combined))
+    member_total = np.bincount(index, member_runoff, minlength=len(combined))
+
+    print 'subcatch_id,members,area,combined_runoff,member_runoff,difference,percent_difference'
+    for name, count, area, runoff, total in zip(combined.name.tolist(), members.tolist(), combined.area.tolist(),
+                                                combined_runoff.tolist(), member_total.tolist()):
+        difference = runoff - total
+        percent = 100.0 * difference / total if total else 0.0
+        print '{},{},{},{},{},{},{}'.format(name, count, area, runoff, total, difference, percent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('spec', help='csv of "group,member" lines')
+    parser.add_argument('--params', default='csv/hlc_subcatch.csv', help='subcatchment file (default: %(default)s)')
+    parser.add_argument('--rain', default='csv/more_rain2.csv', help='rain file (default: %(default)s)')
+    parser.add_argument('--out', help='write combined subcatchment parameters to OUT in CUHP column order')
+    args = parser.parse_args()
+
+    table = load_param_table(args.params)
+    combined, index = combine(table, import_spec(args.spec))
+    if args.out:
+        export_params(subcatchments(combined), args.out)
+    compare(load_storms(args.rain), table, combined, index)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Continuous simulation: instead of every storm starting with full infiltration capacity and empty depression storage,
+storms are run in order and the state of every subcatchment is carried from one storm to the next.
+
+Within a storm runoff is stepped through the hyetograph, the same as SteppedRunOff (see horton.py). Between storms,
+for the dry time from the end of one storm to the start of the next:
+
+    - infiltration capacity recovers towards horton_init. The used part of the capacity, horton_init minus the
+      capacity at the end of the storm, decays as exp(-kd*t) where kd = -ln(0.02)/dry_days, so fully used soil has
+      recovered 98% of its capacity after dry_days (the same as SWMM's drying time). The next storm starts at the time
+      on the hortons curve with the recovered capacity.
+    - impervious depression storage evaporates at evap (in/day). Pervious depression storage evaporates and
+      infiltrates at horton_final.
+
+The first storm starts with full capacity and empty storage. The rain file is read a block of storms at a time and
+the state is arrays with one value per subcatchment, so memory doesn't grow with the length of the record. Storms
+must be in order of start.
+"""
+import argparse
+import numpy as np
+
+from cache import load_params
+from horton import intervals, step_storms
+from incremental import month_totals
+from instrument import stage
+from my_cuhp import BatchRunOff, sc_areas, sc_column, import_factors
+from rain import iter_storm_tables
+from stats import Stats
+
+SEC_PER_DAY = 24.0*60.0*60.0
+
+
+class ContinuousState(object):
+    def __init__(self, subcatches, dry_days=7.0, evap=0.1):
+        """
+        Infiltration and depression storage state of every subcatchment between storms, all arrays have shape
+        (number of subcatchments, 1)
+        :param subcatches: list of Subcatchment objects
+        :param dry_days: days for fully used infiltration capacity to recover 98%
+        :param evap: evaporation rate (in/day)
+        """
+        self.f0 = sc_column(subcatches, 'horton_init')
+        self.k = sc_column(subcatches, 'horton_decay')
+        self.fc = sc_column(subcatches, 'horton_final')
+        self.depress_stor_perv = sc_column(subcatches, 'depress_stor_perv')
+        self.depress_stor_imperv = sc_column(subcatches, 'depress_stor_imperv')
+        self.kd = -np.log(0.02) / (dry_days*SEC_PER_DAY)  # 1/sec
+        self.evap = evap / SEC_PER_DAY  # in/sec
+
+        shape = (len(subcatches), 1)
+        self.t_start = np.zeros(shape)  # time on the hortons curve at the start of the next storm (hrs)
+        self.perv_store = np.zeros(shape)  # water in pervious depression storage (inches)
+        self.imp_store = np.zeros(shape)  # water in impervious depression storage (inches)
+        self.last_start = None  # start of the last storm in seconds since 1/1/1970
+        self.last_end = None  # end of the last storm in seconds since 1/1/1970
+
+    def dry(self, start):
+        """
+        Recover infiltration capacity and drain depression storage from the end of the last storm to start
+        :param start: start of the next storm in seconds since 1/1/1970
+        """
+        if self.last_end is None:
+            return
+        seconds = max(start - self.last_end, 0.0)
+
+        # used fraction of (f0 - fc) at the end of the storm is 1 - exp(-k*t), it decays with the dry time
+        k_hr = self.k*(60.0*60.0)
+        used = (1.0 - np.exp(-k_hr*self.t_start)) * np.exp(-self.kd*seconds)
+        with np.errstate(divide='ignore'):
+            self.t_start = np.where(k_hr > 0.0, -np.log1p(-used) / np.where(k_hr > 0.0, k_hr, 1.0), 0.0)
+
+        self.imp_store = np.maximum(self.imp_store - self.evap*seconds, 0.0)
+        self.perv_store = np.maximum(self.perv_store - (self.evap + self.fc/(60.0*60.0))*seconds, 0.0)
+
+    def run(self, storms):
+        """
+        Step storms one at a time in order, carrying the state from one to the next
+        :param storms: StormTable object
+        :return: impervious runoff depth, pervious runoff depth, infiltrated depth, all inches with shape
+            (number of subcatchments, number of storms)
+        """
+        t0, t1, rain = intervals(storms)
+        steps = np.maximum(storms.tips(), 1)
+        shape = (len(self.f0), len(storms))
+        imp_runoff = np.zeros(shape)
+        perv_runoff = np.zeros(shape)
+        infil = np.zeros(shape)
+        for j, (start, length) in enumerate(zip(storms.start.tolist(), storms.length.tolist())):
+            if self.last_start is not None and start < self.last_start:
+                raise ValueError('storms must be in order of start')
+            self.dry(start)
+            width = steps[j]
+            imp, perv, storm_infil, self.perv_store, self.imp_store = step_storms(
+                t0[j:j+1, :width], t1[j:j+1, :width], rain[j:j+1, :width], self.f0, self.k, self.fc,
+                self.depress_stor_perv, self.depress_stor_imperv, self.t_start, self.perv_store, self.imp_store)
+            imp_runoff[:, j:j+1] = imp
+            perv_runoff[:, j:j+1] = perv
+            infil[:, j:j+1] = storm_infil
+            self.t_start = self.t_start + length/(60.0*60.0)
+            self.last_start = start
+            self.last_end = start + length
+        return imp_runoff, perv_runoff, infil
+
+
+class ContinuousRunOff(BatchRunOff):
+    def __init__(self, storms, subcatches, state=None):
+        """
+        Same as SteppedRunOff but each storm starts from the state left by the storms before it. Pass the state
+        returned by the last block in with the next block of storms, see iter_continuous()
+        :param storms: StormTable object, storms in order of start
+        :param subcatches: list of Subcatchment objects
+        :param state: ContinuousState object, updated in place. Default starts with full capacity and empty storage
+        """
+        self.storms = storms
+        self.subcatches = subcatches
+        self.state = state if state is not None else ContinuousState(subcatches)
+
+        with stage('runoff_continuous', len(storms) * len(subcatches)):
+            self.area_acre, self.imp_area, self.perv_area = sc_areas(subcatches)
+            imp_depth, perv_depth, self.infil = self.state.run(storms)
+            self.imp_vol = self.imp_area * imp_depth / 12.0  # ac-ft
+            self.per_vol = self.perv_area * perv_depth / 12.0  # ac-ft
+            self.runoff = self.imp_vol + self.per_vol  # ac-ft
+        self._count()
+
+
+def iter_continuous(rainfile, subcatches, size=1000, dry_days=7.0, evap=0.1):
+    """
+    Continuous runoff for rainfile a block of storms at a time, see my_cuhp.iter_runoff()
+    :param rainfile: csv file of storm events in order of start, see rain.py
+    :param subcatches: list of Subcatchment objects
+    :param size: number of storms per block
+    :param dry_days: see ContinuousState
+    :param evap: see ContinuousState
+    :return: generator of ContinuousRunOff objects
+    """
+    state = ContinuousState(subcatches, dry_days, evap)
+    for storms in iter_storm_tables(rainfile, size):
+        yield ContinuousRunOff(storms, subcatches, state)
+
+
+def run(rainfile, subcatches, factors, size=1000, dry_days=7.0, evap=0.1, start_month=4, end_month=10):
+    """
+    Monthly runoff of a continuous simulation, only monthly totals of each block are kept
+    :param rainfile: csv file of storm events in order of start
+    :param subcatches: list of Subcatchment objects
+    :param factors: dict of correction factors, keys are subcatchment names, see my_cuhp.adjust_volume()
+    :return: Stats object
+    """
+    totals = {}  # keys are years, values are arrays of total runoff with shape (subcatch, month)
+    for results in iter_continuous(rainfile, subcatches, size, dry_days, evap):
+        results.adjust(factors)
+        years, year_index = np.unique(results.storms.year, return_inverse=True)
+        block = month_totals(results.runoff, year_index, results.storms.month, len(years))
+        for i, year in enumerate(years.tolist()):
+            if year in totals:
+                totals[year] = totals[year] + block[:, i]
+            else:
+                totals[year] = block[:, i]
+    years = sorted(totals)
+    by_year = np.array([totals[year] for year in years]).transpose(1, 0, 2) if years else \
+        np.zeros((len(subcatches), 0, 12))
+    return Stats.from_totals([sc.name for sc in subcatches], years, by_year, start_month, end_month)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rain', default='csv/more_rain2.csv', help='rain file (default: %(default)s)')
+    parser.add_argument('--params', default='csv/hlc_sc_combined.csv', help='subcatchment file (default: %(default)s)')
+    parser.add_argument('--adjust', default='csv/adjust.csv', help='correction factors, "none" to skip '
+                                                                   '(default: %(default)s)')
+    parser.add_argument('--dry-days', type=float, default=7.0,
+                        help='days for infiltration capacity to recover (default: %(default)s)')
+    parser.add_argument('--evap', type=float, default=0.1, help='evaporation rate in/day (default: %(default)s)')
+    parser.add_argument('--size', type=int, default=1000, help='storms read at once (default: %(default)s)')
+    args = parser.parse_args()
+
+    factors = import_factors(args.adjust) if args.adjust != 'none' else {}
+    subcatches = load_params(args.params)
+    factors = dict((sc.name, factors.get(sc.name, 1.0)) for sc in subcatches)
+    run(args.rain, subcatches, factors, args.size, args.dry_days, args.evap).print_average_runoff()
+
+if __name__ == '__main__':
+    main()
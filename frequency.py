@@ -0,0 +1,141 @@
+"""
+Rainfall frequency analysis. For every storm the greatest rainfall depth over sliding durations (5, 15, 60 minutes...)
+is found from the cumulative rain points, then:
+
+    - annual maxima: greatest depth in each year for each duration
+    - partial duration series: the largest storms of the record for each duration, as many as there are years, with
+      their return period (years + 1) / rank
+    - exceedances: number of storms each year deeper than the design storm for each duration
+
+All storms are done at once. The cumulative rain points of the whole record are laid end to end on one time axis,
+storms far enough apart that no window covers two storms, and rain is cumulative over the record. The depth of a
+window is then the difference of two interpolations. Cumulative rain is linear between points, so the greatest depth
+over a duration is a window that starts or ends at a point, and only those windows are checked.
+"""
+import argparse
+import numpy as np
+
+from cache import load_storms
+from instrument import stage
+from rain import StormTable, load_design_storm
+
+DURATIONS = (5, 10, 15, 30, 60, 120, 180, 360, 720, 1440)  # minutes
+
+
+def max_depths(storms, durations=DURATIONS):
+    """
+    Greatest rainfall depth of each storm over each duration
+    :param storms: StormTable object
+    :param durations: list of durations (minutes)
+    :return: array of depths (inches) with shape (number of storms, number of durations)
+    """
+    durations = np.asarray(durations, dtype=float)
+    with stage('max_depths', len(storms)):
+        if not len(storms):
+            return np.zeros((0, len(durations)))
+        counts = np.diff(storms.offsets)
+        last = storms.offsets[1:] - 1
+
+        # one time axis and cumulative rain for the whole record
+        span = storms.times.max() + durations.max() + 1.0  # minutes between the starts of storms
+        time = storms.times + np.repeat(np.arange(len(storms)) * span, counts)
+        base = np.concatenate([[0.0], np.cumsum(storms.rains[last])[:-1]])  # rain before each storm
+        rain = storms.rains + np.repeat(base, counts)
+
+        # windows starting and ending at every point
+        time = time[:, np.newaxis]
+        rain = rain[:, np.newaxis]
+        after = np.interp(time + durations, time[:, 0], rain[:, 0]) - rain
+        before = rain - np.interp(time - durations, time[:, 0], rain[:, 0])
+        return np.maximum.reduceat(np.maximum(after, before), storms.offsets[:-1], axis=0)
+
+
+def design_table(design):
+    """
+    :param design: design storm x and y from rain.load_design_storm()
+    :return: StormTable with the design storm
+    """
+    times, rains = design
+    return StormTable([0], [rains[-1]], [times[-1]*60.0], [0, len(times)], times, rains)
+
+
+class Frequency(object):
+    def __init__(self, storms, durations=DURATIONS, design=None):
+        """
+        :param storms: StormTable object
+        :param durations: list of durations (minutes)
+        :param design: design storm x and y from rain.load_design_storm(), None to skip exceedances
+        """
+        self.storms = storms
+        self.durations = list(durations)
+        self.depths = max_depths(storms, durations)  # shape (storm, duration)
+        years, self.year_index = np.unique(storms.year, return_inverse=True)
+        self.years = years.tolist()  # every year with storms
+
+        # annual maxima, shape (year, duration)
+        self.annual_max = np.zeros((len(self.years), len(self.durations)))
+        np.maximum.at(self.annual_max, self.year_index, self.depths)
+
+        # partial duration series, storm indexes of the largest storms for each duration, shape (rank, duration)
+        n = min(len(self.years), len(storms))
+        self.partial = np.argsort(-self.depths, axis=0, kind='mergesort')[:n]
+
+        self.design_depths = None
+        self.exceedances = None
+        if design is not None:
+            self.design_depths = max_depths(design_table(design), durations)[0]
+            self.exceedances = np.zeros((len(self.years), len(self.durations)), dtype=int)
+            np.add.at(self.exceedances, self.year_index, (self.depths > self.design_depths).astype(int))
+
+    def print_annual_maxima(self):
+        """ print greatest depth (in) in each year by duration in csv format with header """
+        print 'Year,' + ','.join('{} min'.format(d) for d in self.durations)
+        for year, values in zip(self.years, self.annual_max.tolist()):
+            print str(year) + ',' + ','.join(str(value) for value in values)
+
+    def print_partial_duration(self):
+        """ print the partial duration series of every duration in csv format with header """
+        print 'duration,rank,storm_id,depth,return_period'
+        for j, duration in enumerate(self.durations):
+            for rank, i in enumerate(self.partial[:, j].tolist(), 1):
+                period = (len(self.years) + 1.0) / rank
+                print '{},{},{},{},{}'.format(duration, rank, self.storms[i].id, self.depths[i, j], period)
+
+    def print_exceedances(self):
+        """ print number of storms deeper than the design storm in each year by duration in csv format with header """
+        if self.exceedances is None:
+            raise ValueError('no design storm')
+        print 'Year,' + ','.join('{} min'.format(d) for d in self.durations)
+        print 'design,' + ','.join(str(value) for value in self.design_depths.tolist())
+        for year, values in zip(self.years, self.exceedances.tolist()):
+            print str(year) + ',' + ','.join(str(value) for value in values)
+        print 'total,' + ','.join(str(value) for value in self.exceedances.sum(axis=0).tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('rain', nargs='*', default=['csv/more_rain2.csv'],
+                        help='rain files, one for each gage (default: csv/more_rain2.csv)')
+    parser.add_argument('--design', default='csv/2-Year Design Storm.csv', help='design storm (default: %(default)s)')
+    parser.add_argument('--durations', default=','.join(str(d) for d in DURATIONS),
+                        help='comma separated durations in minutes (default: %(default)s)')
+    parser.add_argument('--table', choices=['annual', 'partial', 'exceed'], default='annual',
+                        help='annual maxima, partial duration series or exceedances of the design storm '
+                             '(default: annual)')
+    args = parser.parse_args()
+
+    durations = [float(d) if '.' in d else int(d) for d in args.durations.split(',')]
+    design = load_design_storm(args.design)
+    for rainfile in args.rain:
+        if len(args.rain) > 1:
+            print rainfile
+        frequency = Frequency(load_storms(rainfile), durations, design)
+        if args.table == 'annual':
+            frequency.print_annual_maxima()
+        elif args.table == 'partial':
+            frequency.print_partial_duration()
+        else:
+            frequency.print_exceedances()
+
+if __name__ == '__main__':
+    main()
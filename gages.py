@@ -0,0 +1,163 @@
+"""
+Runoff for a network of subcatchments served by several rain gages.
+
+Gages are listed in a csv in "name,rain_file,x,y" format and subcatchment locations (e.g. centroids) in a csv in
+"sc_name,x,y" format, both in the same projected coordinates. Headers are ignored if present. Each subcatchment is
+assigned to its nearest gage, or to its nearest few gages weighted by inverse distance. Each gage's storms are parsed
+and runoff for the subcatchments it serves is calculated in a pool of worker processes, one gage per task. Runoff
+totaled by subcatchment, year and month is then weighted and merged into one Stats object. Years are every year with
+storms at any gage, so gages should cover the same period.
+"""
+import argparse
+import multiprocessing
+import numpy as np
+
+from cache import load_storms, load_params
+from incremental import month_totals
+from my_cuhp import SteppedRunOff, import_factors
+from stats import Stats
+from threshold import ThresholdRunOff
+
+
+def import_gages(filename):
+    """
+    :param filename: csv file in "name,rain_file,x,y" format
+    :return: list of gage names, list of rain files, array of gage locations with shape (gages, 2)
+    """
+    names = []; rainfiles = []; locations = []
+    with open(filename, 'rt') as infile:
+        for line in infile:
+            fields = [field.strip() for field in line.split(',')]
+            try:
+                location = float(fields[2]), float(fields[3])
+            except (IndexError, ValueError):
+                continue  # header or blank line
+            names.append(fields[0])
+            rainfiles.append(fields[1])
+            locations.append(location)
+    return names, rainfiles, np.array(locations, dtype=float).reshape(-1, 2)
+
+
+def import_locations(filename, subcatches):
+    """
+    :param filename: csv file in "sc_name,x,y" format
+    :param subcatches: list of Subcatchment objects
+    :return: array of subcatchment locations with shape (subcatches, 2), in the order of subcatches
+    """
+    locations = {}
+    with open(filename, 'rt') as infile:
+        for line in infile:
+            fields = [field.strip() for field in line.split(',')]
+            try:
+                locations[fields[0]] = float(fields[1]), float(fields[2])
+            except (IndexError, ValueError):
+                continue  # header or blank line
+    missing = [sc.name for sc in subcatches if sc.name not in locations]
+    if missing:
+        raise ValueError('no location for subcatchments: ' + ', '.join(missing))
+    return np.array([locations[sc.name] for sc in subcatches], dtype=float).reshape(-1, 2)
+
+
+def assign(sc_locations, gage_locations, method='nearest', neighbors=3, power=2.0):
+    """
+    Weight of each gage for each subcatchment
+    :param sc_locations: array of subcatchment locations with shape (subcatches, 2)
+    :param gage_locations: array of gage locations with shape (gages, 2)
+    :param method: 'nearest' uses the nearest gage, 'idw' weights the nearest gages by inverse distance
+    :param neighbors: number of gages used by 'idw'
+    :param power: power of distance used by 'idw'
+    :return: array of weights with shape (subcatches, gages), each row adds up to 1
+    """
+    distance = np.hypot(*(sc_locations[:, np.newaxis, :] - gage_locations[np.newaxis, :, :]).transpose(2, 0, 1))
+    rows = np.arange(len(sc_locations))[:, np.newaxis]
+    weights = np.zeros(distance.shape)
+    if method == 'nearest':
+        weights[rows[:, 0], np.argmin(distance, axis=1)] = 1.0
+        return weights
+
+    nearest = np.argsort(distance, axis=1)[:, :neighbors]
+    with np.errstate(divide='ignore'):
+        inverse = 1.0 / distance[rows, nearest] ** power
+    # a subcatchment on top of a gage only uses that gage
+    on_gage = np.isinf(inverse).any(axis=1)
+    inverse[on_gage] = np.isinf(inverse[on_gage])
+    weights[rows, nearest] = inverse / inverse.sum(axis=1)[:, np.newaxis]
+    return weights
+
+
+def gage_runoff(task):
+    """
+    Runoff for one gage, runs in worker processes
+    :param task: (rain file, list of Subcatchment objects, dict of correction factors, mode)
+    :return: list of years with storms, array of total runoff with shape (subcatch, year, month), the month axis is
+        jan - dec
+    """
+    rainfile, subcatches, factors, mode = task
+    storms = load_storms(rainfile)
+    results = SteppedRunOff(storms, subcatches) if mode == 'stepped' else ThresholdRunOff(storms, subcatches)
+    results.adjust(factors)
+    years, year_index = np.unique(storms.year, return_inverse=True)
+    return years.tolist(), month_totals(results.runoff, year_index, storms.month, len(years))
+
+
+def run(pool, rainfiles, subcatches, weights, factors, mode='lumped', start_month=4, end_month=10):
+    """
+    Calculate runoff for every gage and merge it
+    :param pool: multiprocessing.Pool
+    :param rainfiles: list of rain files, one for each gage
+    :param subcatches: list of Subcatchment objects
+    :param weights: array of gage weights with shape (subcatches, gages), see assign()
+    :param factors: dict of runoff correction factors, keys are subcatchment names
+    :param mode: 'lumped' or 'stepped', see my_cuhp.main()
+    :return: Stats object
+    """
+    tasks = []
+    served = []  # index of subcatchments served by each gage
+    for gage, rainfile in enumerate(rainfiles):
+        rows = np.flatnonzero(weights[:, gage] > 0.0)
+        if len(rows):
+            tasks.append((rainfile, [subcatches[i] for i in rows], factors, mode))
+            served.append((gage, rows))
+
+    # largest tasks first so the pool stays busy
+    order = sorted(range(len(tasks)), key=lambda i: -len(tasks[i][1]))
+    results = pool.map(gage_runoff, [tasks[i] for i in order], chunksize=1)
+
+    years = sorted(set(year for gage_years, _ in results for year in gage_years))
+    totals = np.zeros((len(subcatches), len(years), 12))
+    for i, (gage_years, gage_totals) in zip(order, results):
+        gage, rows = served[i]
+        columns = np.searchsorted(years, gage_years)
+        totals[rows[:, np.newaxis], columns] += weights[rows, gage][:, np.newaxis, np.newaxis] * gage_totals
+    return Stats.from_totals([sc.name for sc in subcatches], years, totals, start_month, end_month)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('gages', help='csv of gages in "name,rain_file,x,y" format')
+    parser.add_argument('locations', help='csv of subcatchment locations in "sc_name,x,y" format')
+    parser.add_argument('--params', default='csv/hlc_sc_combined.csv', help='subcatchment file (default: %(default)s)')
+    parser.add_argument('--adjust', default='csv/adjust.csv', help='correction factors (default: %(default)s)')
+    parser.add_argument('--assign', choices=['nearest', 'idw'], default='nearest',
+                        help='use the nearest gage or weight the nearest gages by inverse distance (default: nearest)')
+    parser.add_argument('--neighbors', type=int, default=3, help='gages used by idw (default: 3)')
+    parser.add_argument('--power', type=float, default=2.0, help='power of distance used by idw (default: 2)')
+    parser.add_argument('--mode', choices=['lumped', 'stepped'], default='lumped', help='see my_cuhp.py')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per cpu)')
+    args = parser.parse_args()
+
+    subcatches = load_params(args.params)
+    _, rainfiles, gage_locations = import_gages(args.gages)
+    weights = assign(import_locations(args.locations, subcatches), gage_locations, args.assign, args.neighbors,
+                     args.power)
+
+    pool = multiprocessing.Pool(args.processes)
+    try:
+        stats = run(pool, rainfiles, subcatches, weights, import_factors(args.adjust), args.mode)
+    finally:
+        pool.close()
+        pool.join()
+    stats.print_average_runoff()
+
+if __name__ == '__main__':
+    main()
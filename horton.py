@@ -0,0 +1,146 @@
+"""
+Time stepped hortons infiltration and depression storage. Instead of applying hortons equation to the whole storm
+length, each step of the hyetograph (cumulative rain points in RainEvent.values) is compared to the infiltration
+capacity and depression storage. All subcatchments and storms are stepped together as arrays.
+"""
+import numpy as np
+
+
+def intervals(storms):
+    """
+    Hyetograph steps of all storms, padded to the same number of steps with empty (zero length, zero rain) steps
+    :param storms: StormTable object
+    :return: arrays of step start time (hrs), step end time (hrs) and rainfall during step (inches), each with shape
+        (number of storms, most steps in a storm)
+    """
+    steps = np.diff(storms.offsets) - 1  # number of steps in each storm
+    width = max(int(steps.max()), 1) if len(steps) else 1
+    # padding steps start and end at the end of the storm so they have no infiltration capacity
+    end = storms.times[storms.offsets[1:]-1] / 60.0
+    t0 = np.repeat(end, width).reshape(len(steps), width)
+    t1 = t0.copy()
+    rain = np.zeros((len(steps), width))
+
+    # position of every step in the padded arrays, the first point of every storm only starts a step
+    ends = np.ones(len(storms.times), dtype=bool)
+    ends[storms.offsets[:-1]] = False
+    end_index = np.flatnonzero(ends)
+    row = np.repeat(np.arange(len(steps)), steps)
+    col = end_index - storms.offsets[row] - 1
+
+    t0[row, col] = storms.times[end_index-1] / 60.0
+    t1[row, col] = storms.times[end_index] / 60.0
+    rain[row, col] = storms.rains[end_index] - storms.rains[end_index-1]
+    return t0, t1, rain
+
+
+def horton_steps(storms, f0, k, fc, depress_stor_perv, depress_stor_imperv, t_start=0.0, perv_store=None,
+                 imp_store=None):
+    """
+    Step each storm through its hyetograph for every subcatchment. At each step rain is added to pervious depression
+    storage, up to the hortons capacity for the step is infiltrated, and any water above the depression storage runs
+    off. Impervious areas fill their depression storage, the rest runs off. Infiltration capacity decays with time
+    since the start of the storm, the same as RunOff.infiltration()
+    Storms are stepped longest first, so at each step only the leading columns of storms that still have a step are
+    updated instead of padding every storm to the longest one (see step_storms())
+    Subcatchment params are arrays with shape (number of subcatchments, 1). By default every storm starts with full
+    infiltration capacity and empty depression storage, the initial state can be given for continuous simulation
+    (see continuous.py) as arrays that broadcast to (number of subcatchments, number of storms)
+    :param storms: StormTable object
+    :param f0: initial infiltration rate (in/hr)
+    :param k: decay rate (1/sec)
+    :param fc: final infiltration rate (in/hr)
+    :param depress_stor_perv: pervious depression storage (inches)
+    :param depress_stor_imperv: impervious depression storage (inches)
+    :param t_start: time already spent on the hortons curve at the start of each storm (hrs)
+    :param perv_store: water in pervious depression storage at the start of each storm (inches)
+    :param imp_store: water in impervious depression storage at the start of each storm (inches)
+    :return: impervious runoff depth, pervious runoff depth, infiltrated depth, all inches with shape
+        (number of subcatchments, number of storms)
+    """
+    steps = storms.tips()
+    order = np.argsort(-steps, kind='mergesort')  # most steps first
+    t0, t1, rain = [values[order] for values in intervals(storms)]
+
+    # number of storms with a step at each step, the rest are padding
+    counts = np.bincount(steps, minlength=rain.shape[1]+1)
+    active = len(storms) - np.cumsum(counts)[:rain.shape[1]]
+
+    t_start, perv_store, imp_store = [_storm_columns(value, order, len(storms))
+                                      for value in (t_start, perv_store, imp_store)]
+    results = step_storms(t0, t1, rain, f0, k, fc, depress_stor_perv, depress_stor_imperv, t_start, perv_store,
+                          imp_store, active)
+
+    # back to storm order
+    unsorted = []
+    for values in results[:3]:
+        values_in_order = np.empty(values.shape)
+        values_in_order[:, order] = values
+        unsorted.append(values_in_order)
+    return tuple(unsorted)
+
+
+def _storm_columns(value, order, n_storms):
+    """
+    :return: value with its storm axis in order, if it has one
+    """
+    if value is None or np.ndim(value) < 2 or np.shape(value)[-1] != n_storms:
+        return value
+    return np.asarray(value)[..., order]
+
+
+def step_storms(t0, t1, rain, f0, k, fc, depress_stor_perv, depress_stor_imperv, t_start=0.0, perv_store=None,
+                imp_store=None, active=None):
+    """
+    Step storms already split into steps by intervals(), see horton_steps()
+    :param active: number of storms with a step at each step, None for all. Storms must be ordered so the ones with
+        a step are the leading columns, e.g. by most steps first. Padding steps have no rain and no infiltration
+        capacity so skipping them doesn't change any value
+    :return: impervious runoff depth, pervious runoff depth, infiltrated depth, water left in pervious and impervious
+        depression storage at the end of each storm, all inches with shape (number of subcatchments, number of storms)
+    """
+    k_hr = k*(60.0*60.0)  # convert 1/sec to 1/hr
+    shape = (len(f0), t0.shape[0])
+
+    # water in pervious and impervious depression storage (inches)
+    perv_store = np.zeros(shape) if perv_store is None else perv_store + np.zeros(shape)
+    imp_store = np.zeros(shape) if imp_store is None else imp_store + np.zeros(shape)
+    perv_runoff = np.zeros(shape)
+    imp_runoff = np.zeros(shape)
+    infil = np.zeros(shape)
+    if np.ndim(t_start) == 2:
+        t_start = np.broadcast_to(t_start, shape)  # so it can be sliced with the active columns
+    if active is None:
+        active = np.repeat(shape[1], rain.shape[1])
+
+    for step, n in enumerate(active.tolist()):
+        if not n:
+            break
+
+        # state of the storms with a step, views so updates are in place
+        step_perv_store = perv_store[:, :n]
+        step_imp_store = imp_store[:, :n]
+        step_start = t_start[:, :n] if np.ndim(t_start) == 2 else t_start
+
+        # Infiltration capacity during step, integral of hortons eq from t0 to t1
+        step_t0 = step_start + t0[:n, step]
+        step_t1 = step_start + t1[:n, step]
+        capacity = fc*(t1[:n, step] - t0[:n, step]) + \
+            ((f0-fc)/k_hr)*(np.exp(-k_hr*step_t0) - np.exp(-k_hr*step_t1))
+
+        # Pervious
+        step_perv_store += rain[:n, step]
+        step_infil = np.minimum(capacity, step_perv_store)
+        infil[:, :n] += step_infil
+        step_perv_store -= step_infil
+        excess = np.maximum(step_perv_store - depress_stor_perv, 0.0)
+        perv_runoff[:, :n] += excess
+        step_perv_store -= excess
+
+        # Impervious
+        step_imp_store += rain[:n, step]
+        excess = np.maximum(step_imp_store - depress_stor_imperv, 0.0)
+        imp_runoff[:, :n] += excess
+        step_imp_store -= excess
+
+    return imp_runoff, perv_runoff, infil, perv_store, imp_store
@@ -0,0 +1,224 @@
+"""
+Incremental runoff updates for a growing rain record.
+
+A store is a folder of array files (see cache.save_arrays()). Every update that calculates anything adds one segment
+file with the runoff it calculated, segments are never changed or rewritten. A small index file, rewritten on every
+update, has the storms in the record, the fingerprint of each subcatchment's parameters and correction factor, and
+runoff totaled by subcatchment, year and month. Its size depends on the number of storms and subcatchments, not on the
+number of results stored.
+
+On update storms are matched to the index by start, total rain and length with a binary search of the index's sorted
+starts. Only new or changed storms are calculated for unchanged subcatchments, and only subcatchments with new
+fingerprints are calculated for the whole record. Monthly totals are updated by adding runoff of new storms and
+removing runoff of storms no longer in the record, the removed runoff is read from the segments it was saved in.
+"""
+import argparse
+import hashlib
+import os
+import numpy as np
+
+from cache import save_arrays, load_arrays, load_storms, load_params
+from instrument import count
+from my_cuhp import BatchRunOff, SteppedRunOff, import_factors
+from stats import Stats
+
+RESULT_COLUMNS = ('imp_vol', 'infil', 'per_vol', 'runoff')
+
+
+def fingerprint(sc, factor, mode):
+    """
+    :param sc: Subcatchment object
+    :param factor: runoff correction factor
+    :param mode: 'lumped' or 'stepped', see my_cuhp.main()
+    :return: string identifying everything that affects runoff for sc
+    """
+    values = (sc.name, sc.area, sc.imperv, sc.depress_stor_perv, sc.depress_stor_imperv, sc.horton_init,
+              sc.horton_decay, sc.horton_final, factor, mode)
+    return hashlib.sha1(repr(values)).hexdigest()
+
+
+def month_totals(runoff, year_index, months, n_years):
+    """
+    :param runoff: array of runoff with shape (subcatch, storm)
+    :param year_index: index of year of each storm
+    :param months: month of each storm
+    :param n_years: number of years
+    :return: array of total runoff with shape (subcatch, year, month), the month axis is jan - dec
+    """
+    n_sc = runoff.shape[0]
+    index = (np.arange(n_sc)[:, np.newaxis]*n_years*12 + year_index*12 + months - 1).ravel()
+    totals = np.bincount(index, runoff.ravel(), minlength=n_sc*n_years*12)
+    return totals.reshape(n_sc, n_years, 12)
+
+
+def segment_name(store_name, segment):
+    """ :return: file name of segment number segment in store """
+    return os.path.join(store_name, 'segment_{:06d}'.format(segment))
+
+
+def match_storms(starts, total_rain, length, storms):
+    """
+    :param starts: sorted array of storm starts in the index
+    :param total_rain: total rain of index storms
+    :param length: length of index storms
+    :param storms: StormTable object
+    :return: array with the position in the index of each storm, -1 for storms not in the index or changed
+    """
+    position = np.minimum(np.searchsorted(starts, storms.start), max(len(starts) - 1, 0))
+    if not len(starts):
+        return np.full(len(storms), -1, dtype=int)
+    same = (starts[position] == storms.start) & (total_rain[position] == storms.total_rain) & \
+        (length[position] == storms.length)
+    return np.where(same, position, -1)
+
+
+def removed_totals(store_name, base, fingerprints, index, removed, years):
+    """
+    Runoff of removed storms totaled by subcatchment, year and month, read from the segments the runoff was saved in.
+    The runoff for a subcatchment and storm is in the later of the segment the subcatchment's fingerprint was first
+    calculated in and the segment the storm was added in
+    :param store_name: name of store folder
+    :param base: array of first segment of each subcatchment
+    :param fingerprints: list of fingerprint of each subcatchment
+    :param index: dict of index arrays
+    :param removed: array of positions in the index of removed storms
+    :param years: list of years of the totals
+    :return: array of total runoff with shape (subcatch, year, month), the month axis is jan - dec
+    """
+    totals = np.zeros((len(base), len(years), 12))
+    if not len(base) or not len(removed):
+        return totals
+    year_index = np.searchsorted(years, index['year'][removed])
+    segments = np.maximum(base[:, np.newaxis], index['storm_segment'][removed])
+    for segment in np.unique(segments).tolist():
+        rows, columns = np.nonzero(segments == segment)
+        _, saved = load_arrays(segment_name(store_name, segment))
+        saved_rows = dict((fp, i) for i, fp in enumerate(saved['fingerprints'].tolist()))
+        saved_row = np.array([saved_rows[fingerprints[i]] for i in rows.tolist()], dtype=int)
+        order = np.argsort(saved['storm_start'], kind='mergesort')
+        saved_column = order[np.searchsorted(saved['storm_start'][order], index['storm_start'][removed][columns])]
+        runoff = saved['runoff'][saved_row, saved_column]
+        np.add.at(totals, (rows, year_index[columns], index['month'][removed][columns] - 1), runoff)
+    return totals
+
+
+def update(store_name, storms, subcatches, factors, mode='lumped'):
+    """
+    Bring the store up to date with storms and subcatches
+    :param store_name: name of store folder, created if it doesn't exist
+    :param storms: StormTable object
+    :param subcatches: list of Subcatchment objects
+    :param factors: dict of runoff correction factors, keys are subcatchment names, see my_cuhp.adjust_volume()
+    :param mode: 'lumped' or 'stepped', see my_cuhp.main()
+    :return: Stats object for the whole record, number of subcatchment/storm pairs calculated
+    """
+    runoff_class = SteppedRunOff if mode == 'stepped' else BatchRunOff
+    names = [sc.name for sc in subcatches]
+    prints = [fingerprint(sc, factors[sc.name], mode) for sc in subcatches]
+    years = np.unique(storms.year).tolist()
+    year_index = np.searchsorted(years, storms.year)
+    totals = np.zeros((len(subcatches), len(years), 12))
+    base = np.zeros(len(subcatches), dtype=int)  # first segment of each subcatchment
+    storm_segment = np.zeros(len(storms), dtype=int)  # segment each storm was added in
+
+    # Match storms and subcatchments with the index
+    index_name = os.path.join(store_name, 'index')
+    if os.path.exists(store_name) and not os.path.isdir(store_name):
+        raise ValueError(store_name + ' is not a store folder, results stores are folders')
+    if os.path.exists(index_name):
+        meta, index = load_arrays(index_name)
+        segment = meta['segments']
+        old_storm = match_storms(index['storm_start'], index['total_rain'], index['length'], storms)
+        old_prints = dict((fp, i) for i, fp in enumerate(index['fingerprints'].tolist()))
+        old_sc = np.array([old_prints.get(fp, -1) for fp in prints], dtype=int)
+
+        # Storms in the index that are gone or changed
+        removed = np.ones(len(index['storm_start']), dtype=bool)
+        removed[old_storm[old_storm >= 0]] = False
+        removed = np.flatnonzero(removed)
+
+        # Unchanged subcatchments keep their totals, less removed storms
+        rows = np.flatnonzero(old_sc >= 0)
+        base[rows] = index['base'][old_sc[rows]]
+        kept = np.flatnonzero(old_storm >= 0)
+        storm_segment[kept] = index['storm_segment'][old_storm[kept]]
+        old_years = index['years'].tolist()
+        old_totals = index['totals'][old_sc[rows]] - removed_totals(store_name, base[rows],
+                                                                    [prints[i] for i in rows.tolist()], index,
+                                                                    removed, old_years)
+        for y, year in enumerate(old_years):
+            if year in years:
+                totals[rows, years.index(year)] = old_totals[:, y]
+        index = None  # close memory maps before the index is replaced
+    else:
+        if not os.path.isdir(store_name):
+            os.makedirs(store_name)
+        segment = 0
+        old_storm = np.full(len(storms), -1, dtype=int)
+        old_sc = np.full(len(subcatches), -1, dtype=int)
+        rows = np.empty(0, dtype=int)
+
+    # Unchanged subcatchments need new storms, everything else needs every storm. Both go in one new segment
+    new_storms = np.flatnonzero(old_storm < 0)
+    changed = np.flatnonzero(old_sc < 0)
+    calculated = 0
+    parts = []
+    for sc_rows, storm_columns in ((rows, new_storms), (changed, np.arange(len(storms)))):
+        if not len(sc_rows) or not len(storm_columns):
+            continue
+        batch = runoff_class(storms.take(storm_columns), [subcatches[i] for i in sc_rows])
+        batch.adjust(factors)
+        totals[sc_rows] += month_totals(batch.runoff, year_index[storm_columns], storms.month[storm_columns],
+                                        len(years))
+        calculated += batch.runoff.size
+        parts.append((sc_rows, storm_columns, batch))
+    count('pairs_reused', len(storms)*len(subcatches) - calculated)
+
+    if parts:
+        segment += 1
+        storm_segment[new_storms] = segment
+        base[changed] = segment
+        segment_storms = np.union1d(*[storm_columns for _, storm_columns, _ in parts]) if len(parts) > 1 else \
+            parts[0][1]
+        segment_rows = np.concatenate([sc_rows for sc_rows, _, _ in parts])
+        position = np.empty(len(subcatches), dtype=int)
+        position[segment_rows] = np.arange(len(segment_rows))
+        results = dict((column, np.zeros((len(segment_rows), len(segment_storms)))) for column in RESULT_COLUMNS)
+        for sc_rows, storm_columns, batch in parts:
+            cells = np.ix_(position[sc_rows], np.searchsorted(segment_storms, storm_columns))
+            for column in RESULT_COLUMNS:
+                results[column][cells] = getattr(batch, column)
+        arrays = [('fingerprints', np.array([prints[i] for i in segment_rows.tolist()], dtype=str)),
+                  ('storm_start', storms.start[segment_storms]), ('total_rain', storms.total_rain[segment_storms]),
+                  ('length', storms.length[segment_storms])]
+        arrays += [(column, results[column]) for column in RESULT_COLUMNS]
+        save_arrays(segment_name(store_name, segment), arrays, {'mode': mode})
+
+    # Index, storms sorted by start for match_storms()
+    order = np.argsort(storms.start, kind='mergesort')
+    arrays = [('names', np.array(names, dtype=str)), ('fingerprints', np.array(prints, dtype=str)),
+              ('base', base), ('storm_start', storms.start[order]), ('total_rain', storms.total_rain[order]),
+              ('length', storms.length[order]), ('year', storms.year[order]), ('month', storms.month[order]),
+              ('storm_segment', storm_segment[order]), ('years', np.array(years, dtype=int)), ('totals', totals)]
+    save_arrays(index_name, arrays, {'mode': mode, 'segments': segment})
+
+    return Stats.from_totals(names, years, totals), calculated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('store', help='result store folder')
+    parser.add_argument('--rain', default='csv/more_rain2.csv', help='rain file (default: %(default)s)')
+    parser.add_argument('--params', default='csv/hlc_sc_combined.csv', help='subcatchment file (default: %(default)s)')
+    parser.add_argument('--adjust', default='csv/adjust.csv', help='correction factors (default: %(default)s)')
+    parser.add_argument('--mode', choices=['lumped', 'stepped'], default='lumped', help='see my_cuhp.py')
+    args = parser.parse_args()
+
+    storms = load_storms(args.rain)
+    subcatches = load_params(args.params)
+    stats, calculated = update(args.store, storms, subcatches, import_factors(args.adjust), args.mode)
+    print calculated, 'of', len(storms)*len(subcatches), 'subcatchment/storm pairs calculated'
+    stats.print_average_runoff()
+
+if __name__ == '__main__':
+    main()
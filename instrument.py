@@ -0,0 +1,140 @@
+"""
+Instrumentation for the runoff pipeline. Stages (import, runoff, adjustment, statistics, output) record wall time and
+rows processed, and counters record things like how many results were clipped at zero. Everything is kept in one
+global recorder and can be written to a json report with the peak memory of the process (the operating system only
+keeps the peak since the process started, so it isn't recorded for each stage).
+
+Instrumentation is off by default. While it is off stage() returns a shared do-nothing object and count() returns at
+once, code that has to do work to get a counter's value should check enabled first:
+
+    with stage('runoff') as s:
+        ...
+        s.rows = runoff.size
+    if instrument.enabled:
+        count('zero_perv_runoff', np.count_nonzero(per_vol == 0.0))
+
+Stages with the same name (e.g. runoff for every block of storms) are totaled. Stages can be nested, the time of the
+inner stage is included in the outer one.
+"""
+from collections import OrderedDict
+import json
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows, no memory peaks
+
+enabled = False
+_stages = OrderedDict()  # totals by stage name, in order first started
+_counters = OrderedDict()  # totals by counter name, in order first counted
+_started = None  # time instrumentation was enabled
+
+
+def peak_memory():
+    """ :return: peak resident memory of this process in MB, None if not available """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024.0 / (1024.0 if sys.platform == 'darwin' else 1.0)
+
+
+class Stage(object):
+    def __init__(self, name, rows=None):
+        """
+        Times a block of code, use with the with statement. Set rows in the block if not known beforehand
+        :param name: name of stage
+        :param rows: number of rows (storms, subcatchments, results...) processed
+        """
+        self.name = name
+        self.rows = rows
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.time() - self.start
+        totals = _stages.get(self.name)
+        if totals is None:
+            totals = _stages[self.name] = OrderedDict([('stage', self.name), ('calls', 0), ('seconds', 0.0),
+                                                       ('rows', 0)])
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['rows'] += self.rows or 0
+        return False
+
+
+class _NullStage(object):
+    """ Stand in for Stage while instrumentation is off """
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass  # shared by every caller, ignore rows
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, rows=None):
+    """
+    :param name: name of stage
+    :param rows: number of rows processed, can also be set on the returned object
+    :return: context manager that records the stage, see Stage
+    """
+    if not enabled:
+        return _NULL_STAGE
+    return Stage(name, rows)
+
+
+def count(name, value=1):
+    """
+    Add value to counter name
+    :param name: name of counter
+    :param value: amount to add
+    """
+    if not enabled:
+        return
+    _counters[name] = _counters.get(name, 0) + int(value)
+
+
+def enable():
+    """ Start recording, clears anything already recorded """
+    global enabled, _started
+    _stages.clear()
+    _counters.clear()
+    _started = time.time()
+    enabled = True
+
+
+def disable():
+    """ Stop recording, what was recorded is kept for report() """
+    global enabled
+    enabled = False
+
+
+def report():
+    """
+    :return: dict of everything recorded since enable()
+    """
+    return OrderedDict([('python', platform.python_version()), ('platform', platform.platform()),
+                        ('argv', sys.argv), ('seconds', time.time() - _started if _started is not None else 0.0),
+                        ('peak_mb', peak_memory()), ('stages', list(_stages.values())), ('counters', _counters)])
+
+
+def write_report(filename):
+    """
+    Write report() to filename as json
+    :param filename: name of file to write
+    """
+    with open(filename, 'wt') as outfile:
+        json.dump(report(), outfile, indent=1)
+        outfile.write('\n')
@@ -1,140 +1,382 @@
-"""
-Calculate runoff volumes for multiple rain events for multiple subcatchments. Considers imperviousnesss, area,
-depression storage and infiltration using hortons equation.
-"""
-from rain import import_storms, RainEvent
-from subcatch import import_params, Subcatchment
-from stats import Stats
-import math
-
-
-class RunOff(object):
-    def __init__(self, storm, sc):
-        """
-        Calculates runoff for a given storm and subcatchment (sc) using impervious area, depression storage, and hortons infiltration
-        :param storm: RainEvent object
-        :param sc: Subcatchment object
-        """
-        self.storm = storm
-        self.sc = sc
-        
-        # Adjust subcatch params
-        self.area_acre = sc.area * 640.0
-        self.imp_area = self.area_acre * sc.imperv/100.0
-        self.perv_area = self.area_acre - self.imp_area
-
-        # Calculate runoff volumes
-        self.imp_vol = self.imp_area * (storm.total_rain - sc.depress_stor_imperv) / 12.0  # ac-ft
-        self.infil = self.infiltration(sc.horton_init, sc.horton_decay, sc.horton_final, storm.length)  # inches
-        self.per_vol = self.perv_area * (storm.total_rain - sc.depress_stor_perv - self.infil) / 12.0  # ac-ft
-
-        # Make sure nothing is below zero
-        if self.imp_vol < 0.0:
-            self.imp_vol = 0.0
-        if self.per_vol < 0.0:
-            self.per_vol = 0.0
-
-        # Total runoff
-        self.runoff = self.imp_vol + self.per_vol  # ac-ft
-        #print storm.id, '\t', sc.name, '\t', storm.total_rain, '\t', round(imp_vol,1),'\t', round(per_vol,1),'\t', round(runoff,1),'\t',  i
-
-    @staticmethod
-    def infiltration(f0, k, fc, t):
-        """
-        Calculate total water infiltration using Horntons eq
-        :param f0: initial infiltration rate (in/hr)
-        :param k: decay rate (1/sec):
-        :param fc: final infiltration rate (in/hr):
-        :param t: storm time (secs)
-        :return: total infilitration for storm (in)
-        """
-        t_hr = t/(60.0*60.0)  # convert to hrs
-        k_hr = k*(60.0*60.0)  # convert 1/sec to 1/hr
-        infil = fc*t_hr + ((f0-fc)/k_hr)*(1-math.e**(-k_hr*t_hr))
-        return infil
-    
-    @staticmethod
-    def header():
-        """ header for __str__() in csv """
-        return 'area_acre,imp_area,perv_area,imp_vol,infil,per_vol,runoff'
-
-    def __str__(self):
-        s = str(self.sc) + ','
-        s += str(self.storm) + ','
-        s += str(self.area_acre) + ','
-        s += str(self.imp_area) + ','
-        s += str(self.perv_area) + ','
-        s += str(self.imp_vol) + ','
-        s += str(self.infil) + ','
-        s += str(self.per_vol) + ','
-        s += str(self.runoff) 
-        return s
-
-def adjust_volume(results, adjust_file):
-    """
-    Reduce runoff volumes in results based on adjust_file. This is based on subcatchment names
-
-    It was discovered that for most rainfall events there was a discrepancy
-    between runoff volumes calculated in RunOff versus CUHP. This was spot
-    checked for three events of varying lengths. For a given subcatchment the
-    discrepancy was a constant ratio* regardless of the storm event, with
-    greater discrepancies for subcatchments with less impervious area. This
-    appears to be due to RunOff assuming all impervious area is directly
-    connected. A list of correction factors to bring runoff in line with CUHP
-    was therefore created and implemented in this function.
-
-    * The discrepancy is only constant for rainstorms that generate no runoff
-    from pervious areas. The majority of events in the rain data are fall in
-    this catagory. While a couple of rainstorms are intense enough to generate
-    runoff from pervious areas, there are so few it was assumed they could
-    safely be ignored. Additionally, the tested "intense" storm (20080611) had
-    a "corrected" discrepancy of 20% on average, which was considered to be
-    within acceptable margins of error.
-
-    :param results: list of RunOff objects
-    :param adjust_file: file name of csv file with adjustments in "sc_name,adjust_factor" format
-    """
-    # import adjustment factors
-    factors = {}
-    with open(adjust_file) as infile:
-        for line in infile:
-            fields = line.strip().split(',')
-            factors[fields[0]] = float(fields[1])
-    # Adjust
-    for result in results:
-        result.runoff = result.runoff * factors[result.sc.name]
-
-
-def main():
-    rainfile = 'csv/more_rain2.csv'
-    paramfile = 'csv/hlc_sc_combined.csv'
-    adjust_file = 'csv/adjust.csv'
-
-    subcatches = import_params(paramfile)
-    storms = import_storms(rainfile)
-
-    results = []
-    for sc in subcatches:
-        # print 'processing subcatch', sc.name
-        for storm in storms:
-            runoff = RunOff(storm, sc)
-            results.append(runoff)
-
-    adjust_volume(results, adjust_file)
-    
-    # print all output data
-    if True:
-        print Subcatchment.header() + ','  + RainEvent.header() + ',' + RunOff.header()
-        for result in results:
-            print result
-    
-    # print monthly average runoff for each subcatchment
-    if not True:
-        stats = Stats(results)
-        #stats.print_vals()
-        stats.print_average_runoff()
-
-
-
-if __name__ == '__main__':
-    main()
+"""
+Calculate runoff volumes for multiple rain events for multiple subcatchments. Considers imperviousnesss, area,
+depression storage and infiltration using hortons equation.
+"""
+from rain import iter_storm_tables
+from stats import Stats
+from cache import load_storms, load_params
+from horton import horton_steps
+from instrument import stage, count
+import instrument
+import argparse
+import math
+import sys
+import numpy as np
+
+
+class RunOff(object):
+    def __init__(self, storm, sc):
+        """
+        Calculates runoff for a given storm and subcatchment (sc) using impervious area, depression storage, and hortons infiltration
+        :param storm: RainEvent object
+        :param sc: Subcatchment object
+        """
+        self.storm = storm
+        self.sc = sc
+        
+        # Adjust subcatch params
+        self.area_acre = sc.area * 640.0
+        self.imp_area = self.area_acre * sc.imperv/100.0
+        self.perv_area = self.area_acre - self.imp_area
+
+        # Calculate runoff volumes
+        self.imp_vol = self.imp_area * (storm.total_rain - sc.depress_stor_imperv) / 12.0  # ac-ft
+        self.infil = self.infiltration(sc.horton_init, sc.horton_decay, sc.horton_final, storm.length)  # inches
+        self.per_vol = self.perv_area * (storm.total_rain - sc.depress_stor_perv - self.infil) / 12.0  # ac-ft
+
+        # Make sure nothing is below zero
+        if self.imp_vol < 0.0:
+            self.imp_vol = 0.0
+        if self.per_vol < 0.0:
+            self.per_vol = 0.0
+
+        # Total runoff
+        self.runoff = self.imp_vol + self.per_vol  # ac-ft
+        #print storm.id, '\t', sc.name, '\t', storm.total_rain, '\t', round(imp_vol,1),'\t', round(per_vol,1),'\t', round(runoff,1),'\t',  i
+
+    @classmethod
+    def from_values(cls, storm, sc, area_acre, imp_area, perv_area, imp_vol, infil, per_vol, runoff):
+        """
+        Creates a RunOff from already calculated values (see BatchRunOff) without redoing the calculations
+        :param storm: RainEvent object
+        :param sc: Subcatchment object
+        :return: RunOff object
+        """
+        result = cls.__new__(cls)
+        result.storm = storm
+        result.sc = sc
+        result.area_acre = area_acre
+        result.imp_area = imp_area
+        result.perv_area = perv_area
+        result.imp_vol = imp_vol
+        result.infil = infil
+        result.per_vol = per_vol
+        result.runoff = runoff
+        return result
+
+    @staticmethod
+    def infiltration(f0, k, fc, t):
+        """
+        Calculate total water infiltration using Horntons eq
+        :param f0: initial infiltration rate (in/hr)
+        :param k: decay rate (1/sec):
+        :param fc: final infiltration rate (in/hr):
+        :param t: storm time (secs)
+        :return: total infilitration for storm (in)
+        """
+        t_hr = t/(60.0*60.0)  # convert to hrs
+        k_hr = k*(60.0*60.0)  # convert 1/sec to 1/hr
+        infil = fc*t_hr + ((f0-fc)/k_hr)*(1-math.e**(-k_hr*t_hr))
+        return infil
+    
+    @staticmethod
+    def header():
+        """ header for __str__() in csv """
+        return 'area_acre,imp_area,perv_area,imp_vol,infil,per_vol,runoff'
+
+    def __str__(self):
+        s = str(self.sc) + ','
+        s += str(self.storm) + ','
+        s += str(self.area_acre) + ','
+        s += str(self.imp_area) + ','
+        s += str(self.perv_area) + ','
+        s += str(self.imp_vol) + ','
+        s += str(self.infil) + ','
+        s += str(self.per_vol) + ','
+        s += str(self.runoff) 
+        return s
+
+
+def sc_column(subcatches, attr):
+    """
+    :param subcatches: list of Subcatchment objects
+    :param attr: name of Subcatchment attribute
+    :return: array of attr for subcatches with shape (number of subcatches, 1)
+    """
+    return np.array([getattr(sc, attr) for sc in subcatches], dtype=float)[:, np.newaxis]
+
+
+def areas(area, imperv):
+    """
+    :param area: array of subcatchment areas (sq miles)
+    :param imperv: array of imperviousness (percent)
+    :return: arrays of total, impervious and pervious area (acres), same as RunOff
+    """
+    area_acre = area * 640.0
+    imp_area = area_acre * imperv/100.0
+    perv_area = area_acre - imp_area
+    return area_acre, imp_area, perv_area
+
+
+def sc_areas(subcatches):
+    """
+    :param subcatches: list of Subcatchment objects
+    :return: arrays of total, impervious and pervious area (acres), same as RunOff, shape (number of subcatches, 1)
+    """
+    return areas(sc_column(subcatches, 'area'), sc_column(subcatches, 'imperv'))
+
+
+def lumped_volumes(storms, imp_area, perv_area, depress_stor_perv, depress_stor_imperv, horton_init, horton_decay,
+                   horton_final):
+    """
+    RunOff equations for arrays of subcatchment parameters. Parameters have shape (number of subcatchments, 1), units
+    are the same as Subcatchment
+    :param storms: StormTable object
+    :return: impervious volume (ac-ft), infiltration (inches), pervious volume (ac-ft), arrays with shape
+        (number of subcatchments, number of storms)
+    """
+    imp_vol = imp_area * (storms.total_rain - depress_stor_imperv) / 12.0  # ac-ft
+    infil = RunOff.infiltration(horton_init, horton_decay, horton_final, storms.length)  # inches
+    per_vol = perv_area * (storms.total_rain - depress_stor_perv - infil) / 12.0  # ac-ft
+
+    # Make sure nothing is below zero
+    imp_clipped = imp_vol < 0.0
+    per_clipped = per_vol < 0.0
+    imp_vol[imp_clipped] = 0.0
+    per_vol[per_clipped] = 0.0
+    if instrument.enabled:
+        count('imp_vol_clipped', np.count_nonzero(imp_clipped))
+        count('per_vol_clipped', np.count_nonzero(per_clipped))
+    return imp_vol, infil, per_vol
+
+
+class BatchRunOff(object):
+    def __init__(self, storms, subcatches):
+        """
+        Calculates runoff for every storm and subcatchment (sc) pair at once. Uses the same equations as RunOff but
+        with array operations over the whole subcatchment x storm matrix. Rows are subcatchments, columns are storms.
+        RunOff objects are only created when asked for, see result() and __iter__()
+        :param storms: StormTable object
+        :param subcatches: list of Subcatchment objects
+        """
+        self.storms = storms
+        self.subcatches = subcatches
+
+        with stage('runoff', len(storms) * len(subcatches)):
+            self.area_acre, self.imp_area, self.perv_area = sc_areas(subcatches)
+            self.imp_vol, self.infil, self.per_vol = lumped_volumes(storms, self.imp_area, self.perv_area,
+                                                                    sc_column(subcatches, 'depress_stor_perv'),
+                                                                    sc_column(subcatches, 'depress_stor_imperv'),
+                                                                    sc_column(subcatches, 'horton_init'),
+                                                                    sc_column(subcatches, 'horton_decay'),
+                                                                    sc_column(subcatches, 'horton_final'))
+
+            # Total runoff
+            self.runoff = self.imp_vol + self.per_vol  # ac-ft
+        self._count()
+
+    def _count(self):
+        """ Count results with no pervious runoff, see instrument.py """
+        if instrument.enabled:
+            count('pairs', self.runoff.size)
+            count('zero_per_vol', np.count_nonzero(self.per_vol == 0.0))
+
+    def adjust(self, factors):
+        """
+        Multiply runoff for each subcatchment by its correction factor, see adjust_volume()
+        :param factors: dict of adjustment factors, keys are subcatchment names
+        """
+        self.runoff *= np.array([factors[sc.name] for sc in self.subcatches], dtype=float)[:, np.newaxis]
+
+    def result(self, i, j):
+        """
+        :param i: index of subcatchment
+        :param j: index of storm
+        :return: RunOff object for subcatchment i and storm j
+        """
+        return RunOff.from_values(self.storms[j], self.subcatches[i], float(self.area_acre[i, 0]),
+                                  float(self.imp_area[i, 0]), float(self.perv_area[i, 0]), float(self.imp_vol[i, j]),
+                                  float(self.infil[i, j]), float(self.per_vol[i, j]), float(self.runoff[i, j]))
+
+    def __len__(self):
+        return self.runoff.size
+
+    def __iter__(self):
+        """ RunOff objects in the same order as looping over subcatchments, then storms """
+        for i in range(len(self.subcatches)):
+            for j in range(len(self.storms)):
+                yield self.result(i, j)
+
+
+class SteppedRunOff(BatchRunOff):
+    def __init__(self, storms, subcatches):
+        """
+        Same as BatchRunOff but hortons infiltration and depression storage are stepped through each storm's
+        hyetograph instead of applied to the whole storm at once, see horton.py. infil is the depth actually
+        infiltrated, not the infiltration capacity for the storm length
+        :param storms: StormTable object
+        :param subcatches: list of Subcatchment objects
+        """
+        self.storms = storms
+        self.subcatches = subcatches
+
+        with stage('runoff_stepped', len(storms) * len(subcatches)):
+            self.area_acre, self.imp_area, self.perv_area = sc_areas(subcatches)
+            imp_depth, perv_depth, self.infil = horton_steps(storms, sc_column(subcatches, 'horton_init'),
+                                                             sc_column(subcatches, 'horton_decay'),
+                                                             sc_column(subcatches, 'horton_final'),
+                                                             sc_column(subcatches, 'depress_stor_perv'),
+                                                             sc_column(subcatches, 'depress_stor_imperv'))
+            self.imp_vol = self.imp_area * imp_depth / 12.0  # ac-ft
+            self.per_vol = self.perv_area * perv_depth / 12.0  # ac-ft
+            self.runoff = self.imp_vol + self.per_vol  # ac-ft
+        self._count()
+
+
+def compare_modes(lumped, stepped):
+    """
+    Print total runoff by subcatchment for lumped (BatchRunOff) and stepped (SteppedRunOff) runoff in csv format
+    :param lumped: BatchRunOff object
+    :param stepped: SteppedRunOff object for the same storms and subcatchments
+    """
+    print 'subcatch_id,lumped_imp_vol,stepped_imp_vol,lumped_per_vol,stepped_per_vol,lumped_runoff,stepped_runoff,' \
+          'lumped_perv_storms,stepped_perv_storms'
+    for i, sc in enumerate(lumped.subcatches):
+        volumes = [lumped.imp_vol[i].sum(), stepped.imp_vol[i].sum(), lumped.per_vol[i].sum(),
+                   stepped.per_vol[i].sum(), lumped.runoff[i].sum(), stepped.runoff[i].sum()]
+        counts = [(lumped.per_vol[i] > 0.0).sum(), (stepped.per_vol[i] > 0.0).sum()]
+        print sc.name + ',' + ','.join(str(value) for value in np.array(volumes).tolist() + np.array(counts).tolist())
+
+
+def iter_runoff(rainfile, subcatches, size=1000):
+    """
+    Calculate runoff for rainfile a block of storms at a time, so long rain records don't have to be loaded at once
+    :param rainfile: csv file of storm events, see rain.py
+    :param subcatches: list of Subcatchment objects
+    :param size: number of storms per block
+    :return: generator of BatchRunOff objects
+    """
+    for storms in iter_storm_tables(rainfile, size):
+        yield BatchRunOff(storms, subcatches)
+
+
+def import_factors(adjust_file):
+    """
+    Import runoff adjustment factors, see adjust_volume()
+    :param adjust_file: file name of csv file with adjustments in "sc_name,adjust_factor" format
+    :return: dict of adjustment factors, keys are subcatchment names
+    """
+    factors = {}
+    with open(adjust_file) as infile:
+        for line in infile:
+            fields = line.strip().split(',')
+            factors[fields[0]] = float(fields[1])
+    return factors
+
+
+def adjust_volume(results, adjust_file):
+    """
+    Reduce runoff volumes in results based on adjust_file. This is based on subcatchment names
+
+    It was discovered that for most rainfall events there was a discrepancy
+    between runoff volumes calculated in RunOff versus CUHP. This was spot
+    checked for three events of varying lengths. For a given subcatchment the
+    discrepancy was a constant ratio* regardless of the storm event, with
+    greater discrepancies for subcatchments with less impervious area. This
+    appears to be due to RunOff assuming all impervious area is directly
+    connected. A list of correction factors to bring runoff in line with CUHP
+    was therefore created and implemented in this function.
+
+    * The discrepancy is only constant for rainstorms that generate no runoff
+    from pervious areas. The majority of events in the rain data are fall in
+    this catagory. While a couple of rainstorms are intense enough to generate
+    runoff from pervious areas, there are so few it was assumed they could
+    safely be ignored. Additionally, the tested "intense" storm (20080611) had
+    a "corrected" discrepancy of 20% on average, which was considered to be
+    within acceptable margins of error.
+
+    :param results: list of RunOff objects or BatchRunOff object
+    :param adjust_file: file name of csv file with adjustments in "sc_name,adjust_factor" format
+    """
+    factors = import_factors(adjust_file)
+
+    # Adjust
+    with stage('adjust_volume', len(results)):
+        if hasattr(results, 'adjust'):
+            results.adjust(factors)
+            return
+        for result in results:
+            result.runoff = result.runoff * factors[result.sc.name]
+
+
+def main(mode='lumped', columns=None, out=None, out_format='csv', store=None):
+    """
+    :param mode: 'lumped' applies hortons eq to the whole storm, 'stepped' steps through the hyetograph, 'compare'
+        prints total runoff for both
+    :param columns: list of output columns, default is all, see writer.py
+    :param out: output file name, default is stdout (csv only)
+    :param out_format: 'csv' or 'binary'
+    :param store: result store folder, if given only storms and subcatchments not already in the store are calculated
+        and monthly average runoff is printed, see incremental.py
+    """
+    from writer import write_csv, write_binary
+    from threshold import ThresholdRunOff
+    from incremental import update
+
+    rainfile = 'csv/more_rain2.csv'
+    paramfile = 'csv/hlc_sc_combined.csv'
+    adjust_file = 'csv/adjust.csv'
+
+    subcatches = load_params(paramfile)
+    storms = load_storms(rainfile)
+
+    if mode == 'compare':
+        compare_modes(BatchRunOff(storms, subcatches), SteppedRunOff(storms, subcatches))
+        return
+    if store:
+        stats, _ = update(store, storms, subcatches, import_factors(adjust_file), mode)
+        stats.print_average_runoff()
+        return
+    if mode == 'stepped':
+        results = SteppedRunOff(storms, subcatches)
+    else:
+        results = ThresholdRunOff(storms, subcatches)
+    adjust_volume(results, adjust_file)
+    
+    # print all output data
+    if True:
+        if out_format == 'binary':
+            write_binary(results, out, columns)
+        elif out:
+            with open(out, 'wt') as outfile:
+                write_csv(results, outfile, columns)
+        else:
+            write_csv(results, sys.stdout, columns)
+    
+    # print monthly average runoff for each subcatchment
+    if not True:
+        stats = Stats(results)
+        #stats.print_vals()
+        stats.print_average_runoff()
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mode', choices=['lumped', 'stepped', 'compare'], default='lumped',
+                        help='how hortons infiltration is applied to each storm (default: lumped)')
+    parser.add_argument('--columns', help='comma separated list of output columns (default: all)')
+    parser.add_argument('--format', choices=['csv', 'binary'], default='csv', help='output format (default: csv)')
+    parser.add_argument('--out', help='output file (default: stdout, required for binary)')
+    parser.add_argument('--incremental', metavar='STORE',
+                        help='only calculate storms and subcatchments not in STORE, print monthly average runoff')
+    parser.add_argument('--report', metavar='FILE',
+                        help='write time, rows and peak memory of each stage and counters to FILE as json')
+    args = parser.parse_args()
+    if args.format == 'binary' and not args.out:
+        parser.error('--out is required for binary output')
+    if args.report:
+        instrument.enable()
+    main(args.mode, args.columns.split(',') if args.columns else None, args.out, args.format, args.incremental)
+    if args.report:
+        instrument.write_report(args.report)
@@ -1,358 +1,586 @@
-"""
-Imports, parse and exports raingages in the updaed project format. Cumulative time and rainfall are in columns O & P.
-"""
-from time import mktime, strptime
-from datetime import datetime
-from calendar import month_name
-
-
-class RainEvent(object):
-    def __init__(self, lines):
-        """
-        :param lines: list of lines of rain event info in the project format w/o the header
-        """
-        self.id = None  # Storm id in format '9/23/2015-0:21:02', where date time is the start of the storm
-        self.total_rain = 0  # total rain during event in inches
-        self.length = None  # length of storm in seconds
-        self.storm_start = None  # start date/time of storm in datetime.datetime format
-        self.values = [(0,0)]  # list of cumulative (time, rainfall) data points as tuples (minutes, inches)
-
-        if len(lines) == 1:
-            # One line storm
-            fields = lines[0].strip().split(',')
-            self.id = fields[0]+'-'+fields[1]
-            temp_time = strptime(self.id, '%m/%d/%Y-%H:%M:%S')
-            self.storm_start = datetime.fromtimestamp(mktime(temp_time))
-            self.total_rain = float(fields[3])
-            self.length = 5*60  # One line storm, default to 5 minutes
-            self.values.append((fields[14], fields[15]))
-        else:
-            # Multi-line storm - First line is end of storm
-            fields = lines[0].strip().split(',')
-            self.id = fields[0]+'-'+fields[1]
-            temp = strptime(fields[0]+'-'+fields[1], '%m/%d/%Y-%H:%M:%S')
-            self.storm_start = datetime.fromtimestamp(mktime(temp))
-
-            # burn through lines, check total rain calc
-            temp_rain = 0.0
-            for line in lines:
-                fields = line.strip().split(',')
-                temp_rain += float(fields[3])
-                self.values.append((fields[14], fields[15]))
-
-            # Last line is end of storm, convert to seconds
-            self.length = float(fields[14]) * 60.0
-            self.total_rain = float(fields[15])
-            assert abs(self.total_rain-temp_rain) < 0.001
-
-        #print self.id, self.total_rain, self.length, self.storm_start
-        #print self.id, self.values
-
-    @staticmethod
-    def header():
-        return 'storm_id,month,year,total_rain,time'
-
-    def __str__(self):
-        s = self.id + ','
-        s += str(self.storm_start.month) + ','
-        s += str(self.storm_start.year) + ','
-        s += str(self.total_rain) + ','
-        s += str(self.length)
-        return s
-
-
-def import_storms(filename):
-    """
-    Import storm events from filename (see format at top of this file). Header is ignored if present
-    :param filename: csv file of storm events
-    :return: list of RainEvent() objects
-    """
-    with open(filename, 'rt') as infile:
-        storms = []  # holds all RainEvent instances
-        lines = []
-        for line in infile:
-            fields = line.strip().split(',')
-
-            # Ignore header if it exists
-            if fields[0] == 'Date':
-                continue
-
-            # value of 0 in line 14 means new storm
-            if fields[0] == '':
-                # Look out for double blanks
-                if lines:
-                    temp = RainEvent(lines)
-                    storms.append(temp)
-                    lines = []
-            else:
-                lines.append(line.strip())
-        temp = RainEvent(lines)
-        storms.append(temp)
-    return storms
-
-
-def monthly_rain(storms):
-    """
-    calculate total rainfall by month and year
-    :param storms: list of RainEvent objects
-    """
-    # Tally rainfall by month and year
-    years = {}
-    for storm in storms:
-        this_month = storm.storm_start.month
-        this_year = storm.storm_start.year
-        rain = storm.total_rain
-
-        # Check for existence of year in dict
-        if this_year in years:
-            # Check for existance of month in dict
-            if this_month in years[this_year]:
-                # already exists, append
-                years[this_year][this_month] += rain
-            else:
-                # doesn't exist, create
-                years[this_year][this_month] = rain
-        else:
-            # doesn't exist, create year and month
-            years[this_year] = {}
-            years[this_year][this_month] = rain
-
-    # Months to print out records for (jan = 1)
-    start_month = 4
-    end_month = 10
-
-    # print header
-    s = 'Year'
-    for month in range(start_month, end_month+1):
-        s += ',' + month_name[month]
-    print s
-
-    # print monthly data
-    year_keys = sorted(years.keys())
-    for year in year_keys:
-        s = str(year)
-        for month in range(start_month, end_month+1):
-            if month in years[year]:
-                s += ',' + str(years[year][month])
-            else:
-                s += ',0.0'
-        print s
-
-
-def monthly_events(storms):
-    """
-    calculate number of rainfall events by month and year
-    :param storms: list of RainEvent objects
-    """
-    # Tally rainfall events by month and year
-    years = {}
-    for storm in storms:
-        this_month = storm.storm_start.month
-        this_year = storm.storm_start.year
-        rain = storm.total_rain
-
-        # Check for existence of year in dict
-        if this_year in years:
-            # Check for existance of month in dict
-            if this_month in years[this_year]:
-                # already exists, append
-                years[this_year][this_month] += 1
-            else:
-                # doesn't exist, create
-                years[this_year][this_month] = 1
-        else:
-            # doesn't exist, create year and month
-            years[this_year] = {}
-            years[this_year][this_month] = 1
-
-    # Months to print out records for (jan = 1)
-    start_month = 4
-    end_month = 10
-
-    # print header
-    s = 'Year'
-    for month in range(start_month, end_month+1):
-        s += ',' + month_name[month]
-    print s
-
-    # print monthly data
-    year_keys = sorted(years.keys())
-    for year in year_keys:
-        s = str(year)
-        for month in range(start_month, end_month+1):
-            if month in years[year]:
-                s += ',' + str(years[year][month])
-            else:
-                s += ',0'
-        print s
-
-def monthly_storm_length(storms):
-    """
-    calculate total length of storms in a month by month and year
-    :param storms: list of RainEvent objects
-    """
-    # Tally rainfall events by month and year
-    years = {}
-    for storm in storms:
-        this_month = storm.storm_start.month
-        this_year = storm.storm_start.year
-        rain = storm.total_rain
-
-        # Check for existence of year in dict
-        if this_year in years:
-            # Check for existance of month in dict
-            if this_month in years[this_year]:
-                # already exists, append
-                years[this_year][this_month] += storm.length
-            else:
-                # doesn't exist, create
-                years[this_year][this_month] = storm.length
-        else:
-            # doesn't exist, create year and month
-            years[this_year] = {}
-            years[this_year][this_month] = storm.length
-
-    # Months to print out records for (jan = 1)
-    start_month = 4
-    end_month = 10
-
-    # print header
-    s = 'Year'
-    for month in range(start_month, end_month+1):
-        s += ',' + month_name[month]
-    print s
-
-    # print monthly data
-    year_keys = sorted(years.keys())
-    for year in year_keys:
-        s = str(year)
-        for month in range(start_month, end_month+1):
-            if month in years[year]:
-                s += ',' + str(years[year][month])
-            else:
-                s += ',0'
-        print s
-
-def plot_hyeto_by_year(storms, start=1998, end=2015):
-    """
-    Plot all storms by year and save a figure for every year
-    """
-    def load_2_year(filename):
-        """
-        Imports design storm from csv and returns x coorids in lists and y coords in list
-        """
-        first_lap = True
-        x = []; y = []
-        
-        with open(filename, 'rt') as infile:
-            for line in infile:
-                # Strip two line header
-                if first_lap:
-                    line = next(infile)
-                    line = next(infile)
-                    first_lap = False
-
-                fields = line.strip().split(',')
-                x.append(float(fields[0]))
-                y.append(float(fields[2]))
-        return x, y
-
-    from matplotlib import pyplot, axes
-
-    design_x, design_y = load_2_year('csv/2-Year Design Storm.csv')
-
-    max_rain = max_rain_rainfall(storms)
-    for year in range(start, end+1):
-        print 'processing', year
-        events = 0
-        total_rain = 0
-        for storm in storms:
-            if storm.storm_start.year == year:
-                #print storm.values
-                events += 1
-                total_rain += storm.total_rain
-                x = []
-                y = []
-                for value in storm.values:
-                    x.append(value[0])
-                    y.append(value[1])
-                pyplot.plot(x,y)
-        # add design storm
-        pyplot.plot(design_x, design_y, color='red', linewidth=2)
-        xy = (design_x[-1], design_y[-1]+0.05)
-        pyplot.annotate('2-Yr Design\nStorm', xy=xy)
-
-        # set axis
-        x1,x2,y1,y2 = pyplot.axis()
-        pyplot.axis((x1,x2,0,max_rain))
-        #import pdb; pdb.set_trace()
-        
-#        title = str(year) + ', # of Storms = ' + str(events) + ', Cumulative Rainfall (in) = ' + \ 
-#                str(total_rain)
-        title = '{}, # of Storms = {}, Cumulative Rainfall (in) = {}'.format(year, events, total_rain)
-        
-        pyplot.title(title)
-        pyplot.xlabel('Time since start of storm (minutes)')
-        pyplot.ylabel('Cumulative rainfall (inches)')
-
-
-        pyplot.savefig(str(year)+'.pdf')
-        pyplot.clf()  # Clear figure
-        print events, 'storms in ', year, 'total rain', total_rain
-
-def plot_hyeto_by_month(storms):
-    """
-    Plot all storms by month
-    """
-    from matplotlib import pyplot
-    i = 0
-    for month in range(4, 10+1):
-        for storm in storms:
-            if storm.storm_start.month == month:
-                #print storm.values
-                i += 1
-                x = []
-                y = []
-                for value in storm.values:
-                    x.append(value[0])
-                    y.append(value[1])
-                pyplot.plot(x,y)
-        pyplot.title(month_name[month])
-        pyplot.show()
-        print i, 'storms in ', month_name[month]
-
-def max_rain_rainfall(storms):
-    """
-    Returns single createst stormfall total from storms
-    """
-    max_rain = 0
-    for storm in storms:
-        if storm.total_rain > max_rain:
-            max_rain = storm.total_rain
-    assert max_rain != 0
-    return max_rain
-
-def main():
-    filename = 'csv/more_rain2.csv'
-    print 'importing storms'
-    storms = import_storms(filename)
-    print 'number of events=', len(storms)
-
-    #monthly_rain(storms)
-    #monthly_events(storms)
-    max_rain = max_rain_rainfall(storms)
-    print max_rain
-    monthly_storm_length(storms)
-
-    biggest = storms[0]
-    for storm in storms:
-        if storm.total_rain > biggest.total_rain:
-            biggest = storm
-
-    print biggest
-
-    
-    plot_hyeto_by_year(storms)
-
-if __name__ == '__main__':
-    main()
+"""
+Imports, parse and exports raingages in the updaed project format. Cumulative time and rainfall are in columns O & P.
+"""
+from datetime import date, datetime
+from calendar import month_name
+from itertools import islice
+import numpy as np
+
+from instrument import stage
+
+ONE_LINE_LENGTH = 5*60  # One line storms default to 5 minutes (seconds)
+
+
+class StormTable(object):
+    def __init__(self, start, total_rain, length, offsets, times, rains, ids=None):
+        """
+        All storm events stored as columns. Cumulative (time, rainfall) points of every storm are stored end to end in
+        times and rains, the points for storm i are times[offsets[i]:offsets[i+1]]. Each storm's points begin with (0, 0)
+        Indexing or looping over the table returns RainEvent objects.
+        :param start: start date/time of storms in seconds since 1/1/1970 (no timezone)
+        :param total_rain: total rain during storms in inches
+        :param length: length of storms in seconds
+        :param offsets: index of first point of each storm in times and rains, plus total number of points at the end
+        :param times: cumulative time of points (minutes)
+        :param rains: cumulative rainfall of points (inches)
+        :param ids: storm ids as written in the file, see RainEvent.id. None to make them from start
+        """
+        self.start = np.asarray(start, dtype=np.int64)
+        self.total_rain = np.asarray(total_rain, dtype=float)
+        self.length = np.asarray(length, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.times = np.asarray(times, dtype=float)
+        self.rains = np.asarray(rains, dtype=float)
+        self.ids = np.asarray(ids, dtype=str) if ids is not None else None
+
+        # year and month of storm starts, for grouping
+        start_dt = self.start.astype('M8[s]')
+        self.year = start_dt.astype('M8[Y]').astype(int) + 1970
+        self.month = start_dt.astype('M8[M]').astype(int) % 12 + 1
+
+    def points(self, i):
+        """
+        :param i: index of storm
+        :return: arrays of cumulative time (minutes) and rainfall (inches) for storm i
+        """
+        first, last = self.offsets[i], self.offsets[i+1]
+        return self.times[first:last], self.rains[first:last]
+
+    def take(self, indexes):
+        """
+        :param indexes: array of storm indexes
+        :return: StormTable of only those storms
+        """
+        indexes = np.asarray(indexes, dtype=int)
+        counts = self.offsets[indexes+1] - self.offsets[indexes]
+        offsets = np.zeros(len(indexes)+1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        points = np.repeat(self.offsets[indexes] - offsets[:-1], counts) + np.arange(offsets[-1])
+        return StormTable(self.start[indexes], self.total_rain[indexes], self.length[indexes], offsets,
+                          self.times[points], self.rains[points], self.ids[indexes] if self.ids is not None else None)
+
+    def tips(self):
+        """ number of rain gage lines in each storm """
+        return np.diff(self.offsets) - 1
+
+    def __len__(self):
+        return len(self.start)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('storm index out of range')
+        return RainEvent(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield RainEvent(self, i)
+
+
+class RainEvent(object):
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        """
+        View of a single storm in a StormTable
+        :param table: StormTable object
+        :param index: index of storm in table
+        """
+        self.table = table
+        self.index = index
+
+    @property
+    def id(self):
+        """
+        Storm id in format '9/23/2015-0:21:02', where date time is the start of the storm. The date and time are as
+        written in the file, storms without them (e.g. from separate_events() without ids) use this format
+        """
+        if self.table.ids is not None:
+            return str(self.table.ids[self.index])
+        d = self.storm_start
+        return '{}/{}/{}-{}:{:02d}:{:02d}'.format(d.month, d.day, d.year, d.hour, d.minute, d.second)
+
+    @property
+    def total_rain(self):
+        """ total rain during event in inches """
+        return float(self.table.total_rain[self.index])
+
+    @property
+    def length(self):
+        """ length of storm in seconds """
+        if self.table.offsets[self.index+1] - self.table.offsets[self.index] == 2:
+            return ONE_LINE_LENGTH
+        return float(self.table.length[self.index])
+
+    @property
+    def storm_start(self):
+        """ start date/time of storm in datetime.datetime format """
+        return datetime.utcfromtimestamp(self.table.start[self.index])
+
+    @property
+    def year(self):
+        return int(self.table.year[self.index])
+
+    @property
+    def month(self):
+        return int(self.table.month[self.index])
+
+    @property
+    def values(self):
+        """ list of cumulative (time, rainfall) data points as tuples (minutes, inches) """
+        times, rains = self.table.points(self.index)
+        return zip(times.tolist(), rains.tolist())
+
+    @staticmethod
+    def header():
+        return 'storm_id,month,year,total_rain,time'
+
+    def __str__(self):
+        s = self.id + ','
+        s += str(self.month) + ','
+        s += str(self.year) + ','
+        s += str(self.total_rain) + ','
+        s += str(self.length)
+        return s
+
+
+_EPOCH = date(1970, 1, 1).toordinal()
+_days = {}  # days since 1/1/1970 for date fields already decoded
+
+
+def decode_start(date_field, time_field):
+    """
+    Fast decode of date and time fields in the project format, e.g. '4/21/1998' and '13:58:26'
+    :return: seconds since 1/1/1970 (no timezone)
+    """
+    days = _days.get(date_field)
+    if days is None:
+        month, day, year = date_field.split('/')
+        days = _days[date_field] = date(int(year), int(month), int(day)).toordinal() - _EPOCH
+    hour, minute, second = time_field.split(':')
+    return days*86400 + int(hour)*3600 + int(minute)*60 + int(second)
+
+
+def iter_storms(filename):
+    """
+    Parse storm events from filename (see format at top of this file) one storm at a time. Each line is only split
+    once and only the current storm is held in memory. Header is ignored if present, blank lines separate storms
+    :param filename: csv file of storm events
+    :return: generator of (start, total_rain, length, points, id) for each storm. start is seconds since 1/1/1970, total
+        rain is inches, length is seconds, points is list of cumulative (time, rainfall) tuples (minutes, inches), id
+        is the date and time fields of the first line, see RainEvent.id
+    """
+    def end_of_storm():
+        if len(points) == 2:
+            # One line storm
+            return start, first_rain, ONE_LINE_LENGTH, points, storm_id
+        # Multi-line storm, last line is end of storm, convert to seconds
+        length = points[-1][0] * 60.0
+        total_rain = points[-1][1]
+        assert abs(total_rain-temp_rain) < 0.001
+        return start, total_rain, length, points, storm_id
+
+    with open(filename, 'rt') as infile:
+        start = None
+        for line in infile:
+            fields = line.strip().split(',')
+
+            # Ignore header if it exists
+            if fields[0] == 'Date':
+                continue
+
+            # blank date means new storm
+            if fields[0] == '':
+                # Look out for double blanks
+                if start is not None:
+                    yield end_of_storm()
+                    start = None
+                continue
+
+            rain = float(fields[3])
+            if start is None:
+                # First line of storm
+                start = decode_start(fields[0], fields[1])
+                storm_id = fields[0] + '-' + fields[1]
+                first_rain = rain
+                temp_rain = 0.0
+                points = [(0.0, 0.0)]
+            temp_rain += rain
+            points.append((float(fields[14]), float(fields[15])))
+
+        if start is not None:
+            yield end_of_storm()
+
+
+def make_table(events):
+    """
+    Build StormTable from parsed events
+    :param events: iterable of (start, total_rain, length, points, id) as returned by iter_storms()
+    :return: StormTable object
+    """
+    start = []; total_rain = []; length = []
+    offsets = [0]
+    times = []; rains = []
+    ids = []
+    for event in events:
+        start.append(event[0])
+        total_rain.append(event[1])
+        length.append(event[2])
+        for time, rain in event[3]:
+            times.append(time)
+            rains.append(rain)
+        offsets.append(len(times))
+        ids.append(event[4])
+    return StormTable(start, total_rain, length, offsets, times, rains, ids)
+
+
+def import_storms(filename):
+    """
+    Import storm events from filename (see format at top of this file). Header is ignored if present
+    :param filename: csv file of storm events
+    :return: StormTable object
+    """
+    with stage('import_storms') as s:
+        storms = make_table(iter_storms(filename))
+        s.rows = len(storms)
+    return storms
+
+
+def iter_storm_tables(filename, size=1000):
+    """
+    Import storm events from filename in blocks, for files too large to hold in memory at once
+    :param filename: csv file of storm events
+    :param size: number of storms per block
+    :return: generator of StormTable objects with up to size storms each
+    """
+    storms = iter_storms(filename)
+    while True:
+        table = make_table(islice(storms, size))
+        if not len(table):
+            return
+        yield table
+
+
+def import_tips(filename):
+    """
+    Import raw rain gage lines, e.g. csv/Archive/more_rain.csv. Only the date, time and rain increment (first, second
+    and fourth columns) are used. Lines may be in any order, header and lines without a date are ignored
+    :param filename: csv file of rain gage lines
+    :return: arrays of time (seconds since 1/1/1970, no timezone), rain (inches) and id (date and time fields as
+        written, see RainEvent.id) of each line, in time order
+    """
+    times = []
+    rains = []
+    ids = []
+    with open(filename, 'rt') as infile:
+        for line in infile:
+            fields = line.split(',', 4)
+            if fields[0] in ('Date', '') or fields[0].isspace():
+                continue
+            times.append(decode_start(fields[0], fields[1]))
+            rains.append(float(fields[3]))
+            ids.append(fields[0] + '-' + fields[1])
+    times = np.array(times, dtype=np.int64)
+    rains = np.array(rains, dtype=float)
+    ids = np.array(ids, dtype=str)
+    order = np.argsort(times, kind='mergesort')
+    return times[order], rains[order], ids[order]
+
+
+def separate_events(times, rains, min_dry=6*60*60, min_rain=0.0, ids=None):
+    """
+    Split rain gage lines into storms. A new storm starts after a dry period (no rain) of at least min_dry. Cumulative
+    time and rain of each storm are calculated the same way as columns N - P of the project format: time since the
+    first line rounded to 0.01 minutes plus 5 minutes, and rain rounded to 0.01 inches
+    :param times: array of time of each line (seconds since 1/1/1970), in order
+    :param rains: array of rain of each line (inches)
+    :param min_dry: shortest dry period between storms (seconds)
+    :param min_rain: storms with less total rain are dropped (inches)
+    :param ids: array of id of each line, the first line's is the storm id. None to make storm ids from the start
+    :return: StormTable object
+    """
+    wet = np.flatnonzero(np.asarray(rains) > 0.0)
+    times = np.asarray(times, dtype=np.int64)[wet]
+    hundredths = np.rint(np.asarray(rains, dtype=float)[wet] * 100.0).astype(np.int64)
+
+    # storm number of every line, and first line of every storm
+    new = np.ones(len(times), dtype=bool)
+    new[1:] = np.diff(times) >= min_dry
+    storm = np.cumsum(new) - 1
+    first = np.flatnonzero(new)
+    n_storms = len(first)
+
+    # Cumulative time (minutes) and rain (inches), done in hundredths so values are the same as parsing the csv
+    elapsed = np.rint((times - times[first][storm]) / 60.0 * 100.0).astype(np.int64)
+    total = np.cumsum(hundredths)
+    cumulative = total - (total[first] - hundredths[first])[storm]
+
+    # Points of every storm begin with (0, 0)
+    offsets = np.append(first, len(times)) + np.arange(n_storms+1)
+    points = np.arange(len(times)) + storm + 1
+    point_times = np.zeros(len(times) + n_storms)
+    point_rains = np.zeros(len(times) + n_storms)
+    point_times[points] = (elapsed + 500) / 100.0
+    point_rains[points] = cumulative / 100.0
+
+    # Same as iter_storms(), one line storms default to ONE_LINE_LENGTH
+    last = offsets[1:] - 1
+    one_line = np.diff(offsets) == 2
+    length = np.where(one_line, ONE_LINE_LENGTH, point_times[last] * 60.0)
+    storm_ids = np.asarray(ids)[wet][first] if ids is not None else None
+    storms = StormTable(times[first], point_rains[last], length, offsets, point_times, point_rains, storm_ids)
+    if min_rain > 0.0:
+        storms = storms.take(np.flatnonzero(storms.total_rain >= min_rain))
+    return storms
+
+
+def import_raw_storms(filename, min_dry=6*60*60, min_rain=0.0):
+    """
+    Import storm events from raw rain gage lines, see import_tips() and separate_events()
+    :param filename: csv file of rain gage lines
+    :param min_dry: shortest dry period between storms (seconds)
+    :param min_rain: storms with less total rain are dropped (inches)
+    :return: StormTable object
+    """
+    with stage('import_raw_storms') as s:
+        times, rains, ids = import_tips(filename)
+        storms = separate_events(times, rains, min_dry, min_rain, ids)
+        s.rows = len(storms)
+    return storms
+
+
+def peak_intensity(storms):
+    """
+    Greatest rainfall intensity between two cumulative points of each storm
+    :param storms: StormTable object
+    :return: array of intensities (in/hr)
+    """
+    dt = np.diff(storms.times)
+    dp = np.diff(storms.rains)
+    intensity = np.zeros(len(dt))
+    np.divide(dp, dt, out=intensity, where=dt > 0.0)
+    intensity[storms.offsets[1:-1] - 1] = 0.0  # steps between the end of one storm and the start of the next
+    if not len(storms):
+        return intensity
+    return np.maximum.reduceat(intensity, storms.offsets[:-1]) * 60.0
+
+
+# Rainfall reducers: name: (function returning one value per storm from a StormTable, aggregate, value printed for
+# months without storms). Aggregates are 'sum', 'count', 'min', 'max' and 'mean'
+REDUCERS = {
+    'rain': (lambda storms: storms.total_rain, 'sum', '0.0'),  # total rainfall (in)
+    'events': (None, 'count', '0'),  # number of storms
+    'length': (lambda storms: storms.length, 'sum', '0'),  # total length of storms (secs)
+    'max_rain': (lambda storms: storms.total_rain, 'max', '0.0'),  # largest storm (in)
+    'max_intensity': (peak_intensity, 'max', '0.0'),  # greatest intensity (in/hr)
+}
+
+
+class RainSummary(object):
+    def __init__(self, storms, reducers=('rain', 'events', 'length', 'max_rain', 'max_intensity'), start_month=4,
+                 end_month=10):
+        """
+        Summarize storms by year and month with every reducer in one pass over the storms
+        :param storms: StormTable object
+        :param reducers: names of reducers in REDUCERS
+        :param start_month: first month to summarize (jan = 1)
+        :param end_month: last month to summarize
+        """
+        self.months = range(start_month, end_month+1)
+        self.reducers = list(reducers)
+        years, year_index = np.unique(storms.year, return_inverse=True)
+        self.years = years.tolist()  # every year with storms
+
+        # Group every storm by year and month once
+        index = year_index*12 + storms.month - 1
+        size = len(self.years)*12
+        columns = np.array(self.months) - 1
+        self.counts = np.bincount(index, minlength=size).reshape(-1, 12)[:, columns]
+
+        self.values = {}  # arrays of value by year and month for each reducer, shape (years, months)
+        for name in self.reducers:
+            column, aggregate, _ = REDUCERS[name]
+            if aggregate == 'count':
+                value = np.bincount(index, minlength=size).astype(int)
+            elif aggregate in ('sum', 'mean'):
+                value = np.bincount(index, column(storms), minlength=size)
+            else:
+                value = np.full(size, np.inf if aggregate == 'min' else -np.inf)
+                getattr(np, 'minimum' if aggregate == 'min' else 'maximum').at(value, index, column(storms))
+            value = value.reshape(-1, 12)[:, columns]
+            if aggregate == 'mean':
+                value = value / np.maximum(self.counts, 1)
+            value[self.counts == 0] = 0
+            self.values[name] = value
+
+    def print_table(self, name):
+        """
+        Print one reducer by year and month in csv format with header
+        :param name: name of reducer
+        """
+        # print header
+        s = 'Year'
+        for month in self.months:
+            s += ',' + month_name[month]
+        print s
+
+        # print monthly data
+        missing = REDUCERS[name][2]
+        for year, counts, values in zip(self.years, self.counts.tolist(), self.values[name].tolist()):
+            s = str(year)
+            for count, value in zip(counts, values):
+                if count:
+                    s += ',' + str(value)
+                else:
+                    s += ',' + missing
+            print s
+
+
+def monthly_rain(storms):
+    """
+    calculate total rainfall by month and year
+    :param storms: StormTable object
+    """
+    RainSummary(storms, ['rain']).print_table('rain')
+
+
+def monthly_events(storms):
+    """
+    calculate number of rainfall events by month and year
+    :param storms: StormTable object
+    """
+    RainSummary(storms, ['events']).print_table('events')
+
+
+def monthly_storm_length(storms):
+    """
+    calculate total length of storms in a month by month and year
+    :param storms: StormTable object
+    """
+    RainSummary(storms, ['length']).print_table('length')
+
+
+def load_design_storm(filename):
+    """
+    Imports design storm from csv and returns x coorids in lists and y coords in list
+    """
+    first_lap = True
+    x = []; y = []
+
+    with open(filename, 'rt') as infile:
+        for line in infile:
+            # Strip two line header
+            if first_lap:
+                line = next(infile)
+                line = next(infile)
+                first_lap = False
+
+            fields = line.strip().split(',')
+            x.append(float(fields[0]))
+            y.append(float(fields[2]))
+    return x, y
+
+
+def group_storms(storms, key):
+    """
+    Group storms in one pass
+    :param storms: StormTable object
+    :param key: array with a key for every storm, e.g. storms.year
+    :return: list of (key, array of storm indexes) tuples, in key order, storms in each group are in storm order
+    """
+    keys, index = np.unique(key, return_inverse=True)
+    order = np.argsort(index, kind='mergesort')
+    groups = np.split(order, np.cumsum(np.bincount(index, minlength=len(keys)))[:-1])
+    return zip(keys.tolist(), groups)
+
+
+def plot_hyeto_by_year(storms, start=1998, end=2015):
+    """
+    Plot all storms by year and save a figure for every year, see atlas.py to plot faster
+    :param storms: StormTable object
+    """
+    from matplotlib import pyplot, axes
+
+    design_x, design_y = load_design_storm('csv/2-Year Design Storm.csv')
+
+    max_rain = max_rain_rainfall(storms)
+    for year in range(start, end+1):
+        print 'processing', year
+        events = 0
+        total_rain = 0
+        for i in np.flatnonzero(storms.year == year):
+            events += 1
+            total_rain += float(storms.total_rain[i])
+            x, y = storms.points(i)
+            pyplot.plot(x,y)
+        # add design storm
+        pyplot.plot(design_x, design_y, color='red', linewidth=2)
+        xy = (design_x[-1], design_y[-1]+0.05)
+        pyplot.annotate('2-Yr Design\nStorm', xy=xy)
+
+        # set axis
+        x1,x2,y1,y2 = pyplot.axis()
+        pyplot.axis((x1,x2,0,max_rain))
+        #import pdb; pdb.set_trace()
+        
+#        title = str(year) + ', # of Storms = ' + str(events) + ', Cumulative Rainfall (in) = ' + \ 
+#                str(total_rain)
+        title = '{}, # of Storms = {}, Cumulative Rainfall (in) = {}'.format(year, events, total_rain)
+        
+        pyplot.title(title)
+        pyplot.xlabel('Time since start of storm (minutes)')
+        pyplot.ylabel('Cumulative rainfall (inches)')
+
+
+        pyplot.savefig(str(year)+'.pdf')
+        pyplot.clf()  # Clear figure
+        print events, 'storms in ', year, 'total rain', total_rain
+
+def plot_hyeto_by_month(storms):
+    """
+    Plot all storms by month, see atlas.py to plot faster
+    :param storms: StormTable object
+    """
+    from matplotlib import pyplot
+    i = 0
+    for month in range(4, 10+1):
+        for j in np.flatnonzero(storms.month == month):
+            i += 1
+            x, y = storms.points(j)
+            pyplot.plot(x,y)
+        pyplot.title(month_name[month])
+        pyplot.show()
+        print i, 'storms in ', month_name[month]
+
+def max_rain_rainfall(storms):
+    """
+    Returns single createst stormfall total from storms
+    :param storms: StormTable object
+    """
+    max_rain = float(storms.total_rain.max())
+    assert max_rain != 0
+    return max_rain
+
+def main():
+    from cache import load_storms
+    filename = 'csv/more_rain2.csv'
+    print 'importing storms'
+    storms = load_storms(filename)
+    print 'number of events=', len(storms)
+
+    #monthly_rain(storms)
+    #monthly_events(storms)
+    max_rain = max_rain_rainfall(storms)
+    print max_rain
+    monthly_storm_length(storms)
+
+    biggest = storms[int(np.argmax(storms.total_rain))]
+
+    print biggest
+
+    
+    plot_hyeto_by_year(storms)
+
+if __name__ == '__main__':
+    main()
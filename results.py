@@ -0,0 +1,142 @@
+"""
+Runoff results as an indexed table of columns instead of a list of RunOff objects.
+
+Every RunOff attribute is a column. Per pair columns (imp_vol, infil, per_vol, runoff) are (subcatchment, storm)
+arrays and per subcatchment columns (area_acre, imp_area, perv_area) have shape (subcatchment, 1), the same as
+BatchRunOff. Storms are ordered by month, then year, then start, so the storms of a month, or of a month in one year,
+are a contiguous range of columns and every selection by subcatchment, month and year is an array view found with a
+dict lookup, e.g. all storms for WQ114 in July:
+
+    table.select('runoff', sc='WQ114', month=7)
+"""
+import numpy as np
+
+from my_cuhp import BatchRunOff
+
+PAIR_COLUMNS = ('imp_vol', 'infil', 'per_vol', 'runoff')
+SC_COLUMNS = ('area_acre', 'imp_area', 'perv_area')
+
+
+class ResultTable(object):
+    def __init__(self, results):
+        """
+        :param results: BatchRunOff object (or subclass), see from_list() for lists of RunOff objects
+        """
+        self.subcatches = list(results.subcatches)
+        self.order = np.lexsort((results.storms.start, results.storms.year, results.storms.month))
+        self.storms = results.storms.take(self.order)  # StormTable ordered by month, year and start
+        for name in SC_COLUMNS:
+            setattr(self, name, np.asarray(getattr(results, name), dtype=float).reshape(-1, 1))
+        for name in PAIR_COLUMNS:
+            setattr(self, name, np.ascontiguousarray(getattr(results, name)[:, self.order], dtype=float))
+
+        # Indexes
+        self.sc_rows = dict((sc.name, i) for i, sc in enumerate(self.subcatches))  # row of each subcatchment
+        months, years = self.storms.month, self.storms.year
+        self.month_columns = {}  # columns of each month
+        self.month_year_columns = {}  # columns of each (month, year)
+        if len(self.storms):
+            first = np.flatnonzero(np.concatenate([[True], np.diff(months) != 0, [True]]))
+            for start, stop in zip(first[:-1].tolist(), first[1:].tolist()):
+                self.month_columns[int(months[start])] = slice(start, stop)
+            first = np.flatnonzero(np.concatenate([[True], (np.diff(months) != 0) | (np.diff(years) != 0), [True]]))
+            for start, stop in zip(first[:-1].tolist(), first[1:].tolist()):
+                self.month_year_columns[(int(months[start]), int(years[start]))] = slice(start, stop)
+        self._storm_columns = None
+
+    @classmethod
+    def from_list(cls, results):
+        """
+        :param results: list of RunOff objects for every subcatchment and storm pair, storms from one StormTable
+        :return: ResultTable object
+        """
+        sc_rows = {}
+        subcatches = []
+        storm_columns = {}
+        indexes = []
+        for result in results:
+            if result.sc.name not in sc_rows:
+                sc_rows[result.sc.name] = len(subcatches)
+                subcatches.append(result.sc)
+            if result.storm.index not in storm_columns:
+                storm_columns[result.storm.index] = len(indexes)
+                indexes.append(result.storm.index)
+        if len(results) != len(subcatches) * len(indexes):
+            raise ValueError('results must have every subcatchment and storm pair')
+
+        batch = BatchRunOff.__new__(BatchRunOff)
+        batch.subcatches = subcatches
+        batch.storms = results[0].storm.table.take(indexes) if results else None
+        shape = len(subcatches), len(indexes)
+        for name in SC_COLUMNS:
+            setattr(batch, name, np.zeros((shape[0], 1)))
+        for name in PAIR_COLUMNS:
+            setattr(batch, name, np.zeros(shape))
+        rows = np.array([sc_rows[result.sc.name] for result in results], dtype=int)
+        columns = np.array([storm_columns[result.storm.index] for result in results], dtype=int)
+        for name in SC_COLUMNS:
+            getattr(batch, name)[rows, 0] = [getattr(result, name) for result in results]
+        for name in PAIR_COLUMNS:
+            getattr(batch, name)[rows, columns] = [getattr(result, name) for result in results]
+        return cls(batch)
+
+    def rows(self, sc=None):
+        """
+        :param sc: subcatchment name, None for all
+        :return: row index or slice
+        """
+        if sc is None:
+            return slice(None)
+        try:
+            return self.sc_rows[sc]
+        except KeyError:
+            raise KeyError('unknown subcatchment ' + str(sc))
+
+    def columns(self, month=None, year=None):
+        """
+        :param month: month (jan = 1), None for all
+        :param year: year, None for all
+        :return: slice of columns, or array of columns for a year without a month (not a contiguous range)
+        """
+        if month is None and year is None:
+            return slice(None)
+        if month is None:
+            return np.flatnonzero(self.storms.year == year)
+        if year is None:
+            return self.month_columns.get(month, slice(0, 0))
+        return self.month_year_columns.get((month, year), slice(0, 0))
+
+    def select(self, column, sc=None, month=None, year=None):
+        """
+        :param column: name of a column
+        :param sc: subcatchment name, None for all
+        :param month: month (jan = 1), None for all
+        :param year: year, None for all
+        :return: array of values, a view unless year is given without month. 1-D for one subcatchment, 2-D
+            (subcatchment, storm) otherwise. Per subcatchment columns ignore month and year
+        """
+        values = getattr(self, column)
+        if column in SC_COLUMNS:
+            return values[self.rows(sc), 0]
+        return values[self.rows(sc), self.columns(month, year)]
+
+    def storm_column(self, storm_id):
+        """
+        :param storm_id: storm id, see RainEvent.id
+        :return: column of the storm
+        """
+        if self._storm_columns is None:
+            self._storm_columns = dict((storm.id, j) for j, storm in enumerate(self.storms))
+        return self._storm_columns[storm_id]
+
+    def adjust(self, factors):
+        """
+        Multiply runoff for each subcatchment by its correction factor, see my_cuhp.adjust_volume()
+        :param factors: dict of correction factors, keys are subcatchment names, or array with one per subcatchment
+        """
+        if isinstance(factors, dict):
+            factors = [factors[sc.name] for sc in self.subcatches]
+        self.runoff *= np.asarray(factors, dtype=float).reshape(-1, 1)
+
+    def __len__(self):
+        return self.runoff.size
@@ -0,0 +1,216 @@
+"""
+Run many what-if scenarios against one storm record and compare their monthly average runoff with the baseline.
+
+Scenarios are defined in a csv in "scenario,subcatch,param,value" format, header ignored if present. Each line
+changes one thing in a scenario, scenarios are run in order of first appearance:
+
+    more_imperv,*,imperv,*1.1            multiply imperv of every subcatchment by 1.1
+    wq129_built_out,WQ129,imperv,60      set imperv of WQ129 to 60
+    wq129_built_out,WQ129,factor,0.2     set the correction factor of WQ129 (see my_cuhp.adjust_volume())
+    split,,params,csv/hlc_subcatch.csv   use another subcatchment file
+    no_adjust,,adjust,none               use another correction factor file, or none
+
+Params are the Subcatchment attributes (see subcatch.PARAM_COLUMNS), imperv is capped at 100. Everything not changed
+comes from the baseline subcatchment and correction factor files, subcatchments without a correction factor use 1.
+Storms are parsed once. The subcatchments of every scenario are stacked into one subcatchment x storm batch and
+calculated a chunk of rows at a time, in worker processes if asked for. Monthly average runoff of every scenario is
+printed in csv format with the baseline's for the same subcatchment and the difference.
+"""
+import argparse
+import calendar
+import copy
+import multiprocessing
+import numpy as np
+
+from cache import load_storms, load_params
+from incremental import month_totals
+from my_cuhp import SteppedRunOff, import_factors
+from stats import Stats
+from subcatch import PARAM_COLUMNS
+from threshold import ThresholdRunOff, ThresholdIndex
+
+PARAMS = [attr for _, attr in PARAM_COLUMNS]
+BASELINE = 'baseline'
+
+_storms = None  # StormTable for worker processes
+_index = None  # ThresholdIndex for worker processes
+_mode = None  # 'lumped' or 'stepped' for worker processes
+
+
+def _init_worker(rainfile, mode):
+    global _storms, _index, _mode
+    _storms = load_storms(rainfile)
+    _index = ThresholdIndex(_storms)
+    _mode = mode
+
+
+def import_scenarios(filename):
+    """
+    :param filename: csv file in "scenario,subcatch,param,value" format
+    :return: list of (scenario name, list of (subcatch, param, value) changes), in order of first appearance
+    """
+    scenarios = []
+    changes = {}
+    with open(filename, 'rt') as infile:
+        for line in infile:
+            fields = [field.strip() for field in line.split(',')]
+            if len(fields) < 4 or fields[0] in ('', 'scenario'):
+                continue  # header or blank line
+            name, subcatch, param, value = fields[:4]
+            if param not in PARAMS + ['factor', 'params', 'adjust']:
+                raise ValueError('unknown param {} in scenario {}'.format(param, name))
+            if name not in changes:
+                changes[name] = []
+                scenarios.append((name, changes[name]))
+            changes[name].append((subcatch, param, value))
+    return scenarios
+
+
+def apply_value(old, value):
+    """
+    :param old: current value
+    :param value: new value, or '*x' to multiply the current value by x
+    :return: new value
+    """
+    if value.startswith('*'):
+        return old * float(value[1:])
+    return float(value)
+
+
+def build(changes, base_subcatches, base_factors):
+    """
+    Subcatchments and correction factors of one scenario
+    :param changes: list of (subcatch, param, value) changes, see import_scenarios()
+    :param base_subcatches: list of baseline Subcatchment objects
+    :param base_factors: dict of baseline correction factors
+    :return: list of Subcatchment objects, array of correction factors
+    """
+    subcatches = base_subcatches
+    factors = base_factors
+    for _, param, value in changes:
+        if param == 'params':
+            subcatches = load_params(value)
+        elif param == 'adjust':
+            factors = import_factors(value) if value != 'none' else {}
+    subcatches = [copy.copy(sc) for sc in subcatches]
+    factors = np.array([factors.get(sc.name, 1.0) for sc in subcatches], dtype=float)
+
+    names = [sc.name for sc in subcatches]
+    for subcatch, param, value in changes:
+        if param in ('params', 'adjust'):
+            continue
+        if subcatch != '*' and subcatch not in names:
+            raise ValueError('unknown subcatchment ' + subcatch)
+        for i, sc in enumerate(subcatches):
+            if subcatch in ('*', sc.name):
+                if param == 'factor':
+                    factors[i] = apply_value(factors[i], value)
+                elif param == 'imperv':
+                    sc.imperv = min(apply_value(sc.imperv, value), 100.0)
+                else:
+                    setattr(sc, param, apply_value(getattr(sc, param), value))
+    return subcatches, factors
+
+
+def evaluate(task):
+    """
+    Monthly runoff for a chunk of subcatchments, runs in worker processes
+    :param task: (list of Subcatchment objects, array of correction factors)
+    :return: array of total runoff with shape (subcatch, year, month), the month axis is jan - dec
+    """
+    subcatches, factors = task
+    if _mode == 'stepped':
+        results = SteppedRunOff(_storms, subcatches)
+    else:
+        results = ThresholdRunOff(_storms, subcatches, _index)
+    runoff = results.runoff * factors[:, np.newaxis]  # same as BatchRunOff.adjust()
+    years, year_index = np.unique(_storms.year, return_inverse=True)
+    return month_totals(runoff, year_index, _storms.month, len(years))
+
+
+def run(scenarios, base_subcatches, base_factors, rainfile, mode='lumped', processes=1, chunk=1000, start_month=4,
+        end_month=10):
+    """
+    :param scenarios: list of (scenario name, changes), see import_scenarios()
+    :param base_subcatches: list of baseline Subcatchment objects
+    :param base_factors: dict of baseline correction factors
+    :param rainfile: csv file of storm events
+    :param mode: 'lumped' or 'stepped', see my_cuhp.main()
+    :param processes: number of worker processes, 1 calculates in this process
+    :param chunk: number of subcatchments calculated at once
+    :return: list of (scenario name, Stats object), the baseline first
+    """
+    storms = load_storms(rainfile)  # parse once, workers load the cached arrays
+    names = []
+    subcatches = []
+    factors = []
+    bounds = [0]  # first row of each scenario in the stacked batch
+    for name, changes in [(BASELINE, [])] + list(scenarios):
+        scenario_subcatches, scenario_factors = build(changes, base_subcatches, base_factors)
+        names.append(name)
+        subcatches.extend(scenario_subcatches)
+        factors.append(scenario_factors)
+        bounds.append(len(subcatches))
+    factors = np.concatenate(factors)
+    tasks = [(subcatches[first:first+chunk], factors[first:first+chunk]) for first in range(0, len(subcatches), chunk)]
+
+    if processes == 1:
+        _init_worker(rainfile, mode)
+        totals = map(evaluate, tasks)
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, (rainfile, mode))
+        try:
+            totals = pool.map(evaluate, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    totals = np.concatenate(totals)
+
+    years = np.unique(storms.year).tolist()
+    results = []
+    for name, first, last in zip(names, bounds[:-1], bounds[1:]):
+        sc_names = [sc.name for sc in subcatches[first:last]]
+        results.append((name, Stats.from_totals(sc_names, years, totals[first:last], start_month, end_month)))
+    return results
+
+
+def print_differences(results):
+    """
+    Print monthly average runoff of every scenario, the baseline's and the difference in csv format with header
+    :param results: list of (scenario name, Stats object) from run(), the baseline first
+    """
+    baseline = results[0][1]
+    print 'scenario,subcatch_id,month,runoff,baseline_runoff,difference'
+    for name, stats in results:
+        for sc in stats.subcatch_names:
+            base = baseline.averages.get(sc)  # None if sc isn't in the baseline
+            for m, month in enumerate(stats.months):
+                runoff = stats.averages[sc][m]
+                s = '{},{},{},{}'.format(name, sc, calendar.month_name[month], runoff)
+                if base is None:
+                    s += ',,'
+                else:
+                    s += ',{},{}'.format(base[m], runoff - base[m])
+                print s
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenarios', help='csv of scenario changes')
+    parser.add_argument('--rain', default='csv/more_rain2.csv', help='rain file (default: %(default)s)')
+    parser.add_argument('--params', default='csv/hlc_sc_combined.csv', help='baseline subcatchment file '
+                                                                            '(default: %(default)s)')
+    parser.add_argument('--adjust', default='csv/adjust.csv', help='baseline correction factors, "none" to skip '
+                                                                   '(default: %(default)s)')
+    parser.add_argument('--mode', choices=['lumped', 'stepped'], default='lumped', help='see my_cuhp.py')
+    parser.add_argument('--processes', type=int, default=1, help='worker processes (default: 1, no pool)')
+    parser.add_argument('--chunk', type=int, default=1000, help='subcatchments calculated at once (default: 1000)')
+    args = parser.parse_args()
+
+    base_factors = import_factors(args.adjust) if args.adjust != 'none' else {}
+    results = run(import_scenarios(args.scenarios), load_params(args.params), base_factors, args.rain, args.mode,
+                  args.processes, args.chunk)
+    print_differences(results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Monte Carlo sensitivity of average monthly runoff (see Stats.print_average_runoff()) to subcatchment parameters.
+
+For each subcatchment thousands of parameter sets are sampled around the imported values and runoff for every set
+and storm is calculated as one array operation, a chunk of samples at a time so memory stays bounded. Subcatchments
+are spread across a pool of processes. Results are printed in csv format: the distribution of average monthly
+runoff and the standardized regression coefficient (SRC) of each parameter for every subcatchment and month.
+"""
+import argparse
+import calendar
+import multiprocessing
+import numpy as np
+
+from cache import load_storms, load_params
+from my_cuhp import areas, lumped_volumes, import_factors
+from stats import monthly_weights
+
+SAMPLE_PARAMS = ('imperv', 'depress_stor_perv', 'depress_stor_imperv', 'horton_init', 'horton_decay', 'horton_final')
+PERCENTILES = (5, 50, 95)
+
+_storms = None  # StormTable for worker processes
+_weights = None  # monthly weights for worker processes
+
+
+def _init_worker(rainfile, start_month, end_month):
+    global _storms, _weights
+    _storms = load_storms(rainfile)
+    _weights = monthly_weights(_storms, start_month, end_month)
+
+
+def sample_params(sc, samples, spread, seed):
+    """
+    Sample parameters uniformly within +/- spread of the subcatchment's values
+    :param sc: Subcatchment object
+    :param samples: number of parameter sets
+    :param spread: relative range, 0.25 samples from 75% to 125% of each parameter
+    :param seed: random seed
+    :return: array of parameter sets with shape (samples, len(SAMPLE_PARAMS))
+    """
+    rng = np.random.RandomState(seed)
+    base = np.array([getattr(sc, param) for param in SAMPLE_PARAMS], dtype=float)
+    params = base * rng.uniform(1.0-spread, 1.0+spread, (samples, len(SAMPLE_PARAMS)))
+    params[:, 0] = np.minimum(params[:, 0], 100.0)  # imperviousness
+    params[:, 5] = np.minimum(params[:, 5], params[:, 3])  # final infiltration can't be above initial
+    return params
+
+
+def monthly_runoff(storms, weights, area, params, factor=1.0, chunk=1000):
+    """
+    Average monthly runoff for many parameter sets of one subcatchment
+    :param storms: StormTable object
+    :param weights: monthly weights, see stats.monthly_weights()
+    :param area: subcatchment area (sq miles)
+    :param params: array of parameter sets, see sample_params()
+    :param factor: runoff correction factor, see my_cuhp.adjust_volume()
+    :param chunk: number of parameter sets calculated at once
+    :return: array of average monthly runoff (ac-ft) with shape (number of parameter sets, number of months)
+    """
+    averages = np.empty((len(params), weights.shape[1]))
+    for first in range(0, len(params), chunk):
+        p = params[first:first+chunk].T[:, :, np.newaxis]
+        _, imp_area, perv_area = areas(area, p[0])
+        imp_vol, _, per_vol = lumped_volumes(storms, imp_area, perv_area, *p[1:])
+        averages[first:first+chunk] = ((imp_vol + per_vol) * factor).dot(weights)
+    return averages
+
+
+def sensitivity(params, averages):
+    """
+    Standardized regression coefficients of average monthly runoff on parameters
+    :param params: array of parameter sets, see sample_params()
+    :param averages: average monthly runoff for params, see monthly_runoff()
+    :return: array of SRCs with shape (number of months, len(SAMPLE_PARAMS)), 0 where runoff or the parameter doesn't
+        vary (e.g. a parameter that is 0 is never perturbed)
+    """
+    x_std = params.std(0)
+    x = (params - params.mean(0)) / np.where(x_std > 0.0, x_std, 1.0)
+    y_std = averages.std(0)
+    y = (averages - averages.mean(0)) / np.where(y_std > 0.0, y_std, 1.0)
+    coeffs = np.linalg.lstsq(x, y, rcond=None)[0]
+    coeffs[x_std == 0.0] = 0.0
+    return coeffs.T
+
+
+def evaluate(task):
+    """
+    Sample and evaluate one subcatchment, runs in worker processes
+    :param task: (Subcatchment object, correction factor, number of samples, spread, seed, chunk)
+    :return: runoff for sc's own parameters, runoff for samples, SRCs
+    """
+    sc, factor, samples, spread, seed, chunk = task
+    base = np.array([[getattr(sc, param) for param in SAMPLE_PARAMS]])
+    params = sample_params(sc, samples, spread, seed)
+    base_runoff = monthly_runoff(_storms, _weights, sc.area, base, factor)[0]
+    averages = monthly_runoff(_storms, _weights, sc.area, params, factor, chunk)
+    return base_runoff, averages, sensitivity(params, averages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rain', default='csv/more_rain2.csv', help='rain file (default: %(default)s)')
+    parser.add_argument('--params', default='csv/hlc_sc_combined.csv', help='subcatchment file (default: %(default)s)')
+    parser.add_argument('--adjust', default='csv/adjust.csv', help='correction factors, "none" to skip '
+                                                                   '(default: %(default)s)')
+    parser.add_argument('--samples', type=int, default=5000, help='parameter sets per subcatchment (default: 5000)')
+    parser.add_argument('--spread', type=float, default=0.25, help='relative sampling range (default: 0.25)')
+    parser.add_argument('--chunk', type=int, default=1000, help='parameter sets calculated at once (default: 1000)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per cpu)')
+    args = parser.parse_args()
+    start_month, end_month = 4, 10
+
+    load_storms(args.rain)  # fill the cache once so workers don't all parse the rain file
+    subcatches = load_params(args.params)
+    factors = import_factors(args.adjust) if args.adjust != 'none' else {}
+    tasks = [(sc, factors.get(sc.name, 1.0), args.samples, args.spread, args.seed + i, args.chunk)
+             for i, sc in enumerate(subcatches)]
+
+    pool = multiprocessing.Pool(args.processes, _init_worker, (args.rain, start_month, end_month))
+    try:
+        results = pool.map(evaluate, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    s = 'subcatch_id,month,base,mean,std,' + ','.join('p' + str(p) for p in PERCENTILES)
+    s += ',' + ','.join('src_' + param for param in SAMPLE_PARAMS)
+    print s
+    for sc, (base_runoff, averages, srcs) in zip(subcatches, results):
+        percentiles = np.percentile(averages, PERCENTILES, axis=0)
+        for m, month in enumerate(range(start_month, end_month+1)):
+            values = [base_runoff[m], averages[:, m].mean(), averages[:, m].std()] + list(percentiles[:, m])
+            values += list(srcs[m])
+            print sc.name + ',' + calendar.month_name[month] + ',' + ','.join(str(v) for v in np.array(values).tolist())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""
+Local runoff query service. The storm record is loaded and indexed once, then runoff for new subcatchment parameter
+sets is answered over HTTP with json, e.g. "what's the monthly runoff if WQ129 is 60% impervious":
+
+    curl -d '{"subcatchments": [{"name": "WQ129", "imperv": 60}]}' http://localhost:8765/runoff
+
+Each subcatchment in the request starts from the subcatchment with the same name in the parameter file (if there is
+one) and any Subcatchment attribute or "factor" (correction factor, see my_cuhp.adjust_volume()) given replaces its
+value. A new subcatchment needs every attribute. Parameters are checked the same as a parameter file (see
+subcatch.check_units()). "mode" can be "lumped" (default) or "stepped". The reply has average runoff for each month
+(the same as Stats.print_average_runoff()) and total runoff over the record for each subcatchment.
+
+    GET /health          number of storms and cache statistics
+    GET /subcatchments   parameters and correction factors of the subcatchments in the parameter file
+    POST /runoff         runoff for the subcatchments in the request
+
+Requests are handled in threads. Results for each parameter set are kept in a least recently used cache.
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from calendar import month_name
+from collections import OrderedDict
+import argparse
+import json
+import threading
+import numpy as np
+
+from cache import load_storms, load_params
+from incremental import month_totals
+from my_cuhp import SteppedRunOff, import_factors
+from stats import Stats
+from subcatch import Subcatchment, PARAM_COLUMNS, check_units, subcatchment_table
+from threshold import ThresholdRunOff, ThresholdIndex
+
+PARAMS = [attr for _, attr in PARAM_COLUMNS]
+
+
+class LRUCache(object):
+    def __init__(self, size):
+        """
+        Thread safe least recently used cache
+        :param size: most items kept
+        """
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ :return: value for key, None if not cached """
+        with self.lock:
+            value = self.items.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self.items[key] = value  # most recently used is last
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = value
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class RunoffService(object):
+    def __init__(self, storms, subcatches, factors, cache_size=10000, start_month=4, end_month=10):
+        """
+        :param storms: StormTable object
+        :param subcatches: list of Subcatchment objects requests can start from
+        :param factors: dict of correction factors, keys are subcatchment names
+        :param cache_size: most parameter sets kept in the cache
+        :param start_month: first month to average
+        :param end_month: last month to average
+        """
+        self.storms = storms
+        self.index = ThresholdIndex(storms)
+        self.subcatches = OrderedDict((sc.name, sc) for sc in subcatches)
+        self.factors = factors
+        self.start_month = start_month
+        self.end_month = end_month
+        years, self.year_index = np.unique(storms.year, return_inverse=True)
+        self.years = years.tolist()
+        self.cache = LRUCache(cache_size)
+
+    def subcatchment(self, values):
+        """
+        :param values: dict of name and any Subcatchment attributes and factor from a request
+        :return: Subcatchment object, correction factor
+        """
+        unknown = [key for key in values if key not in ['name', 'factor'] + PARAMS]
+        if unknown:
+            raise ValueError('unknown parameters: ' + ', '.join(sorted(unknown)))
+        name = str(values.get('name', ''))
+        base = self.subcatches.get(name)
+        params = []
+        for param in PARAMS:
+            if param in values:
+                params.append(float(values[param]))
+            elif base is not None:
+                params.append(getattr(base, param))
+            else:
+                raise ValueError('{} is missing for new subcatchment {!r}'.format(param, name))
+        factor = float(values.get('factor', self.factors.get(name, 1.0)))
+        if not np.isfinite(params + [factor]).all():
+            raise ValueError('{}: parameters and factor must be finite numbers'.format(name))
+        sc = Subcatchment.from_values(name, *params)
+        check_units(subcatchment_table([sc]))  # on its own, not against the rest of the request
+        return sc, factor
+
+    def runoff(self, subcatches, factors, mode):
+        """
+        Calculate runoff for subcatchments not in the cache
+        :return: list of (monthly averages, total runoff) for each subcatchment
+        """
+        keys = [(mode, factor) + tuple(getattr(sc, param) for param in PARAMS) for sc, factor in
+                zip(subcatches, factors)]
+        results = [self.cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            batch = [subcatches[i] for i in missing]
+            if mode == 'stepped':
+                runoff = SteppedRunOff(self.storms, batch).runoff
+            else:
+                runoff = ThresholdRunOff(self.storms, batch, self.index).runoff
+            runoff = runoff * np.array([factors[i] for i in missing])[:, np.newaxis]  # same as BatchRunOff.adjust()
+            totals = month_totals(runoff, self.year_index, self.storms.month, len(self.years))
+            # averages are keyed by row, a request can have the same name more than once
+            stats = Stats.from_totals(range(len(batch)), self.years, totals, self.start_month, self.end_month)
+            for j, i in enumerate(missing):
+                results[i] = (stats.averages[j], float(runoff[j].sum()))
+                self.cache.put(keys[i], results[i])
+        return results
+
+    def query(self, request):
+        """
+        :param request: dict from a /runoff request
+        :return: dict for the reply
+        """
+        mode = request.get('mode', 'lumped')
+        if mode not in ('lumped', 'stepped'):
+            raise ValueError('mode must be lumped or stepped')
+        items = request.get('subcatchments')
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError('subcatchments must be a list of objects')
+
+        subcatches, factors = zip(*[self.subcatchment(item) for item in items]) if items else ((), ())
+        reply = []
+        for sc, factor, (averages, total) in zip(subcatches, factors, self.runoff(subcatches, factors, mode)):
+            values = OrderedDict([('name', sc.name)] + [(param, getattr(sc, param)) for param in PARAMS])
+            values['factor'] = factor
+            values['monthly_average'] = OrderedDict(zip(self.month_names(), averages))
+            values['total_runoff'] = total
+            reply.append(values)
+        return OrderedDict([('mode', mode), ('subcatchments', reply)])
+
+    def month_names(self):
+        return [month_name[m] for m in range(self.start_month, self.end_month+1)]
+
+    def health(self):
+        return OrderedDict([('storms', len(self.storms)), ('years', len(self.years)), ('cached', len(self.cache)),
+                            ('cache_hits', self.cache.hits), ('cache_misses', self.cache.misses)])
+
+    def known_subcatchments(self):
+        reply = []
+        for sc in self.subcatches.values():
+            values = OrderedDict([('name', sc.name)] + [(param, getattr(sc, param)) for param in PARAMS])
+            values['factor'] = self.factors.get(sc.name, 1.0)
+            reply.append(values)
+        return OrderedDict([('subcatchments', reply)])
+
+
+class Handler(BaseHTTPRequestHandler):
+    def reply(self, code, values):
+        self.send_body(code, json.dumps(values) + '\n')
+
+    def send_body(self, code, body):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == '/health':
+            self.reply(200, service.health())
+        elif self.path == '/subcatchments':
+            self.reply(200, service.known_subcatchments())
+        else:
+            self.reply(404, {'error': 'unknown path ' + self.path})
+
+    def do_POST(self):
+        if self.path != '/runoff':
+            self.reply(404, {'error': 'unknown path ' + self.path})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if not isinstance(request, dict):
+                raise ValueError('request must be a json object')
+            body = json.dumps(self.server.service.query(request), allow_nan=False) + '\n'
+        except (ValueError, TypeError) as e:  # includes bad json and runoff too large for json
+            self.reply(400, {'error': str(e)})
+            return
+        self.send_body(200, body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, quiet=False):
+        """
+        :param address: (host, port)
+        :param service: RunoffService object
+        :param quiet: don't log requests
+        """
+        HTTPServer.__init__(self, address, Handler)
+        self.service = service
+        self.quiet = quiet
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost', help='address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on (default: %(default)s)')
+    parser.add_argument('--rain', default='csv/more_rain2.csv', help='rain file (default: %(default)s)')
+    parser.add_argument('--params', default='csv/hlc_sc_combined.csv', help='subcatchment file (default: %(default)s)')
+    parser.add_argument('--adjust', default='csv/adjust.csv', help='correction factors, "none" to skip '
+                                                                   '(default: %(default)s)')
+    parser.add_argument('--cache-size', type=int, default=10000, help='parameter sets cached (default: 10000)')
+    parser.add_argument('--quiet', action='store_true', help="don't log requests")
+    args = parser.parse_args()
+
+    factors = import_factors(args.adjust) if args.adjust != 'none' else {}
+    service = RunoffService(load_storms(args.rain), load_params(args.params), factors, args.cache_size)
+    server = Server((args.host, args.port), service, args.quiet)
+    print 'serving {} storms on http://{}:{}'.format(len(service.storms), args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -1,52 +1,75 @@
 """
 Calculates and prints out statistics related from RunOff objects
 """
+import argparse
 import calendar
+import multiprocessing
+import numpy as np
+
+from instrument import stage
 
 class Stats(object):
     def __init__(self, results, start_month=4, end_month=10):
-
-        self.results = results  # list of RunOff objects
-        self.subcatch_names = []  # subcatchment names in self.results
+        """
+        :param results: list of RunOff objects or BatchRunOff object
+        :param start_month: first month to work with (jan = 1)
+        :param end_month: last month to work with
+        """
+        self.results = results  # list of RunOff objects or BatchRunOff object
         self.months = range(start_month, end_month+1)  # list of months to work with (4,5...)
-        self.years = []  # years with data in results
-        self.subcatches = {}  # dict of SubcatchResult objects
 
-        # determine subcatch_names and years
-        for result in results:
-            if not result.sc.name in self.subcatch_names:
-                self.subcatch_names.append(result.sc.name)
-            if not result.storm.storm_start.year in self.years:
-                self.years.append(result.storm.storm_start.year)
+        with stage('stats', len(results)):
+            # subcatch_names are subcatchment names in self.results, years are years with data in results, both in
+            # order of appearance
+            self.subcatch_names, sc_codes, years, months, runoff = result_columns(results)
+            self.years = first_seen(years)
 
-        if not True:
-            print self.subcatch_names
-            print self.years
+            # all runoff values grouped by subcatchment (index in subcatch_names), year and month
+            self.groups = GroupBy([('sc', sc_codes), ('year', years), ('month', months)], runoff)
 
-        # create structure for storing all this crap
-        for sc in self.subcatch_names:
-            scr = SubcatchResult()
-            self.subcatches[sc] = scr
-            for month in self.months:
-                mv = MonthValues()
-                self.subcatches[sc].months[month] = mv
-                for year in self.years:
-                    yv = YearValues() 
-                    self.subcatches[sc].months[month].years[year] = yv
-
-        # Populate sc_results
-        for result in results:
-            sc = result.sc.name
-            month = result.storm.storm_start.month
-            year = result.storm.storm_start.year
-            runoff = result.runoff
-            self.subcatches[sc].months[month].years[year].values.append(runoff)
-
-        # Average runoffs by subcatch and month
-        for sc in self.subcatches:
-            for m in self.subcatches[sc].months:
-                self.subcatches[sc].months[m].calc_average()
+            # total run off by subcatchment, month and year
+            totals = self.groups.sum(('sc', 'month', 'year'))
+            month_index = dict((m, i) for i, m in enumerate(self.groups.levels['month']))
+            year_index = dict((y, i) for i, y in enumerate(self.groups.levels['year']))
+            by_month = np.zeros((len(self.subcatch_names), len(self.months), len(self.years)))
+            for i, m in enumerate(self.months):
+                if m in month_index:
+                    by_month[:, i, :] = totals[:, month_index[m], [year_index[year] for year in self.years]]
+            self._average(by_month)
+
+    @classmethod
+    def from_totals(cls, subcatch_names, years, totals, start_month=4, end_month=10):
+        """
+        Create Stats from runoff already totaled by subcatchment, year and month, e.g. by incremental.py. print_vals()
+        is not available
+        :param subcatch_names: list of subcatchment names
+        :param years: list of years
+        :param totals: array of total runoff with shape (subcatch, year, month), the month axis is jan - dec
+        :param start_month: first month to work with (jan = 1)
+        :param end_month: last month to work with
+        """
+        stats = cls.__new__(cls)
+        stats.results = None
+        stats.groups = None
+        stats.months = range(start_month, end_month+1)
+        stats.subcatch_names = list(subcatch_names)
+        stats.years = list(years)
+        stats._average(np.asarray(totals)[:, :, np.array(stats.months)-1].transpose(0, 2, 1))
+        return stats
 
+    def _average(self, by_month):
+        """
+        Average runoffs by subcatch and month
+        :param by_month: array of total runoff with shape (subcatch, month, year)
+        """
+        self.totals = {}  # keys are years, values are arrays of total runoff with shape (subcatch, month)
+        for i, year in enumerate(self.years):
+            self.totals[year] = by_month[:, :, i]
+
+        average = sum(self.totals.values()) / float(len(self.years))
+        self.averages = {}  # keys are subcatch names, values are lists of average total runoff for each month
+        for i, sc in enumerate(self.subcatch_names):
+            self.averages[sc] = average[i].tolist()
 
     def print_average_runoff(self):
         """ print all average total run off per month (ac-ft) by subcatchment in self in csv format with header"""
@@ -57,47 +80,280 @@ class Stats(object):
         print s
 
         # values
-        for sc in self.subcatches:
+        for sc in self.averages:
             s = sc
-            for m in self.subcatches[sc].months:
-                s += ',' + str(self.subcatches[sc].months[m].average)
+            for average in self.averages[sc]:
+                s += ',' + str(average)
             print s
 
+    def by_year(self):
+        """ :return: array of total runoff with shape (year, subcatch, month) """
+        return np.array([self.totals[year] for year in self.years]).reshape(len(self.years),
+                                                                            len(self.subcatch_names), len(self.months))
+
+    def percentiles(self, q):
+        """
+        Percentiles of the yearly total runoff, the same as numpy.percentile()
+        :param q: list of percentiles (0-100)
+        :return: dict, keys are subcatch names, values are arrays with shape (percentile, month)
+        """
+        values = np.percentile(self.by_year(), q, axis=0)
+        return dict((sc, values[:, i]) for i, sc in enumerate(self.subcatch_names))
+
+    def bootstrap(self, q=(2.5, 97.5), replicates=10000, processes=1, batch=1000, seed=0):
+        """
+        Bootstrap percentiles of average total runoff. Each replicate resamples the years with replacement and
+        averages their totals, see bootstrap_columns(). Subcatchments are split between worker processes
+        :param q: list of percentiles (0-100), e.g. (2.5, 97.5) for a 95% confidence interval
+        :param replicates: number of resamples
+        :param processes: number of worker processes, 1 calculates in this process
+        :param batch: number of resamples drawn at once
+        :param seed: random seed, the same seed gives the same intervals for any number of processes
+        :return: dict, keys are subcatch names, values are arrays with shape (percentile, month)
+        """
+        totals = self.by_year().reshape(len(self.years), -1)  # (year, subcatch and month)
+        columns = max(2**22 // replicates, 1)  # keep each task's means under 32 MB
+        columns = min(columns, -(-totals.shape[1] // processes)) if totals.shape[1] else 1
+        tasks = [(totals[:, first:first+columns], q, replicates, batch, seed)
+                 for first in range(0, totals.shape[1], columns)]
+        if processes == 1:
+            values = map(bootstrap_columns, tasks)
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                values = pool.map(bootstrap_columns, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        values = np.concatenate(values, axis=1) if values else np.zeros((len(q), 0))
+        values = values.reshape(len(q), len(self.subcatch_names), len(self.months))
+        return dict((sc, values[:, i]) for i, sc in enumerate(self.subcatch_names))
+
+    def print_intervals(self, intervals, q):
+        """
+        print average total run off per month (ac-ft) and its percentiles by subcatchment in csv format with header
+        :param intervals: dict from bootstrap() or percentiles()
+        :param q: list of percentiles in intervals
+        """
+        print 'Subcatchment,Month,Average,' + ','.join('p' + str(p) for p in q)
+        for sc in self.subcatch_names:
+            for m, month in enumerate(self.months):
+                s = sc + ',' + calendar.month_name[month] + ',' + str(self.averages[sc][m])
+                for value in intervals[sc][:, m].tolist():
+                    s += ',' + str(value)
+                print s
+
     def print_vals(self):
         """ print all values in self """
-        for sc in self.subcatches:
-            for m in self.subcatches[sc].months:
-                for y in self.subcatches[sc].months[m].years:
-                    print sc, m, y, self.subcatches[sc].months[m].years[y].values
+        values = self.groups.split(('sc', 'month', 'year'))
+        for sc in self.averages:
+            i = self.subcatch_names.index(sc)
+            for m in self.months:
+                for y in self.totals:
+                    print sc, m, y, values.get((i, m, y), np.empty(0)).tolist()
+
+
+class GroupBy(object):
+    def __init__(self, keys, values):
+        """
+        Aggregates values grouped by one or more integer keys. Every aggregate is one pass over the values. Results are
+        arrays with one axis for each key in by, in the order of levels[key]
+        :param keys: list of (name, array of integer keys) tuples, one key per value
+        :param values: array of values
+        """
+        self.levels = {}  # sorted unique keys, by key name
+        self.codes = {}  # index in levels for each value, by key name
+        for name, key in keys:
+            self.levels[name], self.codes[name] = np.unique(np.asarray(key, dtype=int), return_inverse=True)
+        self.values = np.asarray(values, dtype=float)
+
+    def _index(self, by):
+        """
+        :param by: list of key names
+        :return: shape of aggregate, group number of every value
+        """
+        shape = tuple(len(self.levels[name]) for name in by)
+        if not by:
+            return shape, np.zeros(len(self.values), dtype=int)
+        return shape, np.ravel_multi_index([self.codes[name] for name in by], shape)
+
+    def count(self, by):
+        shape, index = self._index(by)
+        return np.bincount(index, minlength=int(np.prod(shape))).reshape(shape)
+
+    def sum(self, by):
+        shape, index = self._index(by)
+        return np.bincount(index, self.values, minlength=int(np.prod(shape))).reshape(shape)
+
+    def mean(self, by):
+        """ nan for empty groups """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sum(by) / self.count(by)
+
+    def _reduce(self, by, ufunc, start):
+        shape, index = self._index(by)
+        size = int(np.prod(shape))
+        result = np.full(size, start)
+        ufunc.at(result, index, self.values)
+        result[np.bincount(index, minlength=size) == 0] = np.nan
+        return result.reshape(shape)
+
+    def min(self, by):
+        """ nan for empty groups """
+        return self._reduce(by, np.minimum, np.inf)
+
+    def max(self, by):
+        """ nan for empty groups """
+        return self._reduce(by, np.maximum, -np.inf)
+
+    def percentile(self, q, by):
+        """
+        Percentiles with linear interpolation, the same as numpy.percentile(). nan for empty groups
+        :param q: percentile or list of percentiles (0-100)
+        :return: array with an axis for q (if q is a list) followed by an axis for each key in by
+        """
+        shape, index = self._index(by)
+        counts = np.bincount(index, minlength=int(np.prod(shape)))
+        starts = np.cumsum(counts) - counts
+        ordered = self.values[np.lexsort((self.values, index))]
+
+        q = np.asarray(q, dtype=float)
+        position = q.reshape(q.shape + (1,)) / 100.0 * np.maximum(counts - 1, 0)
+        low = np.floor(position).astype(int)
+        high = np.minimum(low + 1, np.maximum(counts - 1, 0))
+        fraction = position - low
+        last = max(len(ordered) - 1, 0)
+        low_values = ordered[np.minimum(starts + low, last)] if len(ordered) else np.zeros(low.shape)
+        high_values = ordered[np.minimum(starts + high, last)] if len(ordered) else np.zeros(high.shape)
+        result = low_values + (high_values - low_values) * fraction
+        result[..., counts == 0] = np.nan
+        return result.reshape(q.shape + shape)
+
+    def split(self, by):
+        """
+        :return: dict, keys are tuples of key values, values are arrays of values in the group in their original order
+        """
+        shape, index = self._index(by)
+        order = np.argsort(index, kind='mergesort')
+        groups, starts = np.unique(index[order], return_index=True)
+        result = {}
+        for group, values in zip(groups, np.split(self.values[order], starts[1:])):
+            codes = np.unravel_index(group, shape)
+            result[tuple(int(self.levels[name][c]) for name, c in zip(by, codes))] = values
+        return result
+
+
+def resample_counts(n, replicates, batch=1000, seed=0):
+    """
+    Bootstrap resamples of n items as counts, a batch at a time
+    :param n: number of items (years)
+    :param replicates: number of resamples
+    :param batch: number of resamples in each batch
+    :param seed: random seed
+    :return: generator of (first replicate, array with shape (resamples in batch, n) of how many times each item is
+        drawn)
+    """
+    random = np.random.RandomState(seed)
+    for first in range(0, replicates, batch):
+        size = min(batch, replicates - first)
+        draws = random.randint(0, n, (size, n)) + n*np.arange(size)[:, np.newaxis]
+        yield first, np.bincount(draws.ravel(), minlength=size*n).reshape(size, n)
+
+
+def bootstrap_columns(task):
+    """
+    Bootstrap percentiles of the mean of each column, runs in worker processes. The means of a batch of resamples
+    are one matrix product of resample counts and values
+    :param task: (array of values with shape (n, columns), list of percentiles, replicates, batch, seed)
+    :return: array with shape (percentile, columns)
+    """
+    values, q, replicates, batch, seed = task
+    means = np.empty((replicates, values.shape[1]))
+    for first, counts in resample_counts(len(values), replicates, batch, seed):
+        means[first:first+len(counts)] = counts.dot(values) / float(len(values))
+    return np.percentile(means, q, axis=0)
+
+
+def result_columns(results):
+    """
+    Runoff results as columns
+    :param results: list of RunOff objects or BatchRunOff object
+    :return: list of subcatchment names in order of appearance, and arrays of subcatchment (index in names), year,
+        month and runoff for every result
+    """
+    if hasattr(results, 'storms'):
+        # BatchRunOff, subcatchments are rows and storms are columns
+        n_sc, n_storms = results.runoff.shape
+        names, rows = codes([sc.name for sc in results.subcatches])
+        sc_codes = np.repeat(rows, n_storms)
+        years = np.tile(results.storms.year, n_sc)
+        months = np.tile(results.storms.month, n_sc)
+        return names, sc_codes, years, months, results.runoff.ravel()
+
+    names, sc_codes = codes([result.sc.name for result in results])
+    years = np.array([result.storm.year for result in results], dtype=int)
+    months = np.array([result.storm.month for result in results], dtype=int)
+    runoff = np.array([result.runoff for result in results], dtype=float)
+    return names, sc_codes, years, months, runoff
+
+
+def codes(keys):
+    """
+    :param keys: list of hashable keys
+    :return: list of unique keys in order of appearance, array of index in unique keys for each key
+    """
+    index = {}
+    unique = []
+    result = np.empty(len(keys), dtype=int)
+    for i, key in enumerate(keys):
+        if key not in index:
+            index[key] = len(unique)
+            unique.append(key)
+        result[i] = index[key]
+    return unique, result
 
 
-# All classes below here are "helper" classes
-class SubcatchResult(object):
-    def __init__(self):
-        self.months = {}  # keys are months (4,5,etc), values are MonthValues objects
+def first_seen(values):
+    """
+    :param values: array of values
+    :return: list of unique values in order of appearance
+    """
+    unique, first = np.unique(values, return_index=True)
+    return unique[np.argsort(first)].tolist()
 
-    def __str__(self):
-        return str(self.months)
 
-class MonthValues(object):
-    def __init__(self):
-        self.years = {}  # keys are years (1998, 2006, etc), values are YearValues objects
-        self.average = None  # average total runoff for month
+def monthly_weights(storms, start_month=4, end_month=10):
+    """
+    Weights to average runoff by month, the same as Stats: runoff for each month is totaled by year then averaged
+    over every year with storms. runoff.dot(weights) gives average monthly runoff
+    :param storms: StormTable object
+    :return: array with shape (number of storms, number of months)
+    """
+    months = np.arange(start_month, end_month+1)
+    weights = (storms.month[:, np.newaxis] == months).astype(float)
+    return weights / len(np.unique(storms.year))
 
-    def calc_average(self):
-        """ total run off by year, then caclulate average """
-        total = 0
-        for year in self.years:
-            total += self.years[year].calc_total_runoff()
 
-        self.average = total/float(len(self.years))
+def main():
+    from cache import load_storms, load_params
+    from my_cuhp import import_factors
+    from threshold import ThresholdRunOff
 
-class YearValues(object):
-    def __init__(self):
-        self.values = []  # list of runoff volumes (float)
-        self.total_runoff = None  # total runoff for year/subcatchment/month
+    parser = argparse.ArgumentParser(description='Bootstrap confidence intervals of average monthly runoff')
+    parser.add_argument('--rain', default='csv/more_rain2.csv', help='rain file (default: %(default)s)')
+    parser.add_argument('--params', default='csv/hlc_sc_combined.csv', help='subcatchment file (default: %(default)s)')
+    parser.add_argument('--adjust', default='csv/adjust.csv', help='correction factors (default: %(default)s)')
+    parser.add_argument('--confidence', type=float, default=95.0, help='confidence interval, percent (default: 95)')
+    parser.add_argument('--replicates', type=int, default=10000, help='bootstrap resamples (default: 10000)')
+    parser.add_argument('--processes', type=int, default=1, help='worker processes (default: 1, no pool)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    args = parser.parse_args()
 
-    def calc_total_runoff(self):
-        self.total_runoff = sum(self.values)
-        return self.total_runoff
+    results = ThresholdRunOff(load_storms(args.rain), load_params(args.params))
+    results.adjust(import_factors(args.adjust))
+    stats = Stats(results)
+    q = [(100.0 - args.confidence) / 2.0, 50.0, (100.0 + args.confidence) / 2.0]
+    stats.print_intervals(stats.bootstrap(q, args.replicates, args.processes, seed=args.seed), q)
 
+if __name__ == '__main__':
+    main()
@@ -1,64 +1,239 @@
-"""
-Tools to import subcatchment paramaters saved as a csv
-"""
-
-
-class Subcatchment(object):
-    def __init__(self, fields):
-        """
-        load paramaters from fields
-        :param fields: list of subcatch parameters in typical CUHP order
-        """
-        self.name = fields[0]
-        self.area = float(fields[3])  # area in square miles
-        self.imperv = float(fields[7])  # imperviousness as a percentange: 50%, 99% (not 0.5 or .99)
-        self.depress_stor_perv = float(fields[8])  # pervious depression storage (inches)
-        self.depress_stor_imperv = float(fields[9])  # impervious depression storage (inches)
-        self.horton_init = float(fields[10]) # initial hortons infiltration (in/hr)
-        self.horton_decay = float(fields[11])  # hortons decay coeff (1/secs)
-        self.horton_final = float(fields[12])  # final hortons infiltration (in/hr)
-        self.fields = fields
-
-    @staticmethod
-    def header():
-        return 'subcatch_id,area,imperv_percent,depress_stor_perv,depress_stor_imperv,hrtn_init, hrtn_decay, hrtn_final'
-
-    def __str__(self):
-        s = str(self.name) + ','
-        s += str(self.area) + ','
-        s += str(self.imperv) + ','
-        s += str(self.depress_stor_perv) + ','
-        s += str(self.depress_stor_imperv) + ','
-        s += str(self.horton_init) + ','
-        s += str(self.horton_decay) + ','
-        s += str(self.horton_final) 
-        return s
-
-
-def import_params(param_filename):
-    """
-    Imports subcatchment parameters from csv in typical CUHP order, no headings
-    :param param_filename: filename of csv file
-    :return: list of Subcatchment objects
-    """
-    subcatches = []
-    with open(param_filename, 'rt') as infile:
-        for line in infile:
-            fields = line.strip().split(',')
-            new_subcatch = Subcatchment(fields)
-            subcatches.append(new_subcatch)
-    return subcatches
-
-
-def main():
-    filename = 'csv/hlc_subcatch.csv'
-    scs = import_params(filename)
-    print len(scs)
-    for item in scs:
-        print item.name, item.__dict__
-        print
-
-if __name__ == '__main__':
-    main()
-
-
+"""
+Tools to import subcatchment paramaters saved as a csv
+
+Files are in typical CUHP column order with no header, or have a header row and columns are found by name (see
+HEADER_NAMES), e.g. the header written by Subcatchment.header()
+"""
+import numpy as np
+
+from instrument import stage
+
+# Column in typical CUHP order for each parameter
+PARAM_COLUMNS = ((3, 'area'), (7, 'imperv'), (8, 'depress_stor_perv'), (9, 'depress_stor_imperv'),
+                 (10, 'horton_init'), (11, 'horton_decay'), (12, 'horton_final'))
+PARAM_COLUMNS_BY_ATTR = dict((attr, column) for column, attr in PARAM_COLUMNS)
+NAME_COLUMN = 0
+
+# Header names accepted for the name and each parameter, compared in lower case
+HEADER_NAMES = {
+    'name': ('name', 'subcatch_id', 'subcatch', 'subcatchment', 'sc_name'),
+    'area': ('area', 'area_sqmi'),
+    'imperv': ('imperv', 'imperv_percent', 'percent_imperv'),
+    'depress_stor_perv': ('depress_stor_perv', 'dsp'),
+    'depress_stor_imperv': ('depress_stor_imperv', 'dsi'),
+    'horton_init': ('horton_init', 'hrtn_init', 'f0'),
+    'horton_decay': ('horton_decay', 'hrtn_decay', 'k'),
+    'horton_final': ('horton_final', 'hrtn_final', 'fc'),
+}
+
+
+class Subcatchment(object):
+    __slots__ = ('name', 'area', 'imperv', 'depress_stor_perv', 'depress_stor_imperv', 'horton_init', 'horton_decay',
+                 'horton_final', 'fields')
+
+    def __init__(self, fields):
+        """
+        load paramaters from fields
+        :param fields: list of subcatch parameters in typical CUHP order
+        """
+        self.name = fields[0]
+        self.area = float(fields[3])  # area in square miles
+        self.imperv = float(fields[7])  # imperviousness as a percentange: 50%, 99% (not 0.5 or .99)
+        self.depress_stor_perv = float(fields[8])  # pervious depression storage (inches)
+        self.depress_stor_imperv = float(fields[9])  # impervious depression storage (inches)
+        self.horton_init = float(fields[10]) # initial hortons infiltration (in/hr)
+        self.horton_decay = float(fields[11])  # hortons decay coeff (1/secs)
+        self.horton_final = float(fields[12])  # final hortons infiltration (in/hr)
+        self.fields = fields
+
+    @classmethod
+    def from_values(cls, name, area, imperv, depress_stor_perv, depress_stor_imperv, horton_init, horton_decay,
+                    horton_final):
+        """
+        Create subcatchment from already parsed parameters, units are the same as __init__(). Raw fields are not kept
+        :return: Subcatchment object
+        """
+        sc = cls.__new__(cls)
+        sc.name = name
+        sc.area = area
+        sc.imperv = imperv
+        sc.depress_stor_perv = depress_stor_perv
+        sc.depress_stor_imperv = depress_stor_imperv
+        sc.horton_init = horton_init
+        sc.horton_decay = horton_decay
+        sc.horton_final = horton_final
+        sc.fields = None
+        return sc
+
+    @staticmethod
+    def header():
+        return 'subcatch_id,area,imperv_percent,depress_stor_perv,depress_stor_imperv,hrtn_init, hrtn_decay, hrtn_final'
+
+    def __str__(self):
+        s = str(self.name) + ','
+        s += str(self.area) + ','
+        s += str(self.imperv) + ','
+        s += str(self.depress_stor_perv) + ','
+        s += str(self.depress_stor_imperv) + ','
+        s += str(self.horton_init) + ','
+        s += str(self.horton_decay) + ','
+        s += str(self.horton_final) 
+        return s
+
+
+def header_columns(fields):
+    """
+    :param fields: fields of the first line of a csv file
+    :return: dict of column for the name and each parameter, None if fields isn't a header
+    """
+    try:
+        float(fields[PARAM_COLUMNS[0][0]])
+        return None  # first line is data
+    except (IndexError, ValueError):
+        pass
+    lower = [field.strip().lower() for field in fields]
+    columns = {}
+    for attr, names in HEADER_NAMES.items():
+        found = [i for i, field in enumerate(lower) if field in names]
+        if not found:
+            raise ValueError('no column for {} in header, expected one of: {}'.format(attr, ', '.join(names)))
+        columns[attr] = found[0]
+    return columns
+
+
+def read_rows(param_filename):
+    """
+    :param param_filename: filename of csv file
+    :return: dict of column for the name and each parameter, list of lists of fields of every data line, header is
+        True if the file has a header
+    """
+    with open(param_filename, 'rt') as infile:
+        rows = [line.strip().split(',') for line in infile if line.strip()]
+    columns = header_columns(rows[0]) if rows else None
+    if columns is None:
+        columns = dict(PARAM_COLUMNS_BY_ATTR, name=NAME_COLUMN)
+        return columns, rows, False
+    return columns, rows[1:], True
+
+
+def param_table(rows, columns):
+    """
+    :param rows: list of lists of fields
+    :param columns: dict of column for the name and each parameter
+    :return: record array with a name field and a float field for each parameter, one record per row
+    """
+    names = [row[columns['name']] for row in rows]
+    arrays = [np.array(names, dtype='S{}'.format(max([len(name) for name in names] + [1])))]
+    for _, attr in PARAM_COLUMNS:
+        column = columns[attr]
+        try:
+            arrays.append(np.array([row[column] for row in rows], dtype=float))
+        except (IndexError, ValueError):
+            raise ValueError('{} (column {}) is missing or not a number'.format(attr, column + 1))
+    return np.rec.fromarrays(arrays, names=['name'] + [attr for _, attr in PARAM_COLUMNS])
+
+
+def check_units(table):
+    """
+    Check parameters are in the units Subcatchment expects
+    :param table: record array from load_param_table()
+    :raise ValueError: naming the first subcatchment with a parameter out of range
+    """
+    def check(bad, message):
+        if bad.any():
+            raise ValueError('{}: {}'.format(table.name[np.argmax(bad)], message))
+
+    check(table.area <= 0.0, 'area must be positive (square miles)')
+    check((table.imperv < 0.0) | (table.imperv > 100.0), 'imperv must be a percentage, 0 - 100')
+    check(table.depress_stor_perv < 0.0, 'depress_stor_perv must not be negative (inches)')
+    check(table.depress_stor_imperv < 0.0, 'depress_stor_imperv must not be negative (inches)')
+    check(table.horton_final < 0.0, 'horton_final must not be negative (in/hr)')
+    check(table.horton_init < table.horton_final, 'horton_init must not be less than horton_final (in/hr)')
+    check(table.horton_decay <= 0.0, 'horton_decay must be positive (1/sec)')
+    check(table.horton_decay > 0.1, 'horton_decay is too large for 1/sec, is it in 1/hr?')
+
+
+def load_param_table(param_filename, with_rows=False):
+    """
+    Bulk import subcatchment parameters in one pass into a record array, units are checked
+    :param param_filename: filename of csv file
+    :param with_rows: also return the fields of every data line and whether the file has a header, see read_rows()
+    :return: record array with a name field and a float field for each parameter, see Subcatchment for units
+    """
+    with stage('import_params') as s:
+        columns, rows, header = read_rows(param_filename)
+        table = param_table(rows, columns)
+        check_units(table)
+        s.rows = len(table)
+    if with_rows:
+        return table, rows, header
+    return table
+
+
+def subcatchments(table):
+    """
+    :param table: record array from load_param_table()
+    :return: list of Subcatchment objects, raw fields are not kept
+    """
+    values = zip(*[table[attr].tolist() for _, attr in PARAM_COLUMNS]) if len(table) else []
+    return [Subcatchment.from_values(name, *params) for name, params in zip(table.name.tolist(), values)]
+
+
+def subcatchment_table(subcatches):
+    """
+    :param subcatches: list of Subcatchment objects
+    :return: record array the same as load_param_table(), one record per subcatchment
+    """
+    names = [sc.name for sc in subcatches]
+    arrays = [np.array(names, dtype='S{}'.format(max([len(name) for name in names] + [1])))]
+    for _, attr in PARAM_COLUMNS:
+        arrays.append(np.array([getattr(sc, attr) for sc in subcatches], dtype=float))
+    return np.rec.fromarrays(arrays, names=['name'] + [attr for _, attr in PARAM_COLUMNS])
+
+
+def import_params(param_filename, keep_fields=False):
+    """
+    Imports subcatchment parameters from csv in typical CUHP order or with a header, see load_param_table()
+    :param param_filename: filename of csv file
+    :param keep_fields: keep each line's fields for export_params(), only for files without a header
+    :return: list of Subcatchment objects
+    """
+    table, rows, header = load_param_table(param_filename, with_rows=True)
+    subcatches = subcatchments(table)
+    if keep_fields and not header:
+        for sc, fields in zip(subcatches, rows):
+            sc.fields = fields
+    return subcatches
+
+
+def export_params(subcatches, param_filename):
+    """
+    Exports subcatchment parameters to csv in typical CUHP order, no headings. Columns not used by Subcatchment are
+    copied from the imported fields when available, otherwise left blank
+    :param subcatches: list of Subcatchment objects
+    :param param_filename: filename of csv file
+    """
+    with open(param_filename, 'wt') as outfile:
+        for sc in subcatches:
+            if sc.fields:
+                fields = list(sc.fields)
+            else:
+                fields = [sc.name, sc.name] + ['']*11
+            for column, attr in PARAM_COLUMNS:
+                fields[column] = str(getattr(sc, attr))
+            outfile.write(','.join(fields) + '\n')
+
+
+def main():
+    from cache import load_params
+    filename = 'csv/hlc_subcatch.csv'
+    scs = load_params(filename)
+    print len(scs)
+    print Subcatchment.header()
+    for item in scs:
+        print item
+
+if __name__ == '__main__':
+    main()
+
+
@@ -0,0 +1,67 @@
+"""
+Tests for cache.py, run with: python -m unittest discover -p 'test_*.py'
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from cache import save_arrays, load_arrays, load_storms
+from rain import import_storms
+
+
+def _save(task):
+    filename, i = task
+    for _ in range(20):
+        save_arrays(filename, [('values', np.full(100000, i, dtype=float)), ('names', np.array(['a', 'bc']))],
+                    {'writer': i})
+    return i
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        filename = os.path.join(self.folder, 'arrays')
+        save_arrays(filename, [('a', np.arange(5)), ('b', np.zeros((2, 3))), ('empty', np.zeros(0))], {'x': 1})
+        meta, arrays = load_arrays(filename)
+        self.assertEqual(meta, {'x': 1})
+        self.assertEqual(arrays['a'].tolist(), range(5))
+        self.assertEqual(arrays['b'].shape, (2, 3))
+        self.assertEqual(arrays['empty'].shape, (0,))
+
+    def test_concurrent_writers(self):
+        # every writer renames a whole file into place, the file is always one writer's arrays
+        filename = os.path.join(self.folder, 'arrays')
+        pool = multiprocessing.Pool(4)
+        try:
+            pool.map(_save, [(filename, i) for i in range(8)])
+        finally:
+            pool.close()
+            pool.join()
+        meta, arrays = load_arrays(filename)
+        self.assertEqual(arrays['values'].tolist(), [float(meta['writer'])] * 100000)
+        self.assertEqual(os.listdir(self.folder), ['arrays'])
+
+    def test_load_storms(self):
+        # cold and warm cache are the same as parsing the csv
+        rainfile = os.path.join(self.folder, 'rain.csv')
+        shutil.copy('csv/more_rain2.csv', rainfile)
+        expected = import_storms(rainfile)
+        for _ in range(2):
+            storms = load_storms(rainfile)
+            self.assertEqual(len(storms), len(expected))
+            self.assertEqual(storms.start.tolist(), expected.start.tolist())
+            self.assertEqual(storms.rains.tolist(), expected.rains.tolist())
+            self.assertEqual([storm.id for storm in storms], [storm.id for storm in expected])
+        self.assertTrue(os.path.exists(rainfile + '.cache'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Tests for combine.py, run with: python -m unittest discover -p 'test_*.py'
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from combine import import_spec, combine
+from subcatch import load_param_table, subcatchments, export_params
+
+
+def write_spec(lines):
+    """
+    :param lines: list of (group, member)
+    :return: filename of a temporary spec file, removed by the caller
+    """
+    handle, filename = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(handle, 'wt') as outfile:
+        outfile.write('group,member\n')
+        for group, member in lines:
+            outfile.write('{},{}\n'.format(group, member))
+    return filename
+
+
+class CombineTest(unittest.TestCase):
+    def combine_spec(self, table, lines):
+        filename = write_spec(lines)
+        try:
+            return combine(table, import_spec(filename))
+        finally:
+            os.remove(filename)
+
+    def assert_tables(self, table, expected, rtol=1e-14):
+        self.assertEqual(table.name.tolist(), expected.name.tolist())
+        for attr in expected.dtype.names[1:]:
+            np.testing.assert_allclose(table[attr], expected[attr], rtol=rtol, err_msg=attr)
+
+    def test_regroup_combined(self):
+        # names written by combine() such as "WQ112 - WQ113" are members, not ranges
+        table = load_param_table('csv/hlc_sc_combined.csv')
+        combined, index = self.combine_spec(table, [('mid', 'WQ112 - WQ113'), ('mid', 'WQ114 - WQ115'),
+                                                    ('mid', 'WQ116')])
+        self.assertEqual(combined.name.tolist()[:3], ['WQ110', 'WQ111', 'mid'])
+        self.assertEqual(len(combined), len(table) - 2)
+        self.assertAlmostEqual(combined.area[2], table.area[2:5].sum())
+        self.assertEqual(index[2:5].tolist(), [2, 2, 2])
+
+    def test_range(self):
+        # ranges are in parameter file order and can cover names with " - " in them
+        table = load_param_table('csv/hlc_sc_combined.csv')
+        combined, index = self.combine_spec(table, [('all', 'WQ110 - WQ151 - WQ153')])
+        self.assertEqual(combined.name.tolist(), ['all'])
+        self.assertAlmostEqual(combined.area[0], table.area.sum())
+
+    def test_rebuild_combined(self):
+        # hlc_sc_combined.csv is hlc_subcatch.csv combined by the ranges in its names
+        subcatch = load_param_table('csv/hlc_subcatch.csv')
+        expected = load_param_table('csv/hlc_sc_combined.csv')
+        lines = [(name, name) for name in expected.name.tolist() if ' - ' in name]
+        combined, _ = self.combine_spec(subcatch, lines)
+        self.assert_tables(combined, expected, rtol=1e-3)
+
+    def test_export_round_trip(self):
+        # combined parameters written in CUHP order load back the same, and combine again as they are
+        table = load_param_table('csv/hlc_subcatch.csv')
+        combined, _ = self.combine_spec(table, [('north', 'WQ110 - WQ113'), ('south', 'WQ140 - WQ150')])
+        handle, filename = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        try:
+            export_params(subcatchments(combined), filename)
+            again = load_param_table(filename)
+        finally:
+            os.remove(filename)
+        self.assert_tables(again, combined, rtol=1e-11)  # written with str()
+        regrouped, index = self.combine_spec(again, [('north', 'north')])
+        self.assert_tables(regrouped, again)
+        self.assertEqual(index.tolist(), range(len(again)))
+
+    def test_unknown_member(self):
+        table = load_param_table('csv/hlc_sc_combined.csv')
+        self.assertRaises(ValueError, self.combine_spec, table, [('a', 'WQ112')])
+        self.assertRaises(ValueError, self.combine_spec, table, [('a', 'WQ110'), ('b', 'WQ110 - WQ111')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Tests for incremental.py, run with: python -m unittest discover -p 'test_*.py'
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from cache import load_storms, load_params
+from incremental import update, month_totals, segment_name
+from my_cuhp import BatchRunOff, SteppedRunOff, import_factors
+from rain import StormTable
+from stats import Stats
+from subcatch import Subcatchment
+
+
+def wetter(storms, columns, scale=1.5):
+    """
+    :param storms: StormTable object
+    :param columns: indexes of storms to change
+    :param scale: rain of those storms is multiplied by scale
+    :return: copy of storms with more rain in some storms
+    """
+    total_rain = np.array(storms.total_rain)
+    rains = np.array(storms.rains)
+    for i in columns:
+        total_rain[i] *= scale
+        rains[storms.offsets[i]:storms.offsets[i+1]] *= scale
+    return StormTable(storms.start, total_rain, storms.length, storms.offsets, storms.times, rains, storms.ids)
+
+
+def recalculate(storms, subcatches, factors, mode):
+    """ :return: Stats object for everything calculated from scratch """
+    results = (SteppedRunOff if mode == 'stepped' else BatchRunOff)(storms, subcatches)
+    results.adjust(factors)
+    years, year_index = np.unique(storms.year, return_inverse=True)
+    totals = month_totals(results.runoff, year_index, storms.month, len(years))
+    return Stats.from_totals([sc.name for sc in subcatches], years.tolist(), totals)
+
+
+class UpdateTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.storms = load_storms('csv/more_rain2.csv')
+        cls.subcatches = load_params('csv/hlc_sc_combined.csv')
+        factors = import_factors('csv/adjust.csv')
+        cls.factors = dict((sc.name, factors.get(sc.name, 1.0)) for sc in cls.subcatches)
+
+    def setUp(self):
+        self.store = os.path.join(tempfile.mkdtemp(), 'store')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.store))
+
+    def check(self, storms, subcatches=None, factors=None, mode='lumped', calculated=None):
+        subcatches = subcatches or self.subcatches
+        factors = factors or self.factors
+        stats, pairs = update(self.store, storms, subcatches, factors, mode)
+        expected = recalculate(storms, subcatches, factors, mode)
+        self.assertEqual(stats.years, expected.years)
+        self.assertEqual(sorted(stats.averages), sorted(expected.averages))
+        for name in expected.averages:
+            np.testing.assert_allclose(stats.averages[name], expected.averages[name], rtol=1e-9, atol=1e-9)
+        for year in expected.years:
+            np.testing.assert_allclose(stats.totals[year], expected.totals[year], rtol=1e-9, atol=1e-9)
+        if calculated is not None:
+            self.assertEqual(pairs, calculated)
+        return stats
+
+    def test_growing_record(self):
+        storms, n_sc = self.storms, len(self.subcatches)
+        half = len(storms) // 2
+        self.check(storms.take(np.arange(half)), calculated=half * n_sc)
+        self.check(storms.take(np.arange(half)), calculated=0)
+        self.check(storms, calculated=(len(storms) - half) * n_sc)
+
+    def test_changed_storms(self):
+        # storms that are changed or gone are taken out of the totals
+        storms, n_sc = self.storms, len(self.subcatches)
+        self.check(storms)
+        changed = [3, 50, 51, 200]
+        self.check(wetter(storms, changed), calculated=len(changed) * n_sc)
+        # storms 3 and 51 are changed back, the rest are already calculated
+        self.check(storms.take(np.arange(0, len(storms), 3)), calculated=2 * n_sc)
+        self.check(storms, calculated=(len(storms) - len(range(0, len(storms), 3))) * n_sc)
+
+    def test_changed_subcatchments(self):
+        storms = self.storms
+        self.check(storms.take(np.arange(300)))
+        subcatches = list(self.subcatches)
+        sc = subcatches[4]
+        subcatches[4] = Subcatchment.from_values(sc.name, sc.area, sc.imperv + 20.0, sc.depress_stor_perv,
+                                                 sc.depress_stor_imperv, sc.horton_init, sc.horton_decay,
+                                                 sc.horton_final)
+        factors = dict(self.factors)
+        factors[subcatches[7].name] = 1.25
+        # two subcatchments over every storm, the rest only over the new storms
+        self.check(storms, subcatches, factors,
+                   calculated=2 * len(storms) + (len(subcatches) - 2) * (len(storms) - 300))
+        # dropping subcatchments needs nothing calculated
+        self.check(storms, subcatches[::2], factors, calculated=0)
+
+    def test_segments_unchanged(self):
+        # earlier segments are never rewritten
+        storms = self.storms
+        self.check(storms.take(np.arange(100)))
+        with open(segment_name(self.store, 1), 'rb') as infile:
+            first = infile.read()
+        self.check(storms.take(np.arange(200)))
+        self.check(wetter(storms.take(np.arange(200)), [10, 150]))
+        with open(segment_name(self.store, 1), 'rb') as infile:
+            self.assertEqual(infile.read(), first)
+        self.assertEqual(sorted(os.listdir(self.store)), ['index'] + [segment_name('', i) for i in (1, 2, 3)])
+
+    def test_stepped(self):
+        storms = self.storms
+        self.check(storms.take(np.arange(250)), mode='stepped')
+        self.check(wetter(storms, [5, 300]), mode='stepped', calculated=(len(storms) - 249) * len(self.subcatches))
+
+    def test_not_a_store(self):
+        open(self.store, 'wb').close()  # e.g. a store written before stores were folders
+        self.assertRaises(ValueError, update, self.store, self.storms, self.subcatches, self.factors)
+
+
+if __name__ == '__main__':
+    unittest.main()
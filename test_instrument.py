@@ -0,0 +1,40 @@
+"""
+Tests for instrument.py, run with: python -m unittest discover -p 'test_*.py'
+"""
+import unittest
+
+import instrument
+from instrument import stage, count
+
+
+class InstrumentTest(unittest.TestCase):
+    def tearDown(self):
+        instrument.disable()
+
+    def test_disabled(self):
+        instrument.enable()
+        instrument.disable()
+        with stage('a') as s:
+            s.rows = 5
+        count('b')
+        self.assertEqual(instrument.report()['stages'], [])
+        self.assertEqual(instrument.report()['counters'], {})
+
+    def test_totals(self):
+        instrument.enable()
+        for rows in (2, 3):
+            with stage('runoff', rows):
+                with stage('inner') as s:
+                    s.rows = 1
+        count('clipped', 4)
+        count('clipped')
+        report = instrument.report()
+        self.assertEqual([(s['stage'], s['calls'], s['rows']) for s in report['stages']],
+                         [('inner', 2, 2), ('runoff', 2, 5)])
+        self.assertNotIn('peak_mb', report['stages'][0])  # only the process peak is known, see report()
+        self.assertIn('peak_mb', report)
+        self.assertEqual(report['counters'], {'clipped': 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
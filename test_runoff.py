@@ -0,0 +1,112 @@
+"""
+Tests of the runoff engines against RunOff, run with: python -m unittest discover -p 'test_*.py'
+"""
+import math
+import unittest
+import numpy as np
+
+import instrument
+from cache import load_storms, load_params
+from my_cuhp import RunOff, BatchRunOff, SteppedRunOff
+from threshold import ThresholdRunOff
+
+RESULT_COLUMNS = ('imp_vol', 'infil', 'per_vol', 'runoff')
+
+
+def stepped_runoff(storm, sc):
+    """
+    Step one storm for one subcatchment the way horton.py describes, one point at a time
+    :param storm: RainEvent object
+    :param sc: Subcatchment object
+    :return: impervious runoff depth, pervious runoff depth, infiltrated depth (inches)
+    """
+    k_hr = sc.horton_decay*(60.0*60.0)
+    perv_store = imp_store = 0.0
+    imp_runoff = perv_runoff = infil = 0.0
+    points = storm.values
+    for (t0, rain0), (t1, rain1) in zip(points[:-1], points[1:]):
+        t0, t1, rain = t0/60.0, t1/60.0, rain1 - rain0
+        capacity = sc.horton_final*(t1 - t0) + \
+            ((sc.horton_init - sc.horton_final)/k_hr)*(math.exp(-k_hr*t0) - math.exp(-k_hr*t1))
+        perv_store += rain
+        step_infil = min(capacity, perv_store)
+        infil += step_infil
+        perv_store -= step_infil
+        excess = max(perv_store - sc.depress_stor_perv, 0.0)
+        perv_runoff += excess
+        perv_store -= excess
+
+        imp_store += rain
+        excess = max(imp_store - sc.depress_stor_imperv, 0.0)
+        imp_runoff += excess
+        imp_store -= excess
+    return imp_runoff, perv_runoff, infil
+
+
+class RunoffTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.storms = load_storms('csv/more_rain2.csv')
+        cls.subcatches = load_params('csv/hlc_sc_combined.csv')
+
+    def expected(self, subcatches):
+        """ :return: dict of RunOff values with shape (subcatchments, storms) for every result column """
+        results = [[RunOff(storm, sc) for storm in self.storms] for sc in subcatches]
+        return dict((column, np.array([[getattr(r, column) for r in row] for row in results]))
+                    for column in RESULT_COLUMNS)
+
+    def assert_results(self, results, expected):
+        for column in RESULT_COLUMNS:
+            np.testing.assert_allclose(getattr(results, column), expected[column], rtol=1e-12, atol=1e-12,
+                                       err_msg=column)
+
+    def test_batch(self):
+        for filename in ('csv/hlc_sc_combined.csv', 'csv/hlc_subcatch.csv'):
+            subcatches = load_params(filename)
+            results = BatchRunOff(self.storms, subcatches)
+            self.assert_results(results, self.expected(subcatches))
+            self.assertEqual(str(results.result(3, 7)), str(RunOff(self.storms[7], subcatches[3])))
+
+    def test_threshold(self):
+        results = ThresholdRunOff(self.storms, self.subcatches)
+        expected = self.expected(self.subcatches)
+        self.assert_results(results, expected)
+        self.assertEqual(sorted(zip(results.perv_rows.tolist(), results.perv_cols.tolist())),
+                         sorted(zip(*[index.tolist() for index in np.nonzero(expected['per_vol'] > 0.0)])))
+
+    def test_counters(self):
+        # every engine reports all pairs as rows and the same clipping counts
+        reports = []
+        for engine in (BatchRunOff, ThresholdRunOff):
+            instrument.enable()
+            try:
+                engine(self.storms, self.subcatches)
+                reports.append(instrument.report())
+            finally:
+                instrument.disable()
+        pairs = len(self.storms) * len(self.subcatches)
+        self.assertEqual([report['stages'][0]['rows'] for report in reports], [pairs, pairs])
+        for name in ('pairs', 'zero_per_vol', 'imp_vol_clipped', 'per_vol_clipped'):
+            self.assertEqual(reports[0]['counters'][name], reports[1]['counters'][name], name)
+
+    def test_stepped(self):
+        results = SteppedRunOff(self.storms, self.subcatches)
+        for i, sc in enumerate(self.subcatches):
+            for j, storm in enumerate(self.storms):
+                imp_depth, perv_depth, infil = stepped_runoff(storm, sc)
+                self.assertAlmostEqual(results.imp_vol[i, j], results.imp_area[i, 0] * imp_depth / 12.0, places=10)
+                self.assertAlmostEqual(results.per_vol[i, j], results.perv_area[i, 0] * perv_depth / 12.0, places=10)
+                self.assertAlmostEqual(results.infil[i, j], infil, places=10)
+        np.testing.assert_array_equal(results.runoff, results.imp_vol + results.per_vol)
+
+    def test_stepped_subset(self):
+        # storms are stepped longest first, any subset or order gives the same values
+        columns = np.arange(len(self.storms))[::-7]
+        results = SteppedRunOff(self.storms, self.subcatches)
+        subset = SteppedRunOff(self.storms.take(columns), self.subcatches)
+        for column in RESULT_COLUMNS:
+            np.testing.assert_array_equal(getattr(subset, column), getattr(results, column)[:, columns])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+Tests for sensitivity.py, run with: python -m unittest discover -p 'test_*.py'
+"""
+import unittest
+import numpy as np
+
+from cache import load_storms, load_params
+from sensitivity import SAMPLE_PARAMS, sample_params, monthly_runoff, sensitivity
+from stats import monthly_weights
+from subcatch import Subcatchment
+
+
+class SensitivityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.storms = load_storms('csv/more_rain2.csv')
+        cls.weights = monthly_weights(cls.storms, 4, 10)
+        cls.sc = load_params('csv/hlc_sc_combined.csv')[0]
+
+    def srcs(self, sc):
+        params = sample_params(sc, 500, 0.25, 0)
+        averages = monthly_runoff(self.storms, self.weights, sc.area, params, chunk=200)
+        return sensitivity(params, averages)
+
+    def test_imperv(self):
+        srcs = self.srcs(self.sc)
+        self.assertEqual(srcs.shape, (7, len(SAMPLE_PARAMS)))
+        self.assertTrue(np.isfinite(srcs).all())
+        self.assertTrue((srcs[:6, 0] > 0.0).all())  # more impervious area is more runoff
+        self.assertEqual(srcs[6].tolist(), [0.0]*6)  # no storms in October
+
+    def test_zero_param(self):
+        # a parameter that is 0 isn't perturbed and has no sensitivity, the others are unaffected
+        sc = self.sc
+        zero = Subcatchment.from_values(sc.name, sc.area, sc.imperv, sc.depress_stor_perv, 0.0, sc.horton_init,
+                                        sc.horton_decay, sc.horton_final)
+        srcs = self.srcs(zero)
+        self.assertTrue(np.isfinite(srcs).all())
+        self.assertEqual(srcs[:, SAMPLE_PARAMS.index('depress_stor_imperv')].tolist(), [0.0]*7)
+        self.assertTrue((srcs[:6, 0] > 0.0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
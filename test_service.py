@@ -0,0 +1,72 @@
+"""
+Tests for service.py, run with: python -m unittest discover -p 'test_*.py'
+"""
+import json
+import threading
+import unittest
+import urllib2
+
+from cache import load_storms, load_params
+from my_cuhp import import_factors
+from service import RunoffService, Server
+
+
+class RunoffServiceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.service = RunoffService(load_storms('csv/more_rain2.csv'), load_params('csv/hlc_sc_combined.csv'),
+                                    import_factors('csv/adjust.csv'))
+
+    def query(self, *items, **request):
+        request['subcatchments'] = list(items)
+        return self.service.query(request)['subcatchments']
+
+    def test_same_name(self):
+        # every subcatchment gets its own runoff when a request has the same name twice, cached or not
+        for mode in ('lumped', 'stepped'):
+            self.service.cache.items.clear()
+            alone = self.query({'name': 'WQ129', 'imperv': 10}, mode=mode)
+            self.service.cache.items.clear()
+            both = self.query({'name': 'WQ129', 'imperv': 60}, {'name': 'WQ129', 'imperv': 10}, mode=mode)
+            again = self.query({'name': 'WQ129', 'imperv': 10}, mode=mode)
+            self.assertEqual(both[1], alone[0])
+            self.assertEqual(again, alone)
+            self.assertNotEqual(both[0]['monthly_average'], alone[0]['monthly_average'])
+
+    def test_check_each(self):
+        # low imperv is valid on its own, whatever else is in the request
+        self.assertEqual(self.query({'name': 'WQ129', 'imperv': 0.5})[0]['imperv'], 0.5)
+        self.assertEqual(len(self.query({'name': 'WQ129', 'imperv': 1}, {'name': 'WQ130'})), 2)
+        for item in ({'name': 'WQ129', 'horton_decay': 0}, {'name': 'WQ129', 'imperv': 101},
+                     {'name': 'WQ129', 'area': float('nan')}, {'name': 'WQ129', 'factor': float('inf')},
+                     {'name': 'new', 'area': 1}, {'name': 'WQ129', 'size': 1}):
+            self.assertRaises(ValueError, self.query, item)
+
+    def test_http(self):
+        server = Server(('localhost', 0), self.service, quiet=True)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        url = 'http://localhost:{}/runoff'.format(server.server_address[1])
+
+        def post(request):
+            try:
+                reply = urllib2.urlopen(url, json.dumps(request))
+                return reply.code, json.loads(reply.read())
+            except urllib2.HTTPError as e:
+                return e.code, json.loads(e.read())
+
+        try:
+            code, reply = post({'subcatchments': [{'name': 'WQ129'}]})
+            self.assertEqual(code, 200)
+            self.assertEqual(reply['subcatchments'][0]['name'], 'WQ129')
+            self.assertEqual(post({'subcatchments': [{'name': 'WQ129', 'area': 1e308}]})[0], 400)  # runoff is inf
+            self.assertEqual(post({'subcatchments': [{'name': 'WQ129', 'horton_decay': 0}]})[0], 400)
+            self.assertEqual(post([])[0], 400)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""
+Tests for stats.py, run with: python -m unittest discover -p 'test_*.py'
+"""
+import unittest
+import numpy as np
+
+from cache import load_storms, load_params
+from my_cuhp import BatchRunOff
+from stats import Stats, resample_counts
+
+
+class StatsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.results = BatchRunOff(load_storms('csv/more_rain2.csv'), load_params('csv/hlc_sc_combined.csv')[:5])
+        cls.stats = Stats(cls.results)
+
+    def test_runoff_objects(self):
+        # a BatchRunOff and its RunOff objects give the same averages
+        stats = Stats(list(self.results))
+        self.assertEqual(stats.subcatch_names, self.stats.subcatch_names)
+        self.assertEqual(stats.years, self.stats.years)
+        for name in stats.subcatch_names:
+            np.testing.assert_allclose(stats.averages[name], self.stats.averages[name], rtol=1e-12)
+
+    def test_resample_counts(self):
+        # every resample draws n years
+        for first, counts in resample_counts(7, 25, 10, 0):
+            self.assertEqual(counts.shape, (min(10, 25 - first), 7))
+            self.assertEqual(counts.sum(axis=1).tolist(), [7] * len(counts))
+
+    def test_bootstrap(self):
+        q = (2.5, 50, 97.5)
+        one = self.stats.bootstrap(q, replicates=500, batch=128, seed=3)
+        two = self.stats.bootstrap(q, replicates=500, batch=128, processes=2, seed=3)
+        for name in self.stats.subcatch_names:
+            np.testing.assert_array_equal(one[name], two[name])
+            low, middle, high = one[name]
+            average = np.array(self.stats.averages[name])
+            self.assertTrue((low <= average).all() and (average <= high).all())
+            self.assertTrue((low <= middle).all() and (middle <= high).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
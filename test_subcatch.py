@@ -0,0 +1,64 @@
+"""
+Tests for subcatch.py, run with: python -m unittest discover -p 'test_*.py'
+"""
+import os
+import tempfile
+import unittest
+
+from subcatch import load_param_table, import_params, export_params
+
+
+def write_params(text):
+    """
+    :param text: contents of a parameter file
+    :return: filename of a temporary parameter file, removed by the caller
+    """
+    handle, filename = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(handle, 'wt') as outfile:
+        outfile.write(text)
+    return filename
+
+
+class LoadParamsTest(unittest.TestCase):
+    def load(self, text):
+        filename = write_params(text)
+        try:
+            return load_param_table(filename)
+        finally:
+            os.remove(filename)
+
+    def test_header(self):
+        table = self.load('subcatch_id,area,imperv_percent,dsp,dsi,f0,k,fc\n'
+                          'a,0.1,50,0.35,0.1,3.0,0.0018,0.5\n')
+        self.assertEqual(table.name.tolist(), ['a'])
+        self.assertEqual(table.imperv.tolist(), [50.0])
+        self.assertEqual(table.horton_decay.tolist(), [0.0018])
+
+    def test_low_imperv(self):
+        # open space networks can be 1% impervious or less everywhere
+        table = self.load('name,area,imperv,dsp,dsi,f0,k,fc\n'
+                          'a,0.1,1,0.35,0.1,3.0,0.0018,0.5\n'
+                          'b,0.1,0.5,0.35,0.1,3.0,0.0018,0.5\n')
+        self.assertEqual(table.imperv.tolist(), [1.0, 0.5])
+
+    def test_out_of_range(self):
+        header = 'name,area,imperv,dsp,dsi,f0,k,fc\n'
+        for row in ('a,0,50,0.35,0.1,3.0,0.0018,0.5', 'a,0.1,150,0.35,0.1,3.0,0.0018,0.5',
+                    'a,0.1,50,-1,0.1,3.0,0.0018,0.5', 'a,0.1,50,0.35,0.1,0.4,0.0018,0.5',
+                    'a,0.1,50,0.35,0.1,3.0,0,0.5', 'a,0.1,50,0.35,0.1,3.0,6.5,0.5', 'a,0.1,x,0.35,0.1,3.0,0.0018,0.5'):
+            self.assertRaises(ValueError, self.load, header + row + '\n')
+
+    def test_export_round_trip(self):
+        subcatches = import_params('csv/hlc_subcatch.csv', keep_fields=True)
+        handle, filename = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        try:
+            export_params(subcatches, filename)
+            again = import_params(filename)
+        finally:
+            os.remove(filename)
+        self.assertEqual([str(sc) for sc in again], [str(sc) for sc in subcatches])
+
+
+if __name__ == '__main__':
+    unittest.main()
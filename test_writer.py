@@ -0,0 +1,58 @@
+"""
+Tests for writer.py, run with: python -m unittest discover -p 'test_*.py'
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+import numpy as np
+
+from cache import load_storms, load_params
+from my_cuhp import BatchRunOff, RunOff
+from writer import COLUMNS, write_csv, write_binary, read_binary
+
+
+class WriterTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.results = BatchRunOff(load_storms('csv/more_rain2.csv'), load_params('csv/hlc_sc_combined.csv'))
+        cls.folder = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+    def test_csv(self):
+        # same as printing every RunOff
+        outfile = StringIO()
+        rows = write_csv(self.results, outfile, header=False)
+        expected = [str(RunOff(storm, sc)) for sc in self.results.subcatches for storm in self.results.storms]
+        self.assertEqual(rows, len(expected))
+        self.assertEqual(outfile.getvalue().splitlines(), expected)
+
+    def test_binary(self):
+        filename = os.path.join(self.folder, 'out.bin')
+        write_binary(self.results, filename)
+        columns, arrays = read_binary(filename)
+        self.assertEqual(columns, COLUMNS)
+        self.assertEqual(sorted(arrays), sorted(COLUMNS))
+        results = self.results
+        self.assertEqual(arrays['subcatch_id'].tolist(), [sc.name for sc in results.subcatches])
+        self.assertEqual(arrays['storm_id'].tolist(), [storm.id for storm in results.storms])
+        self.assertEqual(arrays['total_rain'].tolist(), results.storms.total_rain.tolist())
+        self.assertEqual(arrays['time'].tolist(), results.storms.length.tolist())
+        np.testing.assert_array_equal(arrays['runoff'], results.runoff)
+        np.testing.assert_array_equal(arrays['infil'], results.infil)
+
+    def test_binary_columns(self):
+        filename = os.path.join(self.folder, 'some.bin')
+        write_binary(self.results, filename, ['storm_id', 'runoff'])
+        columns, arrays = read_binary(filename)
+        self.assertEqual(columns, ['storm_id', 'runoff'])
+        self.assertEqual(arrays['storm_id'][0], self.results.storms[0].id)
+        self.assertRaises(ValueError, write_binary, self.results, filename, ['storm'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Lumped runoff (see BatchRunOff) that skips hortons infiltration for storm/subcatchment pairs that can't have pervious
+runoff.
+
+Pervious volume is zero unless a storm's total rain is above the pervious depression storage plus infiltration, and
+infiltration is never negative, so storms with total rain at or below the pervious depression storage have no pervious
+runoff. Most storms are like this. Storms are sorted by total rain (then length) once, and a binary search finds the
+storms above the smallest pervious depression storage of the subcatchments. Infiltration and pervious volume are only
+calculated for those storms, and pairs with pervious runoff are kept as sparse (coordinate) arrays. Values are the
+same as BatchRunOff's, bit for bit.
+"""
+import time
+import numpy as np
+
+from instrument import stage, count
+import instrument
+from my_cuhp import BatchRunOff, RunOff, sc_areas, sc_column, import_factors
+
+
+class ThresholdIndex(object):
+    def __init__(self, storms):
+        """
+        Storms sorted by total rain, then length. Build once and reuse for any number of subcatchments
+        :param storms: StormTable object
+        """
+        self.storms = storms
+        self.order = np.lexsort((storms.length, storms.total_rain))  # storm indexes, least rain first
+        self.rain = storms.total_rain[self.order]
+
+    def first_above(self, depth):
+        """
+        :param depth: rain depth or array of depths (inches)
+        :return: position in order of the first storm with total rain above depth
+        """
+        return np.searchsorted(self.rain, depth, side='right')
+
+    def storms_above(self, depth):
+        """
+        :param depth: rain depth (inches)
+        :return: array of indexes of storms with total rain above depth, in storm order
+        """
+        return np.sort(self.order[self.first_above(depth):])
+
+
+class ThresholdRunOff(BatchRunOff):
+    def __init__(self, storms, subcatches, index=None):
+        """
+        Same as BatchRunOff, but hortons infiltration and pervious volume are only calculated for storms above the
+        smallest pervious depression storage. Pairs with pervious runoff are kept as sparse arrays: perv_rows and
+        perv_cols are the subcatchment and storm index of each pair, ordered by subcatchment then storm, and perv_vol is
+        their pervious volume. infil is only calculated for every pair when asked for
+        :param storms: StormTable object
+        :param subcatches: list of Subcatchment objects
+        :param index: ThresholdIndex object for storms, pass one in to reuse it
+        """
+        self.storms = storms
+        self.subcatches = subcatches
+        self._infil = None
+        if index is None:
+            index = ThresholdIndex(storms)
+
+        with stage('runoff_threshold', len(storms) * len(subcatches)):
+            self.area_acre, self.imp_area, self.perv_area = sc_areas(subcatches)
+
+            # Impervious volume for every pair, most storms are above dsi and it's cheap
+            dsi = sc_column(subcatches, 'depress_stor_imperv')
+            self.imp_vol = self.imp_area * (storms.total_rain - dsi) / 12.0  # ac-ft
+            imp_clipped = self.imp_vol < 0.0
+            self.imp_vol[imp_clipped] = 0.0
+
+            # Pervious volume only for storms above the smallest dsp, same equations as lumped_volumes(). Storms at
+            # or below a subcatchment's own dsp get a volume <= 0 and are dropped
+            dsp = sc_column(subcatches, 'depress_stor_perv')
+            cols = index.storms_above(dsp.min()) if len(subcatches) else np.empty(0, dtype=int)
+            candidates = len(subcatches) * len(cols)
+            infil = RunOff.infiltration(sc_column(subcatches, 'horton_init'), sc_column(subcatches, 'horton_decay'),
+                                        sc_column(subcatches, 'horton_final'), storms.length[cols])  # inches
+            per_vol = self.perv_area * (storms.total_rain[cols] - dsp - infil) / 12.0  # ac-ft
+            rows, keep = np.nonzero(per_vol > 0.0)
+            self.perv_rows, self.perv_cols, self.perv_vol = rows, cols[keep], per_vol[rows, keep]
+            self.per_vol = np.zeros(self.imp_vol.shape)
+            self.per_vol[self.perv_rows, self.perv_cols] = self.perv_vol
+
+            # Total runoff
+            self.runoff = self.imp_vol + self.per_vol  # ac-ft
+        count('perv_pairs_skipped', self.runoff.size - candidates)
+        if instrument.enabled:
+            # skipped pairs have pervious volume <= 0 and are clipped the same as lumped_volumes()
+            count('imp_vol_clipped', np.count_nonzero(imp_clipped))
+            count('per_vol_clipped', self.runoff.size - candidates + np.count_nonzero(per_vol < 0.0))
+        self._count()
+
+    @property
+    def infil(self):
+        """ infiltration (inches) for every pair, same as BatchRunOff.infil """
+        if self._infil is None:
+            self._infil = RunOff.infiltration(sc_column(self.subcatches, 'horton_init'),
+                                              sc_column(self.subcatches, 'horton_decay'),
+                                              sc_column(self.subcatches, 'horton_final'), self.storms.length)
+        return self._infil
+
+
+def main():
+    from cache import load_storms, load_params
+
+    storms = load_storms('csv/more_rain2.csv')
+    subcatches = load_params('csv/hlc_sc_combined.csv')
+    factors = import_factors('csv/adjust.csv')
+
+    start = time.time()
+    dense = BatchRunOff(storms, subcatches)
+    dense.adjust(factors)
+    dense_time = time.time() - start
+
+    start = time.time()
+    threshold = ThresholdRunOff(storms, subcatches)
+    threshold.adjust(factors)
+    threshold_time = time.time() - start
+
+    print len(threshold.perv_vol), 'of', dense.runoff.size, 'subcatchment/storm pairs have pervious runoff'
+    print 'lumped: {:.4f} s, threshold: {:.4f} s'.format(dense_time, threshold_time)
+    print 'same results:', all(np.array_equal(getattr(threshold, name), getattr(dense, name))
+                               for name in ('imp_vol', 'infil', 'per_vol', 'runoff'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Write runoff results (BatchRunOff objects) to csv or a binary column file without creating RunOff objects.
+
+csv output is written in large blocks and matches printing every RunOff (see RunOff.__str__()). The binary format is
+an array file (see cache.save_arrays()): subcatchment columns have one value per subcatchment, storm columns one value
+per storm and runoff columns are (subcatchments, storms) arrays. Rows are ordered by subcatchment, then storm. Every
+column is stored under its own name, storm_id as the ids written in the csv (see RainEvent.id).
+"""
+from itertools import chain, repeat
+import numpy as np
+
+from cache import save_arrays, load_arrays
+from instrument import stage
+from my_cuhp import RunOff
+from rain import RainEvent
+from subcatch import Subcatchment
+
+# Column names, and labels as they appear in the csv header
+LABELS = (Subcatchment.header() + ',' + RainEvent.header() + ',' + RunOff.header()).split(',')
+COLUMNS = [label.strip() for label in LABELS]
+
+# Subcatchment attribute for each subcatchment column
+SC_COLUMNS = dict(zip(COLUMNS[:8], ['name', 'area', 'imperv', 'depress_stor_perv', 'depress_stor_imperv',
+                                    'horton_init', 'horton_decay', 'horton_final']))
+STORM_COLUMNS = COLUMNS[8:13]
+AREA_COLUMNS = COLUMNS[13:16]  # one value per subcatchment
+RUNOFF_COLUMNS = COLUMNS[16:]  # one value per subcatchment and storm
+
+BLOCK_ROWS = 100000  # approximate number of csv rows written at once
+
+
+def storm_strings(storms):
+    """
+    :param storms: StormTable object
+    :return: dict of lists of csv strings for each storm column, same as RainEvent.__str__()
+    """
+    events = list(storms)
+    return {'storm_id': [storm.id for storm in events],
+            'month': [str(month) for month in storms.month.tolist()],
+            'year': [str(year) for year in storms.year.tolist()],
+            'total_rain': [str(rain) for rain in storms.total_rain.tolist()],
+            'time': [str(storm.length) for storm in events]}
+
+
+def check_columns(columns):
+    """
+    :param columns: list of column names or None for all columns
+    :return: list of column names
+    """
+    if columns is None:
+        return list(COLUMNS)
+    unknown = [column for column in columns if column not in COLUMNS]
+    if unknown:
+        raise ValueError('unknown columns: ' + ', '.join(unknown))
+    return list(columns)
+
+
+def write_csv(results, outfile, columns=None, header=True):
+    """
+    Write results to csv
+    :param results: BatchRunOff object or iterable of BatchRunOff objects (e.g. from my_cuhp.iter_runoff())
+    :param outfile: open file to write to
+    :param columns: list of columns to write, default is all (COLUMNS)
+    :param header: write header line
+    :return: number of rows written
+    """
+    columns = check_columns(columns)
+    if header:
+        outfile.write(','.join(LABELS[COLUMNS.index(column)] for column in columns) + '\n')
+    if hasattr(results, 'runoff'):
+        results = [results]
+
+    with stage('write_csv') as s:
+        rows = 0
+        for batch in results:
+            n_sc, n_storms = batch.runoff.shape
+            storm_values = storm_strings(batch.storms) if set(columns) & set(STORM_COLUMNS) else {}
+            sc_values = {}
+            for column in columns:
+                if column in SC_COLUMNS:
+                    sc_values[column] = [str(getattr(sc, SC_COLUMNS[column])) for sc in batch.subcatches]
+                elif column in AREA_COLUMNS:
+                    sc_values[column] = [str(value) for value in getattr(batch, column).ravel().tolist()]
+
+            step = max(BLOCK_ROWS // max(n_storms, 1), 1)  # subcatchments per block
+            for first in range(0, n_sc, step):
+                last = min(first + step, n_sc)
+                values = []
+                for column in columns:
+                    if column in sc_values:
+                        values.append(chain.from_iterable(repeat(value, n_storms)
+                                                          for value in sc_values[column][first:last]))
+                    elif column in storm_values:
+                        values.append(storm_values[column] * (last - first))
+                    else:
+                        values.append([str(value) for value in getattr(batch, column)[first:last].ravel().tolist()])
+                block = [','.join(row) for row in zip(*values)]
+                if block:
+                    outfile.write('\n'.join(block) + '\n')
+                rows += len(block)
+        s.rows = rows
+    return rows
+
+
+def write_binary(results, filename, columns=None):
+    """
+    Write results to binary column file
+    :param results: BatchRunOff object
+    :param filename: name of file to write
+    :param columns: list of columns to write, default is all (COLUMNS)
+    """
+    columns = check_columns(columns)
+    storms = results.storms
+    arrays = []
+    for column in columns:
+        if column == 'subcatch_id':
+            arrays.append((column, np.array([sc.name for sc in results.subcatches], dtype=str)))
+        elif column in SC_COLUMNS:
+            arrays.append((column, np.array([getattr(sc, SC_COLUMNS[column]) for sc in results.subcatches])))
+        elif column == 'storm_id':
+            arrays.append((column, np.array([storm.id for storm in storms], dtype=str)))
+        elif column == 'time':
+            arrays.append((column, storms.length))
+        elif column in STORM_COLUMNS:
+            arrays.append((column, getattr(storms, column)))
+        elif column in AREA_COLUMNS:
+            arrays.append((column, getattr(results, column).ravel()))
+        else:
+            arrays.append((column, getattr(results, column)))
+    with stage('write_binary', results.runoff.size):
+        save_arrays(filename, arrays, {'columns': columns, 'shape': list(results.runoff.shape)})
+
+
+def read_binary(filename):
+    """
+    Read binary column file written by write_binary(). Arrays are memory mapped
+    :param filename: name of file to read
+    :return: list of column names, dict of arrays
+    """
+    meta, arrays = load_arrays(filename)
+    return [str(column) for column in meta['columns']], arrays